@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Purpose: compare the speed of gzip decompression backends for computing volume statistics.
+# Usage: ./bench_decompress.py [--repeat N] [FILE.nii.gz|FILE.mgz ...]
+#
+# Without arguments, representative FreeSurfer and MALP-EM outputs are generated in a temporary directory.
+
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from visualdataset.decompress import available_backends
+from visualdataset.volume_sidecar import SidecarOptions, compute_settings
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark gzip decompression backends')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per file and backend')
+    parser.add_argument('--threads', type=int, default=0, help='decompression threads')
+    parser.add_argument('files', nargs='*', type=Path)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = args.files or generate_examples(Path(tmp))
+        backends = available_backends()
+        print(f'{"file":40s} ' + ' '.join(f'{b:>10s}' for b in backends) + '   speedup')
+        for file in files:
+            times = [time_backend(file, b, args.threads, args.repeat) for b in backends]
+            gzip_time = times[backends.index('gzip')]
+            cells = ' '.join(f'{t * 1000:8.1f}ms' for t in times)
+            print(f'{file.name:40s} {cells}   {gzip_time / min(times):6.2f}x')
+
+
+def time_backend(file: Path, backend: str, threads: int, repeat: int) -> float:
+    options = SidecarOptions(decompression=backend, decompression_threads=threads)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compute_settings(file, options)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def generate_examples(directory: Path) -> list[Path]:
+    """
+    Create volumes which look like FreeSurfer and MALP-EM outputs: smooth, mostly-background intensities and labels.
+    """
+    rng = np.random.default_rng(0)
+    x, y, z = np.mgrid[-1:1:256j, -1:1:256j, -1:1:256j]
+    radius = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+    head = np.where(radius < 0.8, 110 - 40 * radius, 0)
+    t1 = np.clip(head + rng.normal(0, 3, head.shape), 0, 255).astype(np.uint8)
+    labels = np.where(radius < 0.8, np.digitize(radius, np.linspace(0, 0.8, 40)), 0).astype(np.int32)
+
+    examples = {
+        'T1.mgz': nib.MGHImage(t1, np.eye(4)),
+        'aparc+aseg.mgz': nib.MGHImage(labels, np.eye(4)),
+        'subject_N4.nii.gz': nib.Nifti1Image((head * 10).astype(np.int16), np.eye(4)),
+        'subject_MALPEM.nii.gz': nib.Nifti1Image(labels.astype(np.uint8), np.eye(4)),
+    }
+    paths = []
+    for name, img in examples.items():
+        nib.save(img, directory / name)
+        paths.append(directory / name)
+    return paths
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Purpose: check that assembling the manifest from an index scales like n log n, i.e. that there is no
+#          quadratic step left in aggregating tags, finding the first run files and sorting.
+# Usage: ./bench_manifest.py [--sizes 10000,100000,1000000] [--first-run N] [--tolerance X]
+#
+# Indexes are synthetic, modeled after FreeSurfer outputs of many subjects and shuffled. Time per n log n
+# of the largest index must be within --tolerance times of the smallest index's, otherwise exit status is 1.
+
+import math
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path, PurePath
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from visualdataset.brain_dataset import aggregate_tags, find_first_run_files
+from visualdataset.manifest import VisualDatasetFile, VisualDatasetManifest
+
+_NAMES = ['T1', 'brainmask', 'wmparc', 'aparc.a2009s+aseg', 'aparc.DKTatlas+aseg.deep', 'orig', 'norm', 'aseg']
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark assembling the manifest from an index')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma-separated numbers of files')
+    parser.add_argument('--first-run', type=int, default=100, help='number of first run files')
+    parser.add_argument('--tolerance', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    per_nlogn = []
+    for n in map(int, args.sizes.split(',')):
+        index = generate_index(rng, n)
+        first_run = [str(f.path) for f in rng.sample(index, min(args.first_run, n))]
+
+        start = time.perf_counter()
+        manifest = VisualDatasetManifest(
+            tags=aggregate_tags(index),
+            files=index,
+            options=[],
+            first_run_files=find_first_run_files(index, first_run)
+        ).sort()
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        manifest.model_dump_json()
+        dump = time.perf_counter() - start
+
+        per_nlogn.append(elapsed / (n * math.log2(n)))
+        print(f'{n:9d} files  assembly {elapsed:7.2f}s  ({per_nlogn[-1] * 1e9:6.1f} ns per n log n)  '
+              f'serialization {dump:7.2f}s')
+
+    ratio = per_nlogn[-1] / per_nlogn[0]
+    print(f'time per n log n grew {ratio:.2f}x from the smallest to the largest index')
+    if ratio > args.tolerance:
+        print(f'Error: more than {args.tolerance}x, assembly does not scale like n log n')
+        sys.exit(1)
+
+
+def generate_index(rng: random.Random, n: int) -> list[VisualDatasetFile]:
+    index = []
+    subject = 0
+    while len(index) < n:
+        for name in _NAMES:
+            tags = {'subject': f'sub-{subject:07d}', 'type': name, 'site': f'site{subject % 50}'}
+            index.append(VisualDatasetFile(path=PurePath(f'sub-{subject:07d}/mri/{name}.mgz'), tags=tags))
+        subject += 1
+    del index[n:]
+    rng.shuffle(index)
+    return index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Purpose: compare the size and parse time of the usual manifest JSON and of the compact manifest format.
+# Usage: ./bench_manifest_format.py [--files N] [--repeat N]
+#
+# The manifest is synthetic, made like in bench_manifest.py. Parse times are measured both with the json
+# module, which is about what a browser does, and with the pydantic models.
+
+import gzip
+import json
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_manifest import generate_index
+from visualdataset.brain_dataset import aggregate_tags
+from visualdataset.manifest import VisualDatasetManifest, CompactManifest
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the compact manifest format')
+    parser.add_argument('--files', type=int, default=150_000, help='number of files')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to parse, the best time is shown')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    index = generate_index(random.Random(args.seed), args.files)
+    manifest = VisualDatasetManifest(tags=aggregate_tags(index), files=index, options=[], first_run_files=[0])
+    manifest = manifest.sort()
+    usual = manifest.model_dump_json()
+    compact = manifest.compact().model_dump_json()
+    if CompactManifest.model_validate_json(compact).expand() != manifest:
+        print('Error: compact manifest does not round-trip')
+        sys.exit(1)
+
+    print(f'{args.files} files')
+    print(f'{"":10}{"size":>12}{"gzip size":>12}{"json.loads":>12}{"pydantic":>12}')
+    for name, text, model in [('usual', usual, VisualDatasetManifest), ('compact', compact, CompactManifest)]:
+        data = text.encode()
+        size = len(data) / 2 ** 20
+        gzip_size = len(gzip.compress(data, 6)) / 2 ** 20
+        loads = best_time(lambda: json.loads(text), args.repeat)
+        validate = best_time(lambda: model.model_validate_json(text), args.repeat)
+        print(f'{name:10}{size:10.1f}MB{gzip_size:10.1f}MB{loads:11.3f}s{validate:11.3f}s')
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    main()
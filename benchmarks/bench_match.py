@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Purpose: compare the speed of matching paths with match_file (every matcher's regex against every path)
+#          and with CompiledMatchers.
+# Usage: ./bench_match.py [--paths N] [--matchers N] [--baseline-sample N]
+#
+# Paths and matchers are synthetic, modeled after FreeSurfer outputs of many subjects: most matchers
+# come in pairs with the same regex (e.g. "type" and "name" of a structure), and a few are not guarded
+# by any literal. match_file is slow, so it is timed on a sample of the paths and its time is extrapolated.
+
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path, PurePath
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from visualdataset.args_types import Matcher
+from visualdataset.index_brain_dir import match_file
+from visualdataset.matcher_engine import CompiledMatchers
+from visualdataset.wellknown import FREESURFER_MATCHERS
+
+_EXTENSIONS = ('mgz', 'nii', 'nii.gz')
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark matching paths against matchers')
+    parser.add_argument('--paths', type=int, default=1_000_000, help='number of paths')
+    parser.add_argument('--matchers', type=int, default=500, help='number of matchers')
+    parser.add_argument('--baseline-sample', type=int, default=10_000,
+                        help='number of paths to time match_file with')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    matchers = generate_matchers(args.matchers)
+    paths = generate_paths(rng, args.paths, args.matchers)
+    print(f'{len(paths)} paths, {len(matchers)} matchers, {len({m.regex for m in matchers})} distinct regexes')
+
+    sample = rng.sample(paths, min(args.baseline_sample, len(paths)))
+    start = time.perf_counter()
+    expected = [match_file(PurePath(p), matchers).tags for p in sample]
+    baseline = (time.perf_counter() - start) / len(sample) * len(paths)
+    print(f'match_file        {baseline:9.1f}s (extrapolated from {len(sample)} paths)')
+
+    start = time.perf_counter()
+    compiled = CompiledMatchers(matchers)
+    matched = sum(1 for p in paths if compiled.match(p))
+    elapsed = time.perf_counter() - start
+    print(f'CompiledMatchers  {elapsed:9.1f}s {baseline / elapsed:8.1f}x  ({matched} paths have tags)')
+
+    check = CompiledMatchers(matchers)
+    if [check.match(p) for p in sample] != expected:
+        print('Error: CompiledMatchers and match_file disagree')
+        sys.exit(1)
+
+
+def generate_matchers(n: int) -> list[Matcher]:
+    matchers = list(FREESURFER_MATCHERS)
+    unguarded = [
+        Matcher(key='space', value='MNI', regex=r'(?i)mni152'),
+        Matcher(key='session', value='baseline', regex=r'^[^/]+/(ses-)?(bl|baseline)/'),
+    ]
+    i = 0
+    while len(matchers) < n - len(unguarded):
+        regex = rf'mri/structure{i}\.(mgz|nii|nii\.gz)$'
+        matchers.append(Matcher(key='type', value='labels', regex=regex))
+        matchers.append(Matcher(key='name', value=f'Structure {i}', regex=regex))
+        matchers.append(Matcher(key='site', value=f'Site {i}', regex=rf'^site{i}_'))
+        i += 1
+    return (matchers + unguarded)[:n]
+
+
+def generate_paths(rng: random.Random, n: int, structures: int) -> list[str]:
+    names = ['T1', 'brainmask', 'wmparc', 'aparc.a2009s+aseg', 'aparc.DKTatlas+aseg.deep', 'orig', 'norm']
+    names += [f'structure{i}' for i in range(structures // 3)]
+    names += [f'unmatched{i}' for i in range(structures // 3)]
+    paths = []
+    subject = 0
+    while len(paths) < n:
+        prefix = f'site{rng.randrange(structures // 3)}_sub-{subject:06d}'
+        for name in rng.sample(names, min(len(names), 40)):
+            paths.append(f'{prefix}/mri/{name}.{rng.choice(_EXTENSIONS)}')
+        subject += 1
+    return paths[:n]
+
+
+if __name__ == '__main__':
+    main()
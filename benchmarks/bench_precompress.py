@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Purpose: report how much --precompress reduces the size of each type of output, and how long it takes.
+# Usage: ./bench_precompress.py [--files N] [--levels 1,6,9]
+#
+# Artifacts: a manifest of N synthetic files (made like in bench_manifest.py), the FreeSurfer colormap, and
+# sidecars of a synthetic T1 volume (with a histogram) and of a synthetic segmentation (with label statistics).
+# zstd is only measured if zstandard is installed.
+
+import importlib.resources
+import importlib.util
+import random
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import nibabel as nib
+import numpy as np
+
+from bench_manifest import generate_index
+from visualdataset.brain_dataset import aggregate_tags
+from visualdataset.manifest import VisualDatasetManifest
+from visualdataset.precompress import _compress
+from visualdataset.volume_sidecar import create_sidecar, SidecarOptions
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark precompression of outputs')
+    parser.add_argument('--files', type=int, default=150_000, help='number of files in the manifest')
+    parser.add_argument('--levels', default='1,6,9', help='comma-separated gzip levels')
+    parser.add_argument('--zstd-levels', default='3,10,19', help='comma-separated zstd levels')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    encodings = [('gzip', int(level)) for level in args.levels.split(',')]
+    if importlib.util.find_spec('zstandard') is not None:
+        encodings += [('zstd', int(level)) for level in args.zstd_levels.split(',')]
+    else:
+        print('zstandard is not installed, only measuring gzip')
+
+    artifacts = {'manifest': manifest(args.files, args.seed), 'colormap': colormap()}
+    with tempfile.TemporaryDirectory() as tmp:
+        artifacts.update(sidecars(Path(tmp)))
+
+    print(f'{"artifact":20}{"size":>12}' + ''.join(f'{f"{e} {lv}":>22}' for e, lv in encodings))
+    for name, data in artifacts.items():
+        row = f'{name:20}{len(data) / 1024:10.1f}kB'
+        for encoding, level in encodings:
+            start = time.perf_counter()
+            compressed = _compress(data, encoding, level)
+            elapsed = time.perf_counter() - start
+            row += f'{len(data) / len(compressed):8.1f}x {elapsed * 1000:9.2f}ms'
+        print(row)
+
+
+def manifest(n: int, seed: int) -> bytes:
+    index = generate_index(random.Random(seed), n)
+    m = VisualDatasetManifest(tags=aggregate_tags(index), files=index, options=[], first_run_files=[0])
+    return m.sort().model_dump_json().encode()
+
+
+def colormap() -> bytes:
+    return (importlib.resources.files('visualdataset.colormaps') / 'FreeSurferColorLUT.v7.3.3.json').read_bytes()
+
+
+def sidecars(tmp: Path) -> dict[str, bytes]:
+    rng = np.random.default_rng(0)
+    t1 = tmp / 'T1.nii.gz'
+    nib.save(nib.Nifti1Image(rng.normal(100, 30, (64, 64, 64)).astype(np.float32), np.eye(4)), t1)
+    labels = rng.choice(np.array([0, 2, 4, 41, 43, *range(1000, 1036), *range(2000, 2036)], dtype=np.int32),
+                        (64, 64, 64))
+    aseg = tmp / 'aseg.nii.gz'
+    nib.save(nib.Nifti1Image(labels, np.eye(4)), aseg)
+    options = SidecarOptions(histogram_bins=128, cal_percentiles=(0.5, 99.5))
+    create_sidecar(t1, tmp / 'T1.json', options)
+    create_sidecar(aseg, tmp / 'aseg.json', options, is_label=True)
+    return {
+        'sidecar (histogram)': (tmp / 'T1.json').read_bytes(),
+        'sidecar (labels)': (tmp / 'aseg.json').read_bytes()
+    }
+
+
+if __name__ == '__main__':
+    main()
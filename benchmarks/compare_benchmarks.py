@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Purpose: compare two results of run_benchmarks.py, e.g. of two commits, and fail on regressions.
+# Usage: ./compare_benchmarks.py [--threshold X] BASE NEW
+#
+# BASE and NEW are paths of results files or names of results in results/. Exit status is 1 if a benchmark
+# of NEW took more than --threshold times as long as in BASE. The stages of the end-to-end benchmark are
+# shown, but they are not checked because they are too short to be measured reliably on small datasets.
+
+import json
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+from run_benchmarks import RESULTS_DIR, RESULTS_VERSION
+
+
+def main():
+    parser = ArgumentParser(description='Compare two results of run_benchmarks.py')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio of times (NEW / BASE) above which a benchmark regressed')
+    parser.add_argument('base', type=str)
+    parser.add_argument('new', type=str)
+    args = parser.parse_args()
+
+    base = load_results(args.base)
+    new = load_results(args.new)
+    for key in ('dataset', 'repeat', 'jobs', 'platform', 'cpus'):
+        if base[key] != new[key]:
+            print(f'Warning: "{key}" differs, results may not be comparable: {base[key]} vs. {new[key]}')
+
+    print(f'{"benchmark":24s} {base["name"]:>14s} {new["name"]:>14s} {"ratio":>8s}')
+    regressed = []
+    for benchmark, new_result in new['benchmarks'].items():
+        if (base_result := base['benchmarks'].get(benchmark)) is None:
+            continue
+        ratio = new_result['seconds'] / base_result['seconds']
+        flag = ''
+        if ratio > args.threshold:
+            regressed.append(benchmark)
+            flag = '  REGRESSED'
+        print(f'{benchmark:24s} {_ms(base_result["seconds"])} {_ms(new_result["seconds"])} {ratio:7.2f}x{flag}')
+        base_stages = base_result.get('stages', {})
+        for stage, seconds in new_result.get('stages', {}).items():
+            if stage in base_stages:
+                print(f'  {stage:22s} {_ms(base_stages[stage])} {_ms(seconds)} {seconds / base_stages[stage]:7.2f}x')
+
+    if regressed:
+        print(f'Regressed by more than {args.threshold}x: {", ".join(regressed)}')
+        sys.exit(1)
+
+
+def load_results(name: str) -> dict:
+    path = Path(name)
+    if not path.is_file():
+        path = RESULTS_DIR / f'{name}.json'
+    try:
+        results = json.loads(path.read_text())
+    except FileNotFoundError:
+        print(f'Error: no results named {name}')
+        sys.exit(1)
+    if results.get('version') != RESULTS_VERSION:
+        print(f'Error: {path} was saved by another version of run_benchmarks.py')
+        sys.exit(1)
+    return results
+
+
+def _ms(seconds: float) -> str:
+    return f'{seconds * 1000:12.1f}ms'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# Purpose: generate a deterministic input directory which looks like the outputs of FreeSurfer or MALP-EM
+#          of many subjects, to benchmark the plugin on (see run_benchmarks.py).
+# Usage: ./generate_dataset.py [--layout freesurfer|malpem] [--subjects N] [--shape X,Y,Z] [--dtype uint8]
+#                              [--format mgz|nii|nii.gz] [--compress-level 1-9] [--depth N] [--seed N] DIR
+#
+# The same arguments always generate the same files, byte for byte. Volumes are a noisy head-like sphere
+# (intensities) or concentric shells of labels, shifted for every subject. Non-volume files (surfaces, stats,
+# logs) are created empty, so that scanning sees a realistic number of directory entries.
+
+import gzip
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Iterator, Literal, NamedTuple
+
+import nibabel as nib
+import numpy as np
+from nibabel.spatialimages import SpatialImage
+
+Layout = Literal['freesurfer', 'malpem']
+
+_FREESURFER_VOLUMES = {
+    'T1': 'intensity',
+    'brainmask': 'intensity',
+    'norm': 'intensity',
+    'wm': 'intensity',
+    'orig/001': 'intensity',
+    'aseg': 'labels',
+    'wmparc': 'labels',
+    'aparc.a2009s+aseg': 'labels',
+    'aparc.DKTatlas+aseg.deep': 'labels',
+}
+"""
+Volumes of the ``mri`` directory of a subject, some of which are not matched by ``--mode freesurfer-7.3.3``.
+"""
+
+_FREESURFER_OTHER_FILES = {
+    'mri/transforms': ['talairach.xfm', 'talairach.lta'],
+    'surf': [f'{h}.{s}' for h in ('lh', 'rh') for s in ('white', 'pial', 'inflated', 'sphere', 'thickness')],
+    'label': [f'{h}.{s}.label' for h in ('lh', 'rh') for s in ('BA1', 'BA2', 'cortex', 'V1')],
+    'stats': ['aseg.stats', 'lh.aparc.stats', 'rh.aparc.stats'],
+    'scripts': ['recon-all.log', 'recon-all.done'],
+}
+
+_FREESURFER_LABELS = np.array([0, 2, 4, 10, 11, 12, 13, 17, 18, 41, 43, 49, 50, 51, 52, 53, 54, 1002, 1003, 1005,
+                               1006, 1007, 1008, 1009, 1010, 2002, 2003, 2005, 2006, 2007, 2008, 2009, 2010])
+
+_MALPEM_VOLUMES = {
+    'N4': 'intensity',
+    'N4_masked': 'intensity',
+    'MALPEM': 'labels',
+    'MALPEM_tissues': 'tissues',
+}
+
+_MALPEM_OTHER_FILES = ['Report.pdf', 'MALPEM_Report.csv', 'MALPEM_tissues_Report.csv']
+
+
+class DatasetSpec(NamedTuple):
+    layout: Layout = 'freesurfer'
+    subjects: int = 10
+    shape: tuple[int, int, int] = (64, 64, 64)
+    dtype: str = 'uint8'
+    """
+    Data type of intensity volumes. Label volumes are int32 (FreeSurfer) or uint8 (MALP-EM).
+    """
+    format: str = 'mgz'
+    """
+    File extension of volumes: ``mgz``, ``nii`` or ``nii.gz``. MALP-EM outputs are always ``nii.gz``.
+    """
+    compress_level: int = 1
+    """
+    gzip compression level of ``mgz`` and ``nii.gz`` volumes.
+    """
+    depth: int = 0
+    """
+    Number of directory levels above subject directories, e.g. ``site-0/group-1/sub-00012`` for 2.
+    """
+    seed: int = 0
+
+
+def main():
+    parser = ArgumentParser(description='Generate a FreeSurfer-like or MALP-EM-like input directory')
+    add_arguments(parser)
+    parser.add_argument('dir', type=Path)
+    args = parser.parse_args()
+    spec = spec_of(args)
+    count = generate_dataset(args.dir, spec)
+    print(f'{count} volumes written to {args.dir}')
+
+
+def add_arguments(parser: ArgumentParser):
+    parser.add_argument('--layout', choices=['freesurfer', 'malpem'], default='freesurfer')
+    parser.add_argument('--subjects', type=int, default=10)
+    parser.add_argument('--shape', type=str, default='64,64,64', help='comma-separated volume shape')
+    parser.add_argument('--dtype', type=str, default='uint8', help='data type of intensity volumes')
+    parser.add_argument('--format', choices=['mgz', 'nii', 'nii.gz'], default='mgz',
+                        help='file extension of FreeSurfer volumes')
+    parser.add_argument('--compress-level', type=int, default=1, help='gzip compression level of volumes')
+    parser.add_argument('--depth', type=int, default=0, help='directory levels above subject directories')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def spec_of(args) -> DatasetSpec:
+    shape = tuple(int(n) for n in args.shape.split(','))
+    if len(shape) != 3:
+        print(f'Invalid value for --shape: {args.shape}')
+        sys.exit(1)
+    return DatasetSpec(
+        layout=args.layout,
+        subjects=args.subjects,
+        shape=shape,
+        dtype=args.dtype,
+        format='nii.gz' if args.layout == 'malpem' else args.format,
+        compress_level=args.compress_level,
+        depth=args.depth,
+        seed=args.seed
+    )
+
+
+def generate_dataset(root: Path, spec: DatasetSpec) -> int:
+    """
+    :return: number of volumes written
+    """
+    rng = np.random.default_rng(spec.seed)
+    radius = _radius(spec.shape)
+    intensity = np.where(radius < 0.8, 110 - 40 * radius, 0) + rng.normal(0, 3, spec.shape)
+    shells = np.where(radius < 0.8, np.digitize(radius, np.linspace(0, 0.8, 40)), 0)
+    intensity = np.clip(intensity, *_dtype_range(spec.dtype)).astype(spec.dtype)
+    kinds = {
+        'intensity': intensity,
+        'labels': _FREESURFER_LABELS[shells % len(_FREESURFER_LABELS)].astype(np.int32),
+        'tissues': np.minimum(shells, 9).astype(np.uint8),
+    }
+    if spec.layout == 'malpem':
+        kinds['labels'] = shells.astype(np.uint8)
+
+    count = 0
+    for i, subject in enumerate(subject_dirs(spec)):
+        shift = (i * 7) % max(spec.shape[0] // 8, 1)
+        if spec.layout == 'freesurfer':
+            count += _write_freesurfer_subject(root / subject, spec, kinds, shift)
+        else:
+            count += _write_malpem_subject(root / subject, spec, kinds, shift)
+    return count
+
+
+def subject_dirs(spec: DatasetSpec) -> Iterator[str]:
+    """
+    :return: paths of subject directories relative to the root of the dataset
+    """
+    for i in range(spec.subjects):
+        parents = [f'{name}-{(i // 10 ** (level + 1)) % 10}'
+                   for level, name in zip(range(spec.depth), _level_names())]
+        yield '/'.join([*reversed(parents), f'sub-{i:05d}'])
+
+
+def _level_names() -> Iterator[str]:
+    yield from ('group', 'site', 'study')
+    level = 3
+    while True:
+        yield f'level{level}'
+        level += 1
+
+
+def _write_freesurfer_subject(subject: Path, spec: DatasetSpec, kinds: dict[str, np.ndarray], shift: int) -> int:
+    for subdir, names in _FREESURFER_OTHER_FILES.items():
+        (subject / subdir).mkdir(parents=True, exist_ok=True)
+        for name in names:
+            (subject / subdir / name).touch()
+    for name, kind in _FREESURFER_VOLUMES.items():
+        path = subject / 'mri' / f'{name}.{spec.format}'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = np.roll(kinds[kind], shift, axis=0)
+        img = nib.MGHImage(data, np.eye(4)) if spec.format == 'mgz' else nib.Nifti1Image(data, np.eye(4))
+        _save(img, path, spec.compress_level)
+    return len(_FREESURFER_VOLUMES)
+
+
+def _write_malpem_subject(subject: Path, spec: DatasetSpec, kinds: dict[str, np.ndarray], shift: int) -> int:
+    subject.mkdir(parents=True, exist_ok=True)
+    for name in _MALPEM_OTHER_FILES:
+        (subject / f'{subject.name}_{name}').touch()
+    for suffix, kind in _MALPEM_VOLUMES.items():
+        data = np.roll(kinds[kind], shift, axis=0)
+        _save(nib.Nifti1Image(data, np.eye(4)), subject / f'{subject.name}_{suffix}.nii.gz', spec.compress_level)
+    return len(_MALPEM_VOLUMES)
+
+
+def _radius(shape: tuple[int, int, int]) -> np.ndarray:
+    x, y, z = np.ogrid[-1:1:shape[0] * 1j, -1:1:shape[1] * 1j, -1:1:shape[2] * 1j]
+    return np.sqrt(x ** 2 + y ** 2 + z ** 2)
+
+
+def _dtype_range(dtype: str) -> tuple[float, float]:
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return max(info.min, 0), info.max
+    return 0.0, np.inf
+
+
+def _save(img: SpatialImage, path: Path, compress_level: int):
+    """
+    Like ``nib.save``, but without the time of writing in the gzip header.
+    """
+    data = img.to_bytes()
+    if path.suffix in ('.gz', '.mgz'):
+        data = gzip.compress(data, compresslevel=compress_level, mtime=0)
+    path.write_bytes(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# Purpose: measure the throughput of scanning, matching, computing statistics and of whole runs on a
+#          generated dataset, and save the results so that commits can be compared with compare_benchmarks.py.
+# Usage: ./run_benchmarks.py [--only scan,match,stats,end-to-end] [--repeat N] [--jobs N] [--name NAME]
+#                            [generate_dataset.py arguments...]
+#
+# The dataset is generated (see generate_dataset.py) in a temporary directory, or reused from --dataset-dir.
+# Results are saved to results/NAME.json, where NAME defaults to the current commit, e.g.:
+#
+#     git checkout main && ./run_benchmarks.py --subjects 50
+#     git checkout my-branch && ./run_benchmarks.py --subjects 50
+#     ./compare_benchmarks.py main-commit my-branch-commit
+
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Callable, TypeVar
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from generate_dataset import DatasetSpec, add_arguments, spec_of, generate_dataset
+from visualdataset.brain_dataset import brain_dataset
+from visualdataset.index_brain_dir import volume_snapshot
+from visualdataset.matcher_engine import CompiledMatchers
+from visualdataset.timing import StageTimer
+from visualdataset.volume_sidecar import SidecarOptions, compute_settings
+from visualdataset.wellknown import FREESURFER_MATCHERS, FREESURFER_OPTIONS, MALPEM_MATCHERS, MALPEM_OPTIONS
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+RESULTS_VERSION = 1
+BENCHMARKS = ('scan', 'match', 'stats', 'end-to-end')
+
+_T = TypeVar('_T')
+
+
+def main():
+    parser = ArgumentParser(description='Run the benchmarks on a generated dataset and save the results')
+    parser.add_argument('--only', type=str, default=','.join(BENCHMARKS),
+                        help='comma-separated benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per benchmark, the best is kept')
+    parser.add_argument('--jobs', type=int, default=1, help='--jobs of the end-to-end benchmark')
+    parser.add_argument('--name', type=str, help='name of the results, by default the current commit')
+    parser.add_argument('--dataset-dir', type=Path,
+                        help='where to generate the dataset, which is reused if it already exists')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    only = [b.strip() for b in args.only.split(',') if b.strip()]
+    if unknown := set(only) - set(BENCHMARKS):
+        print(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+        sys.exit(1)
+    spec = spec_of(args)
+    name = args.name or current_commit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.dataset_dir or Path(tmp) / 'dataset'
+        if not root.exists():
+            start = time.perf_counter()
+            count = generate_dataset(root, spec)
+            print(f'Generated {count} volumes in {time.perf_counter() - start:.1f}s')
+        benchmarks = {b: _BENCHMARKS[b](root, spec, args) for b in only}
+
+    results = {
+        'version': RESULTS_VERSION,
+        'name': name,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'dataset': spec._asdict(),
+        'repeat': args.repeat,
+        'jobs': args.jobs,
+        'benchmarks': benchmarks,
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = RESULTS_DIR / f'{name}.json'
+    output.write_text(json.dumps(results, indent=2))
+    for benchmark, result in benchmarks.items():
+        print(f'{benchmark:12s} {result["seconds"] * 1000:10.1f}ms '
+              f'{result["items"] / result["seconds"]:12.1f} {result["unit"]}/s')
+    print(f'Results saved to {output}')
+
+
+def bench_scan(root: Path, spec: DatasetSpec, args) -> dict:
+    seconds, count = _best_of(args.repeat, lambda: sum(1 for _ in volume_snapshot(root).matching_files()))
+    return {'seconds': seconds, 'items': count, 'unit': 'volumes'}
+
+
+def bench_match(root: Path, spec: DatasetSpec, args) -> dict:
+    matchers, _ = _wellknown(spec)
+    paths = [str(p) for p in volume_snapshot(root).matching_files()]
+
+    def match() -> int:
+        compiled = CompiledMatchers(matchers)
+        return sum(1 for p in paths if compiled.match(p))
+
+    seconds, matched = _best_of(args.repeat, match)
+    return {'seconds': seconds, 'items': len(paths), 'unit': 'paths', 'matched': matched}
+
+
+def bench_stats(root: Path, spec: DatasetSpec, args) -> dict:
+    paths = [root / p for p in volume_snapshot(root).matching_files()]
+    options = SidecarOptions()
+    seconds, _ = _best_of(args.repeat, lambda: [compute_settings(p, options) for p in paths])
+    size = sum(p.stat().st_size for p in paths)
+    return {'seconds': seconds, 'items': len(paths), 'unit': 'volumes', 'bytes': size}
+
+
+def bench_end_to_end(root: Path, spec: DatasetSpec, args) -> dict:
+    matchers, options = _wellknown(spec)
+    best = None
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as output_dir, open(os.devnull, 'w') as devnull:
+            timer = StageTimer()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+                brain_dataset(root, Path(output_dir), matchers, options, [], {}, None, jobs=args.jobs, timer=timer)
+            seconds = time.perf_counter() - start
+        if best is None or seconds < best['seconds']:
+            stages = {stage: timing['wall'] for stage, timing in timer.stages.items()}
+            best = {'seconds': seconds, 'items': len(timer.files), 'unit': 'volumes', 'stages': stages}
+    return best
+
+
+_BENCHMARKS: dict[str, Callable[[Path, DatasetSpec, object], dict]] = {
+    'scan': bench_scan,
+    'match': bench_match,
+    'stats': bench_stats,
+    'end-to-end': bench_end_to_end,
+}
+
+
+def current_commit() -> str:
+    """
+    :return: abbreviated hash of the current commit, suffixed with ``-dirty`` if there are uncommitted changes
+    """
+    repo = Path(__file__).parent.parent
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo, text=True).strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD', '--', 'visualdataset'], cwd=repo).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def _wellknown(spec: DatasetSpec) -> tuple:
+    if spec.layout == 'malpem':
+        return MALPEM_MATCHERS, MALPEM_OPTIONS
+    return FREESURFER_MATCHERS, FREESURFER_OPTIONS
+
+
+def _best_of(repeat: int, fn: Callable[[], _T]) -> tuple[float, _T]:
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    main()
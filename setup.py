@@ -29,6 +29,7 @@ setup(
     package_data={
         'visualdataset': ['colormaps/*']
     },
+    python_requires='>=3.11',
     install_requires=['chris_plugin'],
     license='MIT',
     entry_points={
@@ -44,6 +45,13 @@ setup(
     ],
     extras_require={
         'none': [],
+        'fast': [
+            'isal>=1.6',
+            'zlib-ng>=0.4'
+        ],
+        'zstd': [
+            'zstandard>=0.22'
+        ],
         'dev': [
             'pytest~=8.0',
             'pytest-unordered~=0.5.2'
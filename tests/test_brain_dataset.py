@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from visualdataset.args_types import Matcher
+from visualdataset.brain_dataset import brain_dataset
+from visualdataset.colormap_registry import parse_colormap
+from visualdataset.manifest import OptionsLink
+from visualdataset.options import ChrisViewerFileOptions, NiivueVolumeSettings
+from visualdataset.volume_sidecar import SidecarOptions
+from visualdataset.wellknown import FREESURFER_MATCHERS, FREESURFER_OPTIONS
+
+
+@pytest.fixture
+def freesurfer_dir(tmp_path: Path) -> Path:
+    rng = np.random.default_rng(0)
+    input_dir = tmp_path / 'in'
+    for i in range(3):
+        mri = input_dir / f'sub-{i}' / 'mri'
+        mri.mkdir(parents=True)
+        nib.save(nib.MGHImage(rng.integers(0, 255, (8, 8, 8), dtype=np.uint8), np.eye(4)), mri / 'T1.mgz')
+        labels = rng.choice(np.array([0, 2, 41, 1035], dtype=np.int32), (8, 8, 8))
+        nib.save(nib.MGHImage(labels, np.eye(4)), mri / 'aparc.DKTatlas+aseg.deep.mgz')
+    (input_dir / 'sub-0' / 'surf').mkdir()
+    (input_dir / 'sub-0' / 'surf' / 'lh.white').touch()
+    return input_dir
+
+
+def _run(input_dir: Path, output_dir: Path, **kwargs) -> dict[str, bytes]:
+    output_dir.mkdir()
+    brain_dataset(input_dir, output_dir, FREESURFER_MATCHERS, FREESURFER_OPTIONS, [], {}, 'readme',
+                  sidecar_options=SidecarOptions(thumbnails=True, preview_factors=(2,)),
+                  first_run_globs=['T1.mgz'], **kwargs)
+    return {str(p.relative_to(output_dir)): p.read_bytes() for p in sorted(output_dir.rglob('*')) if p.is_file()}
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_pipeline_outputs_are_identical(freesurfer_dir: Path, tmp_path: Path, jobs: int):
+    expected = _run(freesurfer_dir, tmp_path / 'default', jobs=jobs)
+    manifest = json.loads(expected['.chrisvisualdataset.tagmanifest.json'])
+    assert manifest['first_run_files'] == [0]
+    assert 'FreeSurferColorLUT.v7.3.3.json' in expected
+    assert 'sub-0/mri/aparc.DKTatlas+aseg.deep.mgz.chrisvisualdataset.volume.json' in expected
+    assert _run(freesurfer_dir, tmp_path / 'pipeline', jobs=jobs, pipeline=True) == expected
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_max_memory_outputs_are_identical(freesurfer_dir: Path, tmp_path: Path, pipeline: bool):
+    expected = _run(freesurfer_dir, tmp_path / 'default', jobs=2, pipeline=pipeline)
+    assert _run(freesurfer_dir, tmp_path / 'budget', jobs=2, pipeline=pipeline, max_memory=1) == expected
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_max_memory_unreadable_volume(freesurfer_dir: Path, tmp_path: Path, capsys, pipeline: bool):
+    unreadable = freesurfer_dir / 'sub-1' / 'mri' / 'T1.mgz'
+    unreadable.write_bytes(b'not a volume')
+    with pytest.raises(SystemExit):
+        _run(freesurfer_dir, tmp_path / 'out', jobs=2, pipeline=pipeline, max_memory=1)
+    assert f'failed to create sidecar for "{unreadable}"' in capsys.readouterr().out
+
+
+def test_prune_colormaps(tmp_path: Path):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    nib.save(nib.MGHImage(np.array([0, 2, 41, 2], dtype=np.int32).reshape(1, 2, 2), np.eye(4)), input_dir / 'aseg.mgz')
+    nib.save(nib.MGHImage(np.array([0, 1035, 2035, 0], dtype=np.int32).reshape(1, 2, 2), np.eye(4)),
+             input_dir / 'aparc.mgz')
+    nib.save(nib.Nifti1Image(np.array([0, 1.5, 2, 3], dtype=np.float32).reshape(1, 2, 2), np.eye(4)),
+             input_dir / 'MALPEM.nii')
+    matchers = [
+        Matcher(key='type', value='FreeSurfer labels', regex=r'(aseg|aparc)\.mgz$'),
+        Matcher(key='type', value='MALP-EM labels', regex=r'MALPEM\.nii$'),
+    ]
+    options = [
+        OptionsLink(match={'type': 'FreeSurfer labels'}, options=ChrisViewerFileOptions(
+            niivue_defaults=NiivueVolumeSettings(colormapLabelFile='FreeSurferColorLUT.v7.3.3.json')
+        )),
+        OptionsLink(match={'type': 'MALP-EM labels'}, options=ChrisViewerFileOptions(
+            niivue_defaults=NiivueVolumeSettings(colormapLabelFile='MALP-EM.v1.3.json')
+        )),
+    ]
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    brain_dataset(input_dir, output_dir, matchers, options, [], {}, None, prune_colormaps=True)
+
+    freesurfer = parse_colormap((output_dir / 'FreeSurferColorLUT.v7.3.3.json').read_bytes())
+    assert freesurfer['I'] == [0, 2, 41, 1035, 2035]
+    malpem = Path(__file__).parent.parent / 'visualdataset' / 'colormaps' / 'MALP-EM.v1.3.json'
+    assert (output_dir / 'MALP-EM.v1.3.json').read_bytes() == malpem.read_bytes()
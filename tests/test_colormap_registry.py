@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from visualdataset.colormap_registry import ColormapRegistry, parse_colormap, prune_colormap
+from visualdataset.index_brain_dir import volume_snapshot
+
+
+def test_parse_colormap():
+    colormap = parse_colormap(b'{"R": [0, 255], "G": [0, 0], "B": [0, 0], "I": [0, 7], "labels": ["a", "b"]}')
+    assert colormap['I'] == [0, 7]
+    with pytest.raises(ValueError):
+        parse_colormap(b'{"R": [0, 255], "G": [0], "B": [0, 0]}')
+    with pytest.raises(ValueError):
+        parse_colormap(b'{"R": [0, 256], "G": [0, 0], "B": [0, 0]}')
+    with pytest.raises(ValueError):
+        parse_colormap(b'{"R": [0], "G": [0], "B": [0], "colors": []}')
+
+
+def test_prune_colormap():
+    colormap = parse_colormap(b'{"R": [1, 2, 3], "G": [4, 5, 6], "B": [7, 8, 9], "labels": ["a", "b", "c"]}')
+    assert prune_colormap(colormap, [2, 0, 42]) == {
+        'R': [1, 3], 'G': [4, 6], 'B': [7, 9], 'I': [0, 2], 'labels': ['a', 'c']
+    }
+
+
+def test_registry(tmp_path: Path):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    (input_dir / 'mine.json').write_text(json.dumps({'R': [1], 'G': [2], 'B': [3], 'I': [5]}))
+    colormaps = ColormapRegistry(volume_snapshot(input_dir))
+
+    assert colormaps.path('mine.json') == input_dir / 'mine.json'
+    assert colormaps.load('FreeSurferColorLUT.v7.3.3.json')['labels'][2] == 'Left-Cerebral-White-Matter'
+    with pytest.raises(FileNotFoundError):
+        colormaps.path('missing.json')
+
+    output_dir = tmp_path / 'out'
+    colormaps.write('mine.json', output_dir)
+    assert (output_dir / 'mine.json').read_bytes() == (input_dir / 'mine.json').read_bytes()
+    colormaps.write('FreeSurferColorLUT.v7.3.3.json', output_dir, [0, 2])
+    pruned = json.loads((output_dir / 'FreeSurferColorLUT.v7.3.3.json').read_text())
+    assert pruned['I'] == [0, 2]
+    assert pruned['labels'] == ['Unknown', 'Left-Cerebral-White-Matter']
@@ -0,0 +1,31 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from visualdataset.decompress import available_backends, open_file, resolve_backend
+
+
+@pytest.mark.parametrize('backend', available_backends())
+@pytest.mark.parametrize('threads', [0, 2])
+def test_open_file(tmp_path: Path, backend: str, threads: int):
+    data = bytes(range(256)) * 10_000
+    path = tmp_path / 'data.mgz'
+    with gzip.open(path, 'wb') as f:
+        f.write(data[:1000])
+    with gzip.open(path, 'ab') as f:  # multi-member gzip
+        f.write(data[1000:])
+    with open_file(path, backend, threads) as f:
+        assert f.read() == data
+
+
+def test_open_uncompressed(tmp_path: Path):
+    path = tmp_path / 'data.nii'
+    path.write_bytes(b'hello')
+    with open_file(path) as f:
+        assert f.read() == b'hello'
+
+
+def test_resolve_backend():
+    assert resolve_backend('auto') == available_backends()[0]
+    assert resolve_backend('gzip') == 'gzip'
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY_MODULES = {'pydantic', 'numpy', 'nibabel', 'tqdm', 'visualdataset.wellknown.freesurfer',
+                 'visualdataset.wellknown.malpem', 'visualdataset.brain_dataset'}
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """
+    :return: cumulative import time of every module imported by ``module``, as reported by ``python -X importtime``
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_entry_point_imports_are_light():
+    times = _import_times('visualdataset.__main__')
+    assert 'visualdataset.__main__' in times
+    assert not HEAVY_MODULES & times.keys()
+
+
+def test_wellknown_is_lazy():
+    times = _import_times('visualdataset.wellknown')
+    assert 'pydantic' not in times
+    from visualdataset.wellknown import FREESURFER_MATCHERS
+    assert FREESURFER_MATCHERS[0].key == 'type'
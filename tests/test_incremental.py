@@ -0,0 +1,81 @@
+import json
+import os
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from visualdataset.args_types import Matcher
+from visualdataset.brain_dataset import brain_dataset
+from visualdataset.incremental import STATE_NAME
+from visualdataset.manifest import VisualDatasetManifest
+from visualdataset.volume_sidecar import SidecarOptions
+
+MATCHERS = [Matcher(key='type', value='T1', regex=r'T1\.nii$')]
+
+
+def _save_volume(path: Path, value: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    nib.save(nib.Nifti1Image(np.full((4, 4, 4), value, dtype=np.int16), np.eye(4)), path)
+
+
+def _run(input_dir: Path, output_dir: Path, first_run_files: list[str], **kwargs) -> VisualDatasetManifest:
+    brain_dataset(input_dir, output_dir, MATCHERS, [], first_run_files, {}, None, incremental=True, **kwargs)
+    manifest = (output_dir / '.chrisvisualdataset.tagmanifest.json').read_text()
+    return VisualDatasetManifest.model_validate_json(manifest)
+
+
+def _mtimes(output_dir: Path) -> dict[str, int]:
+    return {
+        str(p.relative_to(output_dir)): p.stat().st_mtime_ns
+        for p in output_dir.rglob('*.volume.json')
+    }
+
+
+def test_incremental(tmp_path: Path):
+    input_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    for i in range(3):
+        _save_volume(input_dir / f'sub-{i}' / 'T1.nii', i)
+    manifest = _run(input_dir, output_dir, ['sub-2/T1.nii'], sidecar_options=SidecarOptions(thumbnails=True))
+    assert [str(f.path) for f in manifest.files] == ['sub-0/T1.nii', 'sub-1/T1.nii', 'sub-2/T1.nii']
+    before = _mtimes(output_dir)
+
+    _save_volume(input_dir / 'sub-1' / 'T1.nii', 100)
+    os.remove(input_dir / 'sub-0' / 'T1.nii')
+    _save_volume(input_dir / 'sub-3' / 'T1.nii', 3)
+    manifest = _run(input_dir, output_dir, ['sub-2/T1.nii'], sidecar_options=SidecarOptions(thumbnails=True))
+
+    assert [str(f.path) for f in manifest.files] == ['sub-1/T1.nii', 'sub-2/T1.nii', 'sub-3/T1.nii']
+    assert [str(manifest.files[i].path) for i in manifest.first_run_files] == ['sub-2/T1.nii']
+    after = _mtimes(output_dir)
+    assert after.keys() == {'sub-1/T1.nii.chrisvisualdataset.volume.json',
+                            'sub-2/T1.nii.chrisvisualdataset.volume.json',
+                            'sub-3/T1.nii.chrisvisualdataset.volume.json'}
+    assert after['sub-2/T1.nii.chrisvisualdataset.volume.json'] == before['sub-2/T1.nii.chrisvisualdataset.volume.json']
+    assert after['sub-1/T1.nii.chrisvisualdataset.volume.json'] != before['sub-1/T1.nii.chrisvisualdataset.volume.json']
+    sidecar = json.loads((output_dir / 'sub-1/T1.nii.chrisvisualdataset.volume.json').read_text())
+    assert sidecar['cal_max'] == 100
+    assert not (output_dir / 'sub-0').exists()
+    assert set(json.loads((output_dir / STATE_NAME).read_text())['files']) == {str(f.path) for f in manifest.files}
+
+    _run(input_dir, output_dir, [])
+    assert _mtimes(output_dir).keys() == after.keys()
+    assert not any(after[k] == v for k, v in _mtimes(output_dir).items())  # options changed, so all were rewritten
+
+
+def test_options_changed_removes_stale_outputs(tmp_path: Path):
+    input_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    _save_volume(input_dir / 'sub-0' / 'T1.nii', 1)
+    _run(input_dir, output_dir, [], sidecar_options=SidecarOptions(thumbnails=True, preview_factors=(2,)))
+    sidecar = json.loads((output_dir / 'sub-0/T1.nii.chrisvisualdataset.volume.json').read_text())
+    previews = [output_dir / 'sub-0' / name for name in sidecar['previews'].values()]
+    thumbnails = list((output_dir / 'sub-0').glob('*.png'))
+    assert previews and thumbnails and all(p.is_file() for p in previews)
+
+    _run(input_dir, output_dir, [])
+    assert not any(p.exists() for p in [*previews, *thumbnails])
+    assert [p.name for p in (output_dir / 'sub-0').iterdir()] == ['T1.nii.chrisvisualdataset.volume.json']
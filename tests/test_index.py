@@ -2,7 +2,7 @@ from pathlib import Path
 import pytest
 from pytest_unordered import unordered
 
-from visualdataset.index_brain_dir import index_brain_dir
+from visualdataset.index_brain_dir import index_brain_dir, is_volume_file, walk_volume_files
 from tests.example_matchers import FETAL_ATLAS_MATCHERS
 from visualdataset.manifest import VisualDatasetFile
 
@@ -61,3 +61,19 @@ def test_index_dir(tmp_path: Path):
         ),
     ]
     assert actual == unordered(expected)
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_walk_volume_files(tmp_path: Path, threads: int):
+    for name in ['a/T1.mgz', 'a/b/c/aseg.nii.gz', 'a/b/notes.txt', 'x.nii', 'a/lh.white', 'surf.nii/inner.nii']:
+        p = tmp_path / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.touch()
+    (tmp_path / 'linked.mgz').symlink_to(tmp_path / 'a' / 'T1.mgz')
+    (tmp_path / 'dangling.mgz').symlink_to(tmp_path / 'missing.mgz')
+    (tmp_path / 'linked_dir').symlink_to(tmp_path / 'a')
+
+    expected = [p.relative_to(tmp_path) for p in tmp_path.rglob('*') if is_volume_file(p)]
+    actual = list(walk_volume_files(tmp_path, threads))
+    assert actual == unordered(expected)
+    assert len(actual) == 5
@@ -0,0 +1,80 @@
+import io
+from pathlib import PurePath
+
+import pytest
+from pydantic import ValidationError
+
+from visualdataset.brain_dataset import aggregate_tags, find_first_run_files
+from visualdataset.manifest import (VisualDatasetFile, VisualDatasetManifest, OptionsLink, CompactManifest,
+                                    IndexedFile, write_manifest)
+from visualdataset.options import ChrisViewerFileOptions, NiivueVolumeSettings
+
+
+def test_sort():
+    files = [
+        VisualDatasetFile(path=PurePath('b/T1.mgz'), tags={'type': 'T1', 'subject': 'b'}),
+        VisualDatasetFile(path=PurePath('a/T1.mgz'), tags={'type': 'T1', 'subject': 'a'}),
+        VisualDatasetFile(path=PurePath('a/aseg.mgz'), tags={'type': 'labels', 'subject': 'a'}),
+        VisualDatasetFile(path=PurePath('a-b/T1.mgz'), tags={'type': 'T1'}),
+    ]
+    manifest = VisualDatasetManifest(tags=aggregate_tags(files), files=files, options=[], first_run_files=[0, 2])
+    actual = manifest.sort()
+    assert [str(f.path) for f in actual.files] == ['a-b/T1.mgz', 'a/T1.mgz', 'a/aseg.mgz', 'b/T1.mgz']
+    assert [actual.files[i] for i in actual.first_run_files] == [files[0], files[2]]
+    assert actual.tags == {'subject': ['a', 'b'], 'type': ['T1', 'labels']}
+
+
+def test_find_first_run_files():
+    files = [VisualDatasetFile(path=PurePath(f'{i}/T1.mgz'), tags={}) for i in range(5)]
+    assert find_first_run_files(files, ['3/T1.mgz', '0/T1.mgz']) == [3, 0]
+
+
+def test_compact_round_trip():
+    files = [
+        VisualDatasetFile(path=PurePath('sub-1/mri/T1.mgz'), tags={'type': 'T1', 'subject': '1'}, has_sidecar=True),
+        VisualDatasetFile(path=PurePath('sub-1/mri/aseg.mgz'), tags={'type': 'labels', 'subject': '1'}),
+        VisualDatasetFile(path=PurePath('sub-10/mri/T1.mgz'), tags={'subject': '10', 'type': 'T1'}),
+        VisualDatasetFile(path=PurePath('sub-1/é/ü.nii'), tags={}),
+        VisualDatasetFile(path=PurePath('other.nii'), tags={'note': 'has "quotes"'}, has_sidecar=True),
+    ]
+    options = [OptionsLink(match={'type': 'T1'}, options=ChrisViewerFileOptions(name='T1'))]
+    manifest = VisualDatasetManifest(tags=aggregate_tags(files), files=files, options=options, first_run_files=[2])
+    manifest = manifest.sort()
+
+    compact = manifest.compact()
+    assert compact.files.path_prefix_lengths == [0, 0, 10, 6, 5]
+    assert compact.files.tags['type'] == [-1, 0, 1, -1, 0]
+    actual = CompactManifest.model_validate_json(compact.model_dump_json()).expand()
+    assert actual == manifest
+
+
+def test_compact_invalid():
+    manifest = VisualDatasetManifest(tags={'type': ['T1']}, options=[], first_run_files=[],
+                                     files=[VisualDatasetFile(path=PurePath('x.nii'), tags={'type': 'T2'})])
+    with pytest.raises(ValueError):
+        manifest.compact()
+    data = manifest.model_copy(update={'tags': {'type': ['T2']}}).compact().model_dump()
+    with pytest.raises(ValidationError):
+        CompactManifest.model_validate({**data, 'version': 2})
+    data['files']['has_sidecar'] = []
+    with pytest.raises(ValueError):
+        CompactManifest.model_validate(data).expand()
+
+
+def test_write_manifest_is_model_dump_json():
+    files = [
+        IndexedFile('sub-1/mri/T1.mgz', {'type': 'T1', 'name': 'T1 "MPRAGE"'}, True),
+        IndexedFile('sub-1/ü/\t\x01\x7f 😀.nii', {'type': 'T1', 'name': 'é\\'}),
+        IndexedFile('a.nii', {}, True),
+    ]
+    options = [
+        OptionsLink(match={'type': 'T1'}, options=ChrisViewerFileOptions(
+            name='T1', niivue_defaults=NiivueVolumeSettings(opacity=1e-7, cal_max=1e16, colormap='gray')
+        )),
+    ]
+    tags = aggregate_tags(files)
+    buffer = io.StringIO()
+    write_manifest(buffer, tags, files, options, [1, 0])
+    manifest = VisualDatasetManifest(tags=tags, files=[f.to_model() for f in files],
+                                     options=options, first_run_files=[1, 0])
+    assert buffer.getvalue() == manifest.sort().model_dump_json()
@@ -0,0 +1,82 @@
+from pathlib import PurePath
+from types import SimpleNamespace
+
+import pytest
+
+from tests.example_matchers import FETAL_ATLAS_MATCHERS
+from visualdataset.args_types import Matcher
+from visualdataset.index_brain_dir import match_file
+from visualdataset.matcher_engine import CompiledMatchers
+from visualdataset import regex_literals
+from visualdataset.regex_literals import required_literals
+from visualdataset.traversal import directory_hints
+from visualdataset.wellknown import FREESURFER_MATCHERS, MALPEM_MATCHERS
+
+EDGE_CASE_MATCHERS = [
+    Matcher(key='root', value='yes', regex=r'^[^/]+$'),
+    Matcher(key='case', value='insensitive', regex=r'(?i)t1\.mgz$'),
+    Matcher(key='slash', value='leading', regex=r'/T1\.'),
+    Matcher(key='slash', value='override', regex=r'sub-01/mri/T1'),
+    Matcher(key='subject', value='01', regex=r'sub-01/'),
+    Matcher(key='root', value='overridden', regex=r'sub-01/'),
+]
+
+PATHS = [
+    'T1.mgz',
+    't1.MGZ',
+    'sub-01/mri/T1.mgz',
+    'sub-01/mri/brainmask.nii.gz',
+    'sub-01/mri/aparc.DKTatlas+aseg.deep.withCC.mgz',
+    'sub-02/mri/aparc.DKTatlas+aseg.deep.mgz',
+    'sub-02/mri/aparc.DKTatlas+aseg.orig.nii',
+    'sub-02/mri/aparc.DKTatlas+aseg.mgz',
+    'sub-02/mri/aparc.a2009s+aseg.mgz',
+    'sub-02/mri/wmparc.mgz',
+    'sub-02/mri/sub/T1.mgz',
+    'sub-02/T1.mgz',
+    'mri/T1.mgz',
+    'xmri/T1.mgz',
+    'Age 36/serag_template.nii.gz',
+    'Age 37/ali_tissue.nii.gz',
+    'Age 37/aliexp_regional.nii.gz',
+    'Age 37/kiho_ventricles.nii.gz',
+    'patient_noN4_masked.nii.gz',
+    'a/b/patient_MALPEM_tissues.nii.gz',
+    'a/b/patient_MALPEM_corrected.nii.gz',
+]
+
+
+@pytest.mark.parametrize('matchers', [
+    FREESURFER_MATCHERS, MALPEM_MATCHERS, FETAL_ATLAS_MATCHERS, EDGE_CASE_MATCHERS,
+    [*FREESURFER_MATCHERS, *MALPEM_MATCHERS, *FETAL_ATLAS_MATCHERS, *EDGE_CASE_MATCHERS]
+])
+def test_same_as_match_file(matchers):
+    compiled = CompiledMatchers(matchers)
+    for _ in range(2):  # second time from memos
+        for path in PATHS:
+            expected = match_file(PurePath(path), matchers).tags
+            actual = compiled.match(path)
+            assert actual == expected
+            assert list(actual) == list(expected)
+
+
+@pytest.mark.parametrize('regex, expected', [
+    (r'mri/aparc\.DKTatlas\+aseg(\.(orig|deep))?\.(mgz|nii)$', ['mri/aparc.DKTatlas+aseg', '.']),
+    (r'.+_(no)?N4(_masked)?\.nii\.gz', ['_', 'N4', '.nii.gz']),
+    (r'Age 36/', ['Age 36/']),
+    (r'(?i)T1', []),
+    (r'(ab)c', ['ab', 'c']),
+    (r'a*b[cd]', ['b']),
+])
+def test_required_literals(regex: str, expected: list[str]):
+    assert required_literals(regex) == expected
+
+
+@pytest.mark.parametrize('parser', [None, SimpleNamespace()])
+def test_without_regex_parser(parser, monkeypatch):
+    monkeypatch.setattr(regex_literals, '_parser', parser)
+    assert required_literals(r'mri/T1\.mgz$') == []
+    assert directory_hints(FREESURFER_MATCHERS) is None
+    compiled = CompiledMatchers(FREESURFER_MATCHERS)
+    for path in PATHS:
+        assert compiled.match(path) == match_file(PurePath(path), FREESURFER_MATCHERS).tags
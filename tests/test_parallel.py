@@ -0,0 +1,75 @@
+import pytest
+
+from visualdataset.parallel import map_ordered, map_streaming, map_scheduled, TaskError, cpu_limit, _CostQueue
+
+
+def _square(x: int) -> int:
+    if x == 13:
+        raise ValueError('unlucky')
+    return x * x
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_map_ordered(jobs: int):
+    assert map_ordered(_square, list(range(10)), jobs, desc='test') == [x * x for x in range(10)]
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_map_ordered_error_has_name(jobs: int):
+    with pytest.raises(TaskError) as e:
+        map_ordered(_square, list(range(20)), jobs, desc='test', name=lambda x: f'item{x}')
+    assert e.value.name == 'item13'
+    assert isinstance(e.value.cause, ValueError)
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_map_streaming(jobs: int):
+    produced = []
+
+    def items():
+        for x in range(13):
+            produced.append(x)
+            yield x
+
+    assert map_streaming(_square, items(), jobs, desc='test', max_pending=2) == [x * x for x in range(13)]
+    assert produced == list(range(13))
+
+
+def test_map_streaming_error_has_name():
+    with pytest.raises(TaskError) as e:
+        map_streaming(_square, iter(range(20)), 3, desc='test', name=lambda x: f'item{x}')
+    assert e.value.name == 'item13'
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_map_scheduled(jobs: int):
+    items = [3, 9, 1, 5, 7, 2]
+    results = map_scheduled(_square, items, jobs, desc='test', cost=lambda x: x, budget=8)
+    assert results == [x * x for x in items]
+
+
+def test_map_scheduled_error_has_name():
+    with pytest.raises(TaskError) as e:
+        map_scheduled(_square, list(range(20)), 3, desc='test', name=lambda x: f'item{x}', cost=lambda x: x, budget=30)
+    assert e.value.name == 'item13'
+
+
+def test_map_streaming_budget():
+    assert map_streaming(_square, iter(range(10)), 3, desc='test', cost=lambda x: x, budget=4) == [
+        x * x for x in range(10)
+    ]
+
+
+def test_cost_queue():
+    queue = _CostQueue([5, 1, 5, 3, 8])
+    assert queue.pop_largest() == 4
+    assert queue.pop_fitting(4) == 3
+    assert queue.pop_fitting(0) is None
+    assert queue.pop_fitting(5) == 0
+    assert queue.pop_largest() == 2
+    assert queue.pop_largest() == 1
+    assert not queue
+
+
+def test_cpu_limit():
+    assert cpu_limit() >= 1
@@ -0,0 +1,41 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from visualdataset.precompress import PrecompressOptions, compress_file, check_encodings, read_file
+
+DATA = b'{"cal_min":0.0,"cal_max":254.0}' * 100
+
+
+@pytest.mark.parametrize('level', [None, 1])
+def test_compress_file(tmp_path: Path, level):
+    path = tmp_path / 'x.json'
+    path.write_bytes(DATA)
+    compress_file(path, PrecompressOptions(encodings=('gzip',), level=level))
+    assert path.read_bytes() == DATA
+    assert gzip.decompress((tmp_path / 'x.json.gz').read_bytes()) == DATA
+
+
+def test_compress_file_only(tmp_path: Path):
+    path = tmp_path / 'x.json'
+    path.write_bytes(DATA)
+    options = PrecompressOptions(encodings=('gzip',), only=True)
+    compress_file(path, options)
+    assert not path.exists()
+    assert options.output_path(path) == tmp_path / 'x.json.gz'
+    assert read_file(path) == DATA
+
+
+def test_compress_file_zstd(tmp_path: Path):
+    zstandard = pytest.importorskip('zstandard')
+    path = tmp_path / 'x.json'
+    path.write_bytes(DATA)
+    compress_file(path, PrecompressOptions(encodings=('gzip', 'zstd'), level=3))
+    assert zstandard.ZstdDecompressor().decompress((tmp_path / 'x.json.zst').read_bytes()) == DATA
+
+
+def test_check_encodings():
+    check_encodings(['gzip'])
+    with pytest.raises(ValueError):
+        check_encodings(['gzip', 'brotli'])
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from visualdataset.preview import block_mode
+from visualdataset.volume_sidecar import analyze, SidecarOptions
+
+
+def test_block_mode():
+    blocks = np.array([
+        [1, 2, 2, 3],
+        [5, 5, 4, 4],
+        [7, 7, 7, 7],
+        [9, 0, 8, 0],
+    ])
+    assert block_mode(blocks).tolist() == [2, 4, 7, 0]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 10 * 10 * 4 * 3, 1024 * 1024])
+def test_average_preview(tmp_path: Path, chunk_size: int):
+    rng = np.random.default_rng(4)
+    data = rng.random((10, 10, 7)).astype(np.float32)
+    affine = np.diag([1.5, 1.5, 2.0, 1.0])
+    path = tmp_path / 'img.nii.gz'
+    nib.save(nib.Nifti1Image(data, affine), path)
+
+    preview = analyze(path, SidecarOptions(chunk_size=chunk_size, preview_factors=(2,))).previews[2]
+    padded = np.pad(data, ((0, 0), (0, 0), (0, 1)), mode='edge')
+    expected = padded.reshape(5, 2, 5, 2, 4, 2).mean(axis=(1, 3, 5))
+    np.testing.assert_allclose(preview.get_fdata(), expected, rtol=1e-6)
+
+    # center of the first preview voxel is the center of the first 2x2x2 block
+    np.testing.assert_allclose(nib.affines.apply_affine(preview.affine, [0, 0, 0]), [0.75, 0.75, 1.0])
+
+
+def test_label_preview(tmp_path: Path):
+    data = np.zeros((4, 4, 4), dtype=np.int32)
+    data[:2, :2, :2] = 17
+    data[0, 0, 0] = 3
+    data[2:, 2:, 2:] = 1035
+    path = tmp_path / 'aparc+aseg.mgz'
+    nib.save(nib.MGHImage(data, np.eye(4)), path)
+
+    preview = analyze(path, SidecarOptions(chunk_size=16, preview_factors=(2,)), is_label=True).previews[2]
+    actual = np.asanyarray(preview.dataobj)
+    assert actual.dtype == np.int32
+    assert actual[0, 0, 0] == 17
+    assert actual[1, 1, 1] == 1035
+    assert actual[1, 0, 0] == 0
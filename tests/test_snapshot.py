@@ -0,0 +1,50 @@
+import os
+from pathlib import Path
+
+import pytest
+from pytest_unordered import unordered
+
+from visualdataset import snapshot as snapshot_module
+from visualdataset.index_brain_dir import volume_snapshot
+
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    for name in ['sub-1/mri/T1.mgz', 'sub-1/surf/lh.white', 'sub-2/mri/T1.mgz', 'matchers.json', 'x_N4.nii.gz']:
+        p = tmp_path / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.touch()
+    (tmp_path / 'T1.mgz').mkdir()
+    (tmp_path / 'link.json').symlink_to(tmp_path / 'matchers.json')
+    (tmp_path / 'linkdir.json').symlink_to(tmp_path / 'sub-1')
+    return tmp_path
+
+
+def test_directory_is_listed_once(tree: Path, monkeypatch):
+    listed = []
+    real_scandir = os.scandir
+
+    def scandir(path):
+        listed.append(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(snapshot_module.os, 'scandir', scandir)
+    snapshot = volume_snapshot(tree)
+    assert snapshot.is_file('matchers.json')  # answered by stat, before the walk
+    assert not snapshot.is_file('[{"key": "type", "value": "T1", "regex": "T1\x00"}]')
+    assert listed == []
+    volumes = ['sub-1/mri/T1.mgz', 'sub-2/mri/T1.mgz', 'x_N4.nii.gz']
+    assert list(map(str, snapshot.matching_files())) == unordered(volumes)
+    assert list(snapshot.glob('*_N4.nii.gz')) == ['x_N4.nii.gz']
+    assert list(snapshot.glob('*.json')) == unordered(['matchers.json', 'link.json'])
+    assert snapshot.is_file('sub-1/surf/lh.white')
+    assert not snapshot.is_file('sub-1/surf')
+    assert not snapshot.is_file('T1.mgz')
+    assert not snapshot.is_file('[{"key": "type", "value": "T1", "regex": "T1\\\\.mgz$"}]')
+    assert len(listed) == len(set(listed)) == 7
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_glob_order_is_rglob_order(tree: Path, threads: int):
+    expected = [str(p.relative_to(tree)) for p in tree.rglob('T1.mgz') if p.is_file()]
+    assert list(volume_snapshot(tree, threads).glob('T1.mgz')) == expected
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from visualdataset.statistics import VolumeStatistics
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.uint16])
+def test_exact_quantiles(dtype):
+    rng = np.random.default_rng(1)
+    data = rng.integers(np.iinfo(dtype).min, np.iinfo(dtype).max, size=10_000, dtype=dtype)
+    stats = VolumeStatistics(dtype)
+    for slab in np.array_split(data, 7):
+        stats.update(slab)
+    assert stats.count == data.size
+    assert stats.min == data.min() and stats.max == data.max()
+    for q in (0.02, 0.5, 0.98):
+        assert stats.quantile(q) == np.quantile(data, q, method='lower')
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.int32])
+def test_sketch_quantiles_are_within_relative_accuracy(dtype):
+    rng = np.random.default_rng(2)
+    data = (rng.standard_normal(50_000) * 1000).astype(dtype)
+    stats = VolumeStatistics(dtype)
+    for slab in np.array_split(data, 5):
+        stats.update(slab)
+    for q in (0.02, 0.25, 0.75, 0.98):
+        expected = np.quantile(data, q, method='lower')
+        assert stats.quantile(q) == pytest.approx(expected, rel=0.02, abs=1)
+
+
+def test_merge_equals_single_pass():
+    rng = np.random.default_rng(3)
+    data = rng.lognormal(size=20_000).astype(np.float32)
+    data[:100] = np.nan
+    whole = VolumeStatistics(data.dtype)
+    whole.update(data)
+    parts = [VolumeStatistics(data.dtype) for _ in range(4)]
+    for part, slab in zip(parts, np.array_split(data, 4)):
+        part.update(slab)
+    merged = VolumeStatistics(data.dtype)
+    for part in parts:
+        merged.merge(part)
+    assert merged.count == whole.count == 19_900
+    assert merged.quantile(0.9) == whole.quantile(0.9)
+    assert merged.histogram(16) == whole.histogram(16)
+
+
+def test_histogram():
+    stats = VolumeStatistics(np.uint8)
+    stats.update(np.array([0, 0, 1, 2, 3, 3, 3, 4], dtype=np.uint8))
+    assert stats.histogram(4) == (0.0, 4.0, [2, 1, 1, 4])
@@ -0,0 +1,104 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from visualdataset import volume_sidecar
+from visualdataset.args_types import Matcher
+from visualdataset.brain_dataset import brain_dataset
+from visualdataset.stats_cache import StatsCache, fingerprint
+from visualdataset.volume_sidecar import create_sidecar, SidecarOptions
+
+
+def test_fingerprint_changes_with_content(tmp_path: Path):
+    p = tmp_path / 'a.bin'
+    p.write_bytes(b'a' * 300_000)
+    before = fingerprint(p)
+    assert fingerprint(p) == before
+
+    stat = p.stat()
+    p.write_bytes(b'a' * 299_999 + b'b')
+    os.utime(p, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert fingerprint(p) != before
+
+
+def test_get_put(tmp_path: Path):
+    cache = StatsCache(tmp_path)
+    assert cache.get('fp', 'v') is None
+    cache.put('fp', 'v', {'cal_min': 0.0, 'cal_max': 1.0})
+    assert cache.get('fp', 'v') == {'cal_min': 0.0, 'cal_max': 1.0}
+    assert cache.get('fp', 'other') is None
+    assert StatsCache(tmp_path).get('fp', 'v') == {'cal_min': 0.0, 'cal_max': 1.0}
+
+
+def test_evict(tmp_path: Path):
+    cache = StatsCache(tmp_path)
+    for i in range(10):
+        cache.put(f'fp{i}', '', 'x' * 100)
+    assert cache.evict(max_size=500) == 6
+    assert cache.get('fp0') is None
+    assert cache.get('fp9') is not None
+
+    time.sleep(0.01)
+    assert cache.evict(max_age=0) == 4
+
+
+def test_evict_shrinks_database(tmp_path: Path):
+    cache = StatsCache(tmp_path)
+    for i in range(1000):
+        cache.put(f'fp{i}', '', 'x' * 1000)
+    cache.close()
+    full = cache.path.stat().st_size
+    cache = StatsCache(tmp_path)
+    assert cache.evict(max_size=100_000) == 901  # values are 1002 bytes of JSON
+    assert cache.path.stat().st_size < full / 5
+    assert Path(f'{cache.path}-wal').stat().st_size == 0
+
+
+def test_create_sidecar_uses_cache(tmp_path: Path, monkeypatch):
+    img = tmp_path / 'img.nii.gz'
+    nib.save(nib.Nifti1Image(np.arange(8, dtype=np.uint8).reshape(2, 2, 2), np.eye(4)), img)
+    cache = StatsCache(tmp_path / 'cache')
+
+    create_sidecar(img, tmp_path / 'first.json', cache=cache)
+
+    def fail(*_args, **_kwargs):
+        raise AssertionError('volume should not be read again')
+
+    monkeypatch.setattr(volume_sidecar, 'compute_statistics', fail)
+    create_sidecar(img, tmp_path / 'second.json', cache=cache)
+    assert (tmp_path / 'second.json').read_bytes() == (tmp_path / 'first.json').read_bytes()
+
+
+def test_cache_depends_on_conformed_name(tmp_path: Path):
+    conformed = tmp_path / 'a' / 'T1.mgz'
+    conformed.parent.mkdir()
+    data = np.arange(50, dtype=np.uint8).reshape(5, 5, 2)
+    nib.save(nib.MGHImage(data, np.eye(4)), conformed)
+    renamed = tmp_path / 'b' / 'scan.mgz'
+    renamed.parent.mkdir()
+    shutil.copy2(conformed, renamed)
+    assert fingerprint(conformed) == fingerprint(renamed)
+
+    options = SidecarOptions(range_source='auto')
+    cache = StatsCache(tmp_path / 'cache')
+    assert create_sidecar(renamed, tmp_path / 'renamed.json', options, cache) == {'cal_min': 0.0, 'cal_max': 49.0}
+    assert create_sidecar(conformed, tmp_path / 'conformed.json', options, cache) == {'cal_min': 0.0, 'cal_max': 255.0}
+    assert create_sidecar(renamed, tmp_path / 'renamed.json', options, cache) == {'cal_min': 0.0, 'cal_max': 49.0}
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_brain_dataset_closes_caches(tmp_path: Path, jobs: int):
+    for i in range(3):
+        (tmp_path / 'in' / f'sub-{i}').mkdir(parents=True)
+        nib.save(nib.Nifti1Image(np.full((2, 2, 2), i, dtype=np.uint8), np.eye(4)), tmp_path / 'in' / f'sub-{i}/T1.nii')
+    (tmp_path / 'out').mkdir()
+    matchers = [Matcher(key='type', value='T1', regex=r'T1\.nii$')]
+    brain_dataset(tmp_path / 'in', tmp_path / 'out', matchers, [], [], {}, None, jobs=jobs,
+                  stats_cache=tmp_path / 'cache')
+    assert [p.name for p in (tmp_path / 'cache').iterdir()] == ['volume_stats.v1.sqlite3']
+    assert len(StatsCache(tmp_path / 'cache')._conn.execute('SELECT * FROM stats').fetchall()) == 3
@@ -0,0 +1,83 @@
+import struct
+import zlib
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from visualdataset.thumbnail import ThumbnailBuilder, colorize_labels, write_png
+from visualdataset.volume_sidecar import SidecarOptions, create_sidecar
+
+
+def _read_png(path: Path) -> np.ndarray:
+    data = path.read_bytes()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    pos, chunks = 8, {}
+    while pos < len(data):
+        length, = struct.unpack('>I', data[pos:pos + 4])
+        chunk_type = data[pos + 4:pos + 8]
+        body = data[pos + 8:pos + 8 + length]
+        assert struct.unpack('>I', data[pos + 8 + length:pos + 12 + length])[0] == zlib.crc32(chunk_type + body)
+        chunks[chunk_type] = body
+        pos += 12 + length
+    width, height = struct.unpack('>II', chunks[b'IHDR'][:8])
+    raw = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width * 3 + 1)
+    return raw[:, 1:].reshape(height, width, 3)
+
+
+def test_write_png(tmp_path: Path):
+    rgb = np.random.default_rng(0).integers(0, 256, size=(5, 7, 3), dtype=np.uint8)
+    write_png(tmp_path / 'a.png', rgb)
+    np.testing.assert_array_equal(_read_png(tmp_path / 'a.png'), rgb)
+
+
+def _build(data: np.ndarray, affine: np.ndarray, planes: int) -> ThumbnailBuilder:
+    builder = ThumbnailBuilder(nib.Nifti1Image(data, affine))
+    for z in range(0, data.shape[2], planes):
+        builder.update(data[:, :, z:z + planes])
+    return builder
+
+
+def test_orientation_does_not_depend_on_voxel_order():
+    rng = np.random.default_rng(1)
+    ras = rng.integers(0, 100, size=(6, 5, 4), dtype=np.uint8)
+    expected = _build(ras, np.eye(4), 1).result((0, 100))
+
+    # the same image stored as LPS, and with voxel axes permuted
+    lps = ras[::-1, ::-1, :]
+    lps_affine = np.diag([-1, -1, 1, 1])
+    lps_affine[:3, 3] = [5, 4, 0]
+    np.testing.assert_array_equal(_build(lps, lps_affine, 3).result((0, 100)), expected)
+
+    permuted = np.ascontiguousarray(ras.transpose(2, 0, 1))
+    permuted_affine = np.array([[0, 1, 0, 0], [0, 0, 1, 0], [1, 0, 0, 0], [0, 0, 0, 1]])
+    np.testing.assert_array_equal(_build(permuted, permuted_affine, 2).result((0, 100)), expected)
+
+
+def test_axial_view_is_superior_to_the_top():
+    data = np.zeros((4, 4, 4), dtype=np.uint8)
+    data[:, 3, :] = 100  # anterior
+    data[3, :, :] = 200  # right
+    axial = _build(data, np.eye(4), 4).result((0, 200))[:, :4, 0]
+    assert axial[0].tolist() == [127, 127, 127, 255]  # anterior row at the top, right column to the right
+    assert axial[:, 3].tolist() == [255, 255, 255, 255]
+
+
+def test_colorize_labels():
+    colormap = {'R': [0, 255, 10], 'G': [0, 0, 20], 'B': [0, 0, 30], 'I': [0, 2, 1035]}
+    rgb = colorize_labels(np.array([[0, 2], [1035, 7]]), colormap)
+    assert rgb.tolist() == [[[0, 0, 0], [255, 0, 0]], [[10, 20, 30], [0, 0, 0]]]
+
+
+def test_create_sidecar_with_thumbnail(tmp_path: Path):
+    path = tmp_path / 'aseg.mgz'
+    nib.save(nib.MGHImage(np.full((4, 6, 8), 2, dtype=np.int32), np.eye(4)), path)
+    sidecar = tmp_path / 'aseg.mgz.chrisvisualdataset.volume.json'
+    colormap = {'R': [0, 255], 'G': [0, 0], 'B': [0, 0], 'I': [0, 2]}
+    create_sidecar(path, sidecar, SidecarOptions(chunk_size=64, thumbnails=True), is_label=True, colormap=colormap)
+
+    assert '"thumbnail":"aseg.mgz.chrisvisualdataset.thumbnail.png"' in sidecar.read_text()
+    image = _read_png(tmp_path / 'aseg.mgz.chrisvisualdataset.thumbnail.png')
+    assert image.shape == (8, 4 + 4 + 6 + 2 * 2, 3)
+    assert image[0, 0].tolist() == [0, 0, 0]  # axial view is centered vertically
+    assert image[0, 6].tolist() == [255, 0, 0]
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from visualdataset.args_types import Matcher
+from visualdataset.brain_dataset import brain_dataset
+from visualdataset.timing import StageTimer, TIMING_NAME, timed
+
+
+def test_timing_report(tmp_path: Path):
+    input_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    (input_dir / 'sub-0').mkdir(parents=True)
+    output_dir.mkdir()
+    nib.save(nib.Nifti1Image(np.arange(60, dtype=np.int16).reshape(3, 4, 5), np.eye(4)), input_dir / 'sub-0/T1.nii')
+    matchers = [Matcher(key='type', value='T1', regex=r'T1\.nii$')]
+    brain_dataset(input_dir, output_dir, matchers, [], [], {}, None, timer=StageTimer())
+
+    report = json.loads((output_dir / TIMING_NAME).read_text())
+    assert report['version'] == 1
+    assert {'index', 'validate', 'sidecars', 'manifest'} <= report['stages'].keys()
+    assert 'snapshot' not in report['stages']  # the directory is walked during the index stage
+    assert all(stage['wall'] >= 0 and stage['cpu'] >= 0 for stage in report['stages'].values())
+    [file] = report['files']
+    assert file['path'] == str(input_dir / 'sub-0/T1.nii')
+    assert file['voxels'] == 60
+    assert file['bytes_read'] == (input_dir / 'sub-0/T1.nii').stat().st_size
+    assert file['wall'] >= file['decode'] + file['reduce']
+
+
+def test_no_timing_report(tmp_path: Path):
+    input_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    input_dir.mkdir()
+    output_dir.mkdir()
+    nib.save(nib.Nifti1Image(np.zeros((2, 2, 2), dtype=np.int16), np.eye(4)), input_dir / 'T1.nii')
+    brain_dataset(input_dir, output_dir, [Matcher(key='type', value='T1', regex=r'T1\.nii$')], [], [], {}, None)
+    assert not (output_dir / TIMING_NAME).exists()
+
+
+def test_timed():
+    timer = StageTimer()
+    assert list(timed(range(3), timer, 'count')) == [0, 1, 2]
+    assert timer.stages['count']['wall'] >= 0
+    assert 'cpu' not in timer.stages['count']
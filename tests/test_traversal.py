@@ -0,0 +1,139 @@
+from pathlib import Path
+
+import os
+
+import pytest
+from pytest_unordered import unordered
+
+from tests.example_matchers import FETAL_ATLAS_MATCHERS
+from visualdataset.index_brain_dir import volume_snapshot
+from visualdataset.regex_literals import parent_directory_suffix, path_depth
+from visualdataset.args_types import Matcher
+from visualdataset.traversal import TraversalFilter, DirectoryHint, directory_hints
+from visualdataset.wellknown import FREESURFER_MATCHERS, MALPEM_MATCHERS
+
+FILES = [
+    'sub-1/mri/T1.mgz',
+    'sub-1/mri/orig/001.mgz',
+    'sub-1/surf/lh.white',
+    'sub-1/label/lh.cortex.label',
+    'sub-1/label/deep/lh.mgz',
+    'sub-2/mri/T1.mgz',
+    'sub-2/mri/aseg.mgz',
+    'sub-2/stats/aseg.stats',
+    'other/scan.nii.gz',
+]
+
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    for name in FILES:
+        p = tmp_path / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.touch()
+    return tmp_path
+
+
+def _scan(tree: Path, traversal: TraversalFilter) -> tuple[list[str], int]:
+    snapshot = volume_snapshot(tree, traversal=traversal)
+    return list(map(str, snapshot.matching_files())), snapshot.directories_listed
+
+
+@pytest.mark.parametrize('include, exclude, expected', [
+    ([], [], [f for f in FILES if f.endswith(('.mgz', '.nii.gz'))]),
+    ([], ['orig', 'label'], ['sub-1/mri/T1.mgz', 'sub-2/mri/T1.mgz', 'sub-2/mri/aseg.mgz', 'other/scan.nii.gz']),
+    ([], ['sub-*/mri/*'], ['sub-1/label/deep/lh.mgz', 'other/scan.nii.gz']),
+    ([], ['aseg.mgz', '/other'], ['sub-1/mri/T1.mgz', 'sub-1/mri/orig/001.mgz', 'sub-1/label/deep/lh.mgz',
+                                  'sub-2/mri/T1.mgz']),
+    (['sub-*/mri'], [], ['sub-1/mri/T1.mgz', 'sub-1/mri/orig/001.mgz', 'sub-2/mri/T1.mgz', 'sub-2/mri/aseg.mgz']),
+    (['sub-2/**/*.mgz', 'scan.nii.gz'], [], ['sub-2/mri/T1.mgz', 'sub-2/mri/aseg.mgz', 'other/scan.nii.gz']),
+])
+def test_include_exclude(tree: Path, include: list[str], exclude: list[str], expected: list[str]):
+    actual, _ = _scan(tree, TraversalFilter(include, exclude))
+    assert actual == unordered(expected)
+
+
+def test_include_prunes_directories(tree: Path):
+    _, listed = _scan(tree, TraversalFilter(include=['sub-1/mri']))
+    assert listed == 4  # ., sub-1, sub-1/mri, sub-1/mri/orig
+
+
+def test_directory_hints(tree: Path):
+    matchers = [
+        Matcher(key='type', value='T1', regex=r'^sub-[0-9]+/mri/T1\.mgz$'),
+        Matcher(key='type', value='labels', regex=r'^sub-[0-9]+/mri/[^/]+\.mgz$'),
+        Matcher(key='type', value='other', regex=r'^other/scan\.nii\.gz$'),
+    ]
+    hints = directory_hints(matchers)
+    assert hints == (DirectoryHint(1, 'other'), DirectoryHint(2, 'mri'))
+    actual, listed = _scan(tree, TraversalFilter(hints=hints))
+    assert actual == unordered(['sub-1/mri/T1.mgz', 'sub-2/mri/T1.mgz', 'sub-2/mri/aseg.mgz', 'other/scan.nii.gz'])
+    assert listed == 6  # ., sub-1, sub-1/mri, sub-2, sub-2/mri, other
+
+    assert directory_hints(FREESURFER_MATCHERS) == (DirectoryHint(None, 'mri'),)
+    assert directory_hints(MALPEM_MATCHERS) is None
+    assert directory_hints(FETAL_ATLAS_MATCHERS) is None
+
+
+def test_directory_hints_keep_matched_subtrees(tmp_path: Path):
+    for name in ['mri/T1.mgz', 'sub-01/mri/T1.mgz', 'sub-01/xmri/T1.mgz', 'sub-01/mri/orig/T1.mgz']:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).touch()
+    matchers = [
+        Matcher(key='type', value='T1', regex=r'^mri/T1\.mgz$'),
+        Matcher(key='type', value='T1', regex=r'^[^/]+/mri/T1\.mgz$'),
+    ]
+    hints = directory_hints(matchers)
+    assert hints == (DirectoryHint(1, 'mri'), DirectoryHint(2, 'mri'))
+    actual, _ = _scan(tmp_path, TraversalFilter(hints=hints))
+    assert actual == unordered(['mri/T1.mgz', 'sub-01/mri/T1.mgz', 'sub-01/xmri/T1.mgz'])
+
+    actual, _ = _scan(tmp_path, TraversalFilter(hints=directory_hints(FREESURFER_MATCHERS)))
+    assert actual == unordered(['mri/T1.mgz', 'sub-01/mri/T1.mgz', 'sub-01/xmri/T1.mgz'])
+
+
+def test_directory_hints_of_any_depth(tmp_path: Path, monkeypatch):
+    files = ['mri/T1.mgz', 'surf/lh.white', 'sub-01/mri/T1.mgz', 'sub-01/mri/orig/001.mgz', 'sub-01/surf/lh.white',
+             'sub-01/label/lh.cortex.label', 'sub-01/stats/aseg.stats', 'sub-01/scripts/recon-all.log',
+             'sub-01/touch/T1.touch', 'sub-02/label/nested/mri/T1.mgz']
+    for name in files:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).touch()
+    if os.stat(tmp_path / 'sub-01').st_nlink != 8:
+        pytest.skip('filesystem does not count links to directories')
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: listed.append(os.path.relpath(path, tmp_path)) or scandir(path))
+
+    actual, _ = _scan(tmp_path, TraversalFilter(hints=directory_hints(FREESURFER_MATCHERS)))
+    assert actual == unordered(['mri/T1.mgz', 'sub-01/mri/T1.mgz', 'sub-02/label/nested/mri/T1.mgz'])
+    assert listed == unordered(['.', 'mri', 'sub-01', 'sub-01/mri', 'sub-02', 'sub-02/label', 'sub-02/label/nested',
+                                'sub-02/label/nested/mri'])
+
+
+@pytest.mark.parametrize('regex, expected', [
+    (r'mri/T1\.(mgz|nii|nii\.gz)$', 'mri'),
+    (r'sub-\d+/anat/[^/]+_T1w\.nii\.gz$', '/anat'),
+    (r'mri/T1\.mgz', None),
+    (r'mri/.*\.mgz$', None),
+    (r'mri/[\w.]+$', None),
+    (r'[a-z]/T1\.mgz$', None),
+    (r'(?i)mri/T1\.mgz$', None),
+])
+def test_parent_directory_suffix(regex: str, expected):
+    assert parent_directory_suffix(regex) == expected
+
+
+@pytest.mark.parametrize('regex, expected', [
+    (r'^sub-[0-9]+/mri/T1\.mgz$', 2),
+    (r'^T1\.mgz$', 0),
+    (r'^[^/]+/anat/[a-z_-]+\.nii\.gz$', 2),
+    (r'^sub-\d+/T1\.mgz$', None),  # errs on the side of \d matching /,
+    (r'mri/T1\.mgz$', None),
+    (r'^mri/T1\.mgz', None),
+    (r'^.*/T1\.mgz$', None),
+    (r'^(a|b/c)/T1\.mgz$', None),
+    (r'^\W/T1\.mgz$', None),
+])
+def test_path_depth(regex: str, expected):
+    assert path_depth(regex) == expected
@@ -3,7 +3,7 @@ from pytest_unordered import unordered
 
 from visualdataset.manifest import OptionsLink, VisualDatasetFile
 from visualdataset.options import ChrisViewerFileOptions, NiivueVolumeSettings
-from visualdataset.validate import dict_is_subset, check_indexed_file_has_options
+from visualdataset.validate import dict_is_subset, check_indexed_file_has_options, check_index_has_options, OptionsIndex
 
 
 def test_check_indexed_file_has_options_works():
@@ -53,6 +53,38 @@ def test_check_indexed_file_has_options_warnings():
     assert check_indexed_file_has_options(file, options) == unordered(expected)
 
 
+def test_check_index_has_options_groups_files():
+    options = [
+        OptionsLink(match={'type': 'MRI'}, options=ChrisViewerFileOptions(name='MRI')),
+        OptionsLink(match={'type': 'MRI', 'creator': 'me'}, options=ChrisViewerFileOptions(name='My MRI')),
+    ]
+    index = [
+        VisualDatasetFile(path='a', tags={'type': 'MRI', 'creator': 'me'}),
+        VisualDatasetFile(path='b', tags={'type': 'MRI'}),
+        VisualDatasetFile(path='c', tags={'creator': 'me', 'type': 'MRI'}),
+        *(VisualDatasetFile(path=f'u{i}', tags={'type': 'CT'}) for i in range(5)),
+        VisualDatasetFile(path='d', tags={'creator': 'you'}),
+    ]
+    assert check_index_has_options(index, options) == [
+        '`name` was defined 2 times for 2 files, e.g. "a", "c"',
+        '`name` is unset for 6 files, e.g. "u0", "u1", "u2"',
+    ]
+    assert check_index_has_options(index[:1], options) == check_indexed_file_has_options(index[0], options)
+
+
+def test_options_index():
+    options = [
+        OptionsLink(match={}, options=ChrisViewerFileOptions()),
+        OptionsLink(match={'a': '1', 'b': '2'}, options=ChrisViewerFileOptions()),
+        OptionsLink(match={'a': '1'}, options=ChrisViewerFileOptions()),
+        OptionsLink(match={'b': '1'}, options=ChrisViewerFileOptions()),
+    ]
+    options_index = OptionsIndex(options)
+    for tags in [{}, {'a': '1'}, {'a': '1', 'b': '2'}, {'a': '1', 'b': '1', 'c': '3'}, {'b': '2'}]:
+        expected = tuple(i for i, o in enumerate(options) if dict_is_subset(o.match, tags))
+        assert options_index.matching(tags) == expected
+
+
 @pytest.mark.parametrize(
     'a, b, expected',
     [
@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from visualdataset.volume_sidecar import get_range, compute_settings, SidecarOptions, fit_memory_budget
+
+
+@pytest.mark.parametrize('chunk_size', [1, 1000, 1024 * 1024])
+def test_get_range_nifti_scaled(tmp_path: Path, chunk_size: int):
+    rng = np.random.default_rng(42)
+    data = rng.integers(-1000, 3000, size=(7, 5, 6, 3), dtype=np.int16)
+    img = nib.Nifti1Image(data, np.eye(4))
+    img.header.set_slope_inter(-0.5, 10.0)
+    path = tmp_path / 'scaled.nii.gz'
+    nib.save(img, path)
+
+    expected = nib.load(path).get_fdata()
+    assert get_range(path, chunk_size) == (np.min(expected), np.max(expected))
+
+
+def test_get_range_mgz(tmp_path: Path):
+    data = np.arange(4 * 4 * 4, dtype=np.int32).reshape(4, 4, 4) - 7
+    path = tmp_path / 'aseg.mgz'
+    nib.save(nib.MGHImage(data, np.eye(4)), path)
+    assert get_range(path, 16) == (-7.0, 56.0)
+
+
+def test_get_range_ignores_nan(tmp_path: Path):
+    data = np.linspace(-1, 1, 27, dtype=np.float32).reshape(3, 3, 3)
+    data[0, 0, 0] = np.nan
+    data[2, 2, 2] = np.nan
+    path = tmp_path / 'float.nii'
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+    assert get_range(path, 1) == (float(np.nanmin(data)), float(np.nanmax(data)))
+
+
+
+def test_no_finite_values(tmp_path: Path):
+    path = tmp_path / 'nan.nii'
+    nib.save(nib.Nifti1Image(np.full((3, 3, 3), np.nan, dtype=np.float32), np.eye(4)), path)
+    assert all(np.isnan(get_range(path)))
+    options = SidecarOptions(cal_percentiles=(2.0, 98.0), histogram_bins=4, thumbnails=True)
+    assert compute_settings(path, options) == {}
+
+
+@pytest.mark.parametrize(
+    'range_source, cal_min, cal_max, expected',
+    [
+        ('header', 10.0, 20.0, {'cal_min': 10.0, 'cal_max': 20.0}),
+        ('header', 0.0, 0.0, {}),
+        ('auto', 10.0, 20.0, {'cal_min': 10.0, 'cal_max': 20.0}),
+        ('auto', 0.0, 0.0, {'cal_min': 0.0, 'cal_max': 7.0}),
+        ('data', 10.0, 20.0, {'cal_min': 0.0, 'cal_max': 7.0}),
+    ]
+)
+def test_range_source_nifti(tmp_path: Path, range_source: str, cal_min: float, cal_max: float, expected: dict):
+    img = nib.Nifti1Image(np.arange(8, dtype=np.uint8).reshape(2, 2, 2), np.eye(4))
+    img.header['cal_min'] = cal_min
+    img.header['cal_max'] = cal_max
+    path = tmp_path / 'img.nii.gz'
+    nib.save(img, path)
+    assert compute_settings(path, SidecarOptions(range_source=range_source)) == expected
+
+
+def test_range_source_conformed_mgz(tmp_path: Path):
+    path = tmp_path / 'T1.mgz'
+    nib.save(nib.MGHImage(np.full((2, 2, 2), 110, dtype=np.uint8), np.eye(4)), path)
+    assert compute_settings(path, SidecarOptions(range_source='auto')) == {'cal_min': 0.0, 'cal_max': 255.0}
+    assert compute_settings(path, SidecarOptions(range_source='data')) == {'cal_min': 110.0, 'cal_max': 110.0}
+
+
+def test_robust_range_and_histogram(tmp_path: Path):
+    data = np.zeros((10, 10, 10), dtype=np.int16)
+    data[:, :, 5:] = 100
+    data[0, 0, 0] = 30000  # hot voxel
+    path = tmp_path / 'hot.nii.gz'
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+
+    options = SidecarOptions(chunk_size=200, cal_percentiles=(2, 98), histogram_bins=3)
+    actual = compute_settings(path, options)
+    assert actual['cal_min'] == 0.0
+    assert actual['cal_max'] == 100.0
+    assert actual['histogram'] == {'min': 0.0, 'max': 30000.0, 'counts': [999, 0, 1]}
+
+
+def test_label_statistics(tmp_path: Path):
+    data = np.zeros((4, 4, 4), dtype=np.int32)
+    data[0] = 2
+    data[1, :2] = 1035
+    path = tmp_path / 'aparc+aseg.mgz'
+    nib.save(nib.MGHImage(data, np.diag([2, 2, 2, 1])), path)
+
+    actual = compute_settings(path, SidecarOptions(chunk_size=64), is_label=True)
+    assert actual['labels'] == {
+        '0': {'voxels': 40, 'volume': 320.0},
+        '2': {'voxels': 16, 'volume': 128.0},
+        '1035': {'voxels': 8, 'volume': 64.0},
+    }
+    assert 'labels' not in compute_settings(path, SidecarOptions(chunk_size=64))
+
+
+def test_label_statistics_not_integral(tmp_path: Path):
+    path = tmp_path / 'prob.nii.gz'
+    nib.save(nib.Nifti1Image(np.linspace(0, 1, 8, dtype=np.float32).reshape(2, 2, 2), np.eye(4)), path)
+    assert 'labels' not in compute_settings(path, is_label=True)
+
+
+def test_fit_memory_budget(tmp_path: Path):
+    path = tmp_path / 'big.nii'
+    data = np.arange(64 * 64 * 64, dtype=np.float32).reshape(64, 64, 64)
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+    options = SidecarOptions(chunk_size=1024 * 1024, cal_percentiles=(2.0, 98.0))
+
+    unchanged, memory = fit_memory_budget(path, options, 1024 ** 3)
+    assert unchanged == options
+    smaller, smaller_memory = fit_memory_budget(path, options, memory // 2)
+    assert smaller.chunk_size < options.chunk_size
+    assert smaller_memory <= memory // 2
+    one_plane, _ = fit_memory_budget(path, options, 1)
+    assert one_plane.chunk_size == 64 * 64 * 4
+    assert compute_settings(path, one_plane) == compute_settings(path, options)
@@ -1,15 +1,24 @@
 #!/usr/bin/env python
-import os.path
+"""
+Entry point of the plugin.
+
+Only the standard library and ``chris_plugin`` are imported at the top of this module, so that
+``--help`` and ``--json`` (which ChRIS runs to get the plugin's descriptor) are fast.
+Everything else is imported by the functions which use it.
+"""
+import sys
 from argparse import ArgumentParser, Namespace, ArgumentDefaultsHelpFormatter
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence, TYPE_CHECKING
 
 from chris_plugin import chris_plugin
-from pydantic import TypeAdapter
 
 from visualdataset import DISPLAY_TITLE
-from visualdataset.json_arg_parser import parse_args
-from visualdataset.brain_dataset import brain_dataset
+
+if TYPE_CHECKING:
+    from visualdataset.args_types import Matcher
+    from visualdataset.timing import StageTimer
+    from visualdataset.traversal import TraversalFilter
 
 parser = ArgumentParser(description='Prepares a dataset for use with the ChRIS_ui '
                                     '"Visual Datasets" feature.',
@@ -29,10 +38,79 @@ parser.add_argument('--first-run-tags', type=str, default='{}',
                     help='Tags to show on first run as a stringified JSON object')
 parser.add_argument('--readme', type=str,
                     help='README file content')
-
-_LIST_ADAPTER = TypeAdapter(list[str])
-_DICT_ADAPTER = TypeAdapter(dict[str, str])
-
+parser.add_argument('--jobs', type=int, default=0,
+                    help='Number of volumes to process in parallel (0: the CPU limit of the container)')
+parser.add_argument('--scan-threads', type=int, default=1,
+                    help='Number of directories to list concurrently while scanning inputdir, '
+                         'for high-latency filesystems such as NFS')
+parser.add_argument('--include', type=str, default='',
+                    help='Comma-separated glob patterns of the directories and files of inputdir to index, '
+                         'e.g. "sub-*/mri". Other directories are not scanned')
+parser.add_argument('--exclude', type=str, default='',
+                    help='Comma-separated glob patterns of the directories and files of inputdir to skip, '
+                         'e.g. "surf,label,scripts"')
+parser.add_argument('--auto-prune', action='store_true',
+                    help='Skip directories which cannot contain a matched file, without scanning them. '
+                         'Only has an effect if every matcher is anchored with a fixed number of directories, '
+                         'e.g. "^[^/]+/mri/T1\\.mgz$", or only matches files in a directory with a known name, '
+                         'e.g. "mri/T1\\.mgz$" (as with --mode freesurfer-7.3.3)')
+parser.add_argument('--pipeline', action='store_true',
+                    help='Start writing outputs while inputdir is still being scanned')
+parser.add_argument('--incremental', action='store_true',
+                    help='Update the outputs of a previous run with --incremental in outputdir: only process new '
+                         'or changed volumes, and remove the outputs of volumes which are gone')
+parser.add_argument('--compact-manifest', action='store_true',
+                    help='Also write the manifest in a compact format, which is smaller and faster to parse '
+                         'for datasets with many files')
+parser.add_argument('--precompress', type=str, default='',
+                    help='Comma-separated encodings (gzip, zstd) of compressed copies of the manifest, sidecars '
+                         'and colormaps to write next to them, e.g. "gzip,zstd"')
+parser.add_argument('--precompress-level', type=int, default=0,
+                    help='Compression level of --precompress (0: a high level which depends on the encoding)')
+parser.add_argument('--precompress-only', action='store_true',
+                    help='Remove the files of which compressed copies were written by --precompress')
+parser.add_argument('--chunk-size', type=int, default=4,
+                    help='Maximum amount of voxel data (in MiB) to hold in memory at once while reading a volume')
+parser.add_argument('--max-memory', type=int, default=0,
+                    help='Memory budget (in MiB) for reading volumes in all --jobs at once, estimated from their '
+                         'headers. Volumes are processed largest first (in the order they are found with '
+                         '--pipeline), as many at a time as fit, and volumes which do not fit on their own are '
+                         'read in smaller chunks than --chunk-size. The memory of the processes themselves is '
+                         'not included (0: no budget)')
+parser.add_argument('--range-source', type=str, default='data', choices=['header', 'data', 'auto'],
+                    help='Get the display range of volumes from their headers, their data, '
+                         'or their headers when valid and otherwise their data')
+parser.add_argument('--cal-min-percentile', type=float, default=0.0,
+                    help='Percentile of voxel values to use for cal_min when the range comes from the data')
+parser.add_argument('--cal-max-percentile', type=float, default=100.0,
+                    help='Percentile of voxel values to use for cal_max when the range comes from the data')
+parser.add_argument('--histogram-bins', type=int, default=0,
+                    help='Number of bins of a histogram of voxel values to write into sidecars (0: no histogram)')
+parser.add_argument('--decompression', type=str, default='auto', choices=['auto', 'isal', 'zlib-ng', 'gzip'],
+                    help='Implementation of gzip to use for reading .nii.gz and .mgz files '
+                         '(auto: the fastest one installed)')
+parser.add_argument('--decompression-threads', type=int, default=0,
+                    help='Number of background threads used to decompress each volume (not supported by gzip)')
+parser.add_argument('--previews', type=str, default='',
+                    help='Comma-separated downsampling factors of preview volumes to write next to each volume, '
+                         'e.g. "2,4"')
+parser.add_argument('--thumbnails', action='store_true',
+                    help='Write a PNG image of the axial, coronal and sagittal mid-slices next to each volume')
+parser.add_argument('--prune-colormaps', action='store_true',
+                    help='Only write the colors of the labels which are present in the label volumes using each '
+                         'colormapLabelFile, instead of copying the whole colormap')
+parser.add_argument('--stats-cache', type=str,
+                    help='Directory of a cache of volume statistics to reuse across runs')
+parser.add_argument('--stats-cache-max-size', type=int, default=256,
+                    help='Maximum size (in MiB) of the --stats-cache, least recently used entries are evicted')
+parser.add_argument('--stats-cache-max-age', type=float, default=90,
+                    help='Maximum age (in days) of entries in the --stats-cache')
+parser.add_argument('--timing', action='store_true',
+                    help='Write the time spent on every stage and volume to .chrisvisualdataset.timing.json')
+parser.add_argument('--profile', action='store_true',
+                    help='Profile the run with cProfile, saving the statistics to '
+                         '.chrisvisualdataset.profile.pstats (implies --timing). '
+                         'Use --jobs 1 to include the time spent on every volume')
 
 @chris_plugin(
     parser=parser,
@@ -42,28 +120,140 @@ _DICT_ADAPTER = TypeAdapter(dict[str, str])
     min_cpu_limit='1000m',
 )
 def main(options: Namespace, inputdir: Path, outputdir: Path):
-    matchers, tag_options = parse_args(inputdir, options.mode, options.matchers, options.options)
-    first_run_files = _LIST_ADAPTER.validate_json(options.first_run_files)
-    first_run_tags = _DICT_ADAPTER.validate_json(options.first_run_tags)
+    from visualdataset.timing import StageTimer, PROFILE_NAME, profiled
+
+    timer = StageTimer() if options.timing or options.profile else None
+    with profiled(outputdir / PROFILE_NAME if options.profile else None):
+        _visual_dataset(options, inputdir, outputdir, timer)
+
 
+def _visual_dataset(options: Namespace, inputdir: Path, outputdir: Path, timer: Optional['StageTimer']):
+    from pydantic import TypeAdapter
+
+    from visualdataset.brain_dataset import brain_dataset
+    from visualdataset.index_brain_dir import volume_snapshot
+    from visualdataset.json_arg_parser import parse_args
+    from visualdataset.parallel import cpu_limit
+    from visualdataset.precompress import PrecompressOptions
+    from visualdataset.volume_sidecar import SidecarOptions
+
+    snapshot = volume_snapshot(inputdir, options.scan_threads)
+    matchers, tag_options = parse_args(snapshot, options.mode, options.matchers, options.options)
+    snapshot.set_traversal(_traversal_filter(options, matchers))
+    first_run_files = TypeAdapter(list[str]).validate_json(options.first_run_files)
+    first_run_tags = TypeAdapter(dict[str, str]).validate_json(options.first_run_tags)
+
+    first_run_globs = []
     if not first_run_files:
         if options.mode.lower().startswith('freesurfer'):
-            first_run_files.extend(find_first_matching(inputdir, 'T1.mgz'))
+            first_run_globs.append('T1.mgz')
         elif options.mode.lower().startswith('malpem'):
-            first_run_files.extend(find_first_matching(inputdir, '*_N4_masked.nii.gz'))
-            first_run_files.extend(find_first_matching(inputdir, '*_MALPEM.nii.gz'))
+            first_run_globs.append('*_N4_masked.nii.gz')
+            first_run_globs.append('*_MALPEM.nii.gz')
 
     print(DISPLAY_TITLE, flush=True)
-    brain_dataset(inputdir, outputdir, matchers, tag_options, first_run_files, first_run_tags, options.readme)
+    brain_dataset(inputdir, outputdir, matchers, tag_options, first_run_files, first_run_tags, options.readme,
+                  sidecar_options=SidecarOptions(
+                      chunk_size=options.chunk_size * 1024 * 1024,
+                      range_source=options.range_source,
+                      cal_percentiles=_cal_percentiles(options.cal_min_percentile, options.cal_max_percentile),
+                      histogram_bins=_histogram_bins(options.histogram_bins),
+                      decompression=_check_decompression(options.decompression),
+                      decompression_threads=options.decompression_threads,
+                      preview_factors=_parse_factors(options.previews),
+                      thumbnails=options.thumbnails
+                  ),
+                  jobs=options.jobs or cpu_limit(),
+                  scan_threads=options.scan_threads,
+                  pipeline=options.pipeline,
+                  first_run_globs=first_run_globs,
+                  snapshot=snapshot,
+                  compact_manifest=options.compact_manifest,
+                  incremental=options.incremental,
+                  prune_colormaps=options.prune_colormaps,
+                  precompress=PrecompressOptions(
+                      encodings=_parse_encodings(options.precompress),
+                      level=options.precompress_level or None,
+                      only=options.precompress_only
+                  ),
+                  stats_cache=None if options.stats_cache is None else Path(options.stats_cache),
+                  stats_cache_max_size=options.stats_cache_max_size * 1024 * 1024,
+                  stats_cache_max_age=options.stats_cache_max_age * 24 * 60 * 60,
+                  timer=timer,
+                  max_memory=options.max_memory * 1024 * 1024 or None)
+
+
+def _traversal_filter(options: Namespace, matchers: Sequence['Matcher']) -> Optional['TraversalFilter']:
+    from visualdataset.traversal import TraversalFilter, directory_hints
+
+    include = _parse_list(options.include)
+    exclude = _parse_list(options.exclude)
+    hints = ()
+    if options.auto_prune:
+        hints = directory_hints(matchers)
+        if hints is None:
+            print('Warning: --auto-prune has no effect, because some matchers can match files in any directory')
+            hints = ()
+    if not include and not exclude and not hints:
+        return None
+    return TraversalFilter(include, exclude, hints)
+
+
+def _parse_list(s: str) -> list[str]:
+    return [item.strip() for item in s.split(',') if item.strip()]
+
+
+def _parse_encodings(s: str) -> tuple[str, ...]:
+    from visualdataset.precompress import check_encodings
+
+    encodings = tuple(dict.fromkeys(_parse_list(s)))
+    try:
+        check_encodings(encodings)
+    except ValueError as e:
+        print(f'Invalid value for --precompress: {e}')
+        sys.exit(1)
+    return encodings
+
+
+def _check_decompression(backend: str) -> str:
+    from visualdataset.decompress import resolve_backend
+
+    try:
+        resolve_backend(backend)
+    except ValueError as e:
+        print(f'Invalid value for --decompression: {e}')
+        sys.exit(1)
+    return backend
+
+
+def _parse_factors(s: str) -> tuple[int, ...]:
+    try:
+        factors = tuple(sorted({int(f) for f in s.split(',') if f.strip()}))
+    except ValueError:
+        print(f'Invalid value for --previews: {s}')
+        sys.exit(1)
+    if any(f < 2 for f in factors):
+        print('Invalid value for --previews: factors must be at least 2')
+        sys.exit(1)
+    return factors
+
+
+def _cal_percentiles(cal_min: float, cal_max: float) -> tuple[float, float]:
+    for name, percentile in (('--cal-min-percentile', cal_min), ('--cal-max-percentile', cal_max)):
+        if not 0 <= percentile <= 100:
+            print(f'Invalid value for {name}: {percentile} (must be between 0 and 100)')
+            sys.exit(1)
+    if cal_min > cal_max:
+        print(f'Invalid value for --cal-min-percentile: {cal_min} is greater than --cal-max-percentile {cal_max}')
+        sys.exit(1)
+    return cal_min, cal_max
 
 
-def find_first_matching(input_dir: Path, glob: str) -> list[str]:
-    matches = filter(os.path.isfile, input_dir.rglob(glob))
-    rel = map(lambda p: p.relative_to(input_dir), matches)
-    rel_as_str = map(str, rel)
-    if some := next(rel_as_str, None):
-        return [some]
-    return []
+def _histogram_bins(bins: int) -> int:
+    if bins < 0:
+        print(f'Invalid value for --histogram-bins: {bins} (must be at least 0)')
+        sys.exit(1)
+    return bins
 
 
 if __name__ == '__main__':
@@ -1,16 +1,27 @@
-import shutil
+import collections
+import functools
+import json
 import sys
+import time
 from pathlib import Path
-from typing import Sequence, Optional, Mapping, Set, Iterator
-import importlib.resources
+from typing import Sequence, Optional, Mapping, Set, Iterator, NamedTuple, Iterable, Callable, TypeVar
 
 from tqdm import tqdm
 
 from visualdataset.args_types import Matcher
-from visualdataset.index_brain_dir import index_brain_dir
-from visualdataset.manifest import VisualDatasetFile, OptionsLink, VisualDatasetManifest
-from visualdataset.volume_sidecar import create_sidecar
-from visualdataset.validate import check_indexed_file_has_options, dict_is_subset
+from visualdataset.colormap_registry import ColormapRegistry, load_colormap
+from visualdataset.incremental import IncrementalUpdate
+from visualdataset.index_brain_dir import index_files, volume_snapshot
+from visualdataset.manifest import VisualDatasetFile, OptionsLink, VisualDatasetManifest, IndexedFile, write_manifest
+from visualdataset.parallel import map_ordered, map_streaming, map_scheduled, TaskError
+from visualdataset.precompress import PrecompressOptions, compress_file, read_file
+from visualdataset.snapshot import DirectorySnapshot
+from visualdataset.stats_cache import StatsCache, open_cache, close_caches
+from visualdataset.timing import StageTimer, FileTiming, DecodeTimer, timed
+from visualdataset.volume_sidecar import create_sidecar, SidecarOptions, sidecar_name, fit_memory_budget
+from visualdataset.validate import check_index_has_options, dict_is_subset, OptionsIndex
+
+_T = TypeVar('_T')
 
 
 def brain_dataset(
@@ -20,102 +31,352 @@ def brain_dataset(
         options: Sequence[OptionsLink],
         first_run_files: Sequence[str],
         first_run_tags: Mapping[str, str],
-        readme: Optional[str]
+        readme: Optional[str],
+        sidecar_options: SidecarOptions = SidecarOptions(),
+        jobs: int = 1,
+        scan_threads: int = 1,
+        stats_cache: Optional[Path] = None,
+        stats_cache_max_size: Optional[int] = None,
+        stats_cache_max_age: Optional[float] = None,
+        pipeline: bool = False,
+        first_run_globs: Sequence[str] = (),
+        snapshot: Optional[DirectorySnapshot] = None,
+        compact_manifest: bool = False,
+        incremental: bool = False,
+        precompress: PrecompressOptions = PrecompressOptions(),
+        prune_colormaps: bool = False,
+        timer: Optional[StageTimer] = None,
+        max_memory: Optional[int] = None
 ):
-    with tqdm(desc='Scanning input directory...'):
-        index = [i.model_copy(update={'has_sidecar': True}) for i in index_brain_dir(input_dir, matchers)]
+    """
+    :param pipeline: write sidecars while the input directory is still being scanned, instead of after.
+                     The outputs are the same, but errors about the matched files are only reported at the end.
+    :param first_run_globs: also show the first file matching each of these file name patterns on first run
+    :param snapshot: snapshot of ``input_dir`` made by :func:`volume_snapshot`, shared with the caller so
+                     that the input directory is only walked once
+    :param compact_manifest: also write the manifest in the compact format (see ``CompactManifest``)
+    :param incremental: update the outputs of a previous incremental run in ``output_dir``, only writing the
+                        outputs of new or changed volumes, and removing the outputs of volumes which are gone
+                        (see :mod:`visualdataset.incremental`)
+    :param precompress: write compressed copies of the JSON outputs (see :mod:`visualdataset.precompress`)
+    :param prune_colormaps: only write the colors of the labels which are present in the label volumes
+                            of each ``colormapLabelFile``
+    :param timer: if given, the timing of every stage and volume is added to it and written to the output
+                  directory (see :mod:`visualdataset.timing`)
+    :param max_memory: memory budget (in bytes) for reading volumes in all ``jobs`` at once. Volumes are
+                       processed largest first (or in the order they are found, with ``pipeline``), as many
+                       at a time as fit, and volumes which would not fit on their own are read in smaller
+                       chunks. The memory needed by each volume is estimated from its header
+                       (see :func:`visualdataset.volume_sidecar.memory_footprint`).
+    """
+    timing = timer is not None
+    if timer is None:
+        timer = StageTimer()
+    if snapshot is None:
+        snapshot = volume_snapshot(input_dir, scan_threads)
+
+    options_index = OptionsIndex(options)
+    update = IncrementalUpdate(output_dir, sidecar_options, precompress) if incremental else None
+    colormaps = ColormapRegistry(snapshot)
+    unchanged_labels: list[tuple[Path, Path]] = []
+    """
+    Colormaps and sidecar paths of label volumes which were skipped by ``update``.
+    """
+
+    def tasks_of(files: Iterable[IndexedFile]) -> Iterator[_SidecarTask]:
+        for file in files:
+            colormaplabel = colormaplabel_file_for(file.tags, options, options_index)
+            colormap = None if colormaplabel is None else colormaps.path(colormaplabel)
+            if update is not None and update.is_unchanged(file.path, input_dir / file.path, colormaplabel):
+                if colormap is not None and prune_colormaps:
+                    unchanged_labels.append((colormap, output_dir / sidecar_name(file.path)))
+                continue
+            task = _SidecarTask(
+                input_dir / file.path, output_dir / file.path, sidecar_options, stats_cache, colormap, precompress,
+                timing
+            )
+            yield task if max_memory is None else _within_budget(task, max_memory)
+
+    def check_index(index: Sequence[IndexedFile]) -> Sequence[int]:
+        globbed = (path for glob in first_run_globs for path in find_first_matching(snapshot, glob))
+        with timer.stage('validate'):
+            return _check_index(index, matchers, options, [*first_run_files, *globbed], first_run_tags)
+
+    if pipeline:
+        check_colormaplabel_files(options, colormaps)
+        index = []
+        scanned = _appended_to(index, timed(_scan(snapshot, matchers), timer, 'index'))
+        mapper = map_streaming
+        if max_memory is not None:
+            mapper = functools.partial(map_streaming, cost=_task_memory, budget=max_memory)
+        with timer.stage('sidecars'):
+            written = _write_sidecars(mapper, tasks_of(scanned), jobs)
+        first_run_index_nums = check_index(index)
+    else:
+        with tqdm(desc='Scanning input directory...'), timer.stage('index'):
+            index = list(_scan(snapshot, matchers))
+        first_run_index_nums = check_index(index)
+        check_colormaplabel_files(options, colormaps)
+        mapper = map_ordered
+        if max_memory is not None:
+            mapper = functools.partial(map_scheduled, cost=_task_memory, budget=max_memory)
+        with timer.stage('sidecars'):
+            written = _write_sidecars(mapper, list(tasks_of(index)), jobs)
+    timer.files.extend(result.timing for result in written if result.timing is not None)
+
+    with timer.stage('colormaps'):
+        found = [*(result.labels for result in written), *_read_labels(unchanged_labels)]
+        labels = _labels_by_colormap(found) if prune_colormaps else {}
+        for file in dict.fromkeys(colormaplabel_files_of(options)):
+            colormaps.write(file, output_dir, labels.get(colormaps.path(file)))
+
+    if update is not None:
+        with timer.stage('incremental'):
+            deleted = update.remove_deleted()
+        print(f'Incremental update: {update.unchanged} unchanged, '
+              f'{len(index) - update.unchanged} new or changed, {deleted} removed')
+
+    if stats_cache is not None:
+        with timer.stage('stats_cache'):
+            close_caches()
+            cache = StatsCache(stats_cache)
+            cache.evict(stats_cache_max_size, stats_cache_max_age)
+            cache.close()
+
+    with timer.stage('manifest'):
+        tags = aggregate_tags(index)
+        manifest_path = output_dir / '.chrisvisualdataset.tagmanifest.json'
+        with manifest_path.open('w', encoding='utf-8') as f:
+            write_manifest(f, tags, index, options, first_run_index_nums)
+    to_compress = [manifest_path, *(output_dir / file for file in dict.fromkeys(colormaplabel_files_of(options)))]
+    if compact_manifest:
+        with timer.stage('compact_manifest'):
+            manifest = VisualDatasetManifest(
+                tags=tags,
+                files=[file.to_model() for file in index],
+                options=options,
+                first_run_files=first_run_index_nums
+            )
+            compact_path = output_dir / '.chrisvisualdataset.tagmanifest.compact.json'
+            compact_path.write_text(manifest.sort().compact().model_dump_json())
+        to_compress.append(compact_path)
+    if precompress.encodings:
+        with timer.stage('precompress'):
+            compress = functools.partial(compress_file, options=precompress)
+            map_ordered(compress, to_compress, jobs, desc='Compressing manifest and colormaps')
+
+    if readme is not None:
+        readme_path = output_dir / 'README.txt'
+        readme_path.write_text(readme)
+
+    if update is not None:
+        update.save()
+    if timing:
+        timer.write(output_dir)
+
+
+class _SidecarTask(NamedTuple):
+    input_path: Path
+    output_path: Path
+    options: SidecarOptions
+    stats_cache: Optional[Path]
+    colormaplabel: Optional[Path]
+    """
+    Path of the ``colormapLabelFile`` of a label volume.
+    """
+    precompress: PrecompressOptions
+    timing: bool
+    """
+    Whether to measure the time spent on the volume.
+    """
+    memory: int = 0
+    """
+    Estimated peak memory (in bytes) needed to process the volume, see ``max_memory``.
+    """
+
+
+class _LabelsFound(NamedTuple):
+    colormap: Path
+    labels: Optional[frozenset[int]]
+    """
+    Label values present in a label volume, or None if unknown (when the volume's values are not integers).
+    """
+
+
+class _SidecarResult(NamedTuple):
+    labels: Optional[_LabelsFound]
+    """
+    Labels present in the volume, if it is a label volume.
+    """
+    timing: Optional[FileTiming]
+
+
+def _scan(snapshot: DirectorySnapshot, matchers: Sequence[Matcher]) -> Iterator[IndexedFile]:
+    return index_files(snapshot.root, matchers, snapshot=snapshot, has_sidecar=True)
+
 
+def _appended_to(collected: list[_T], items: Iterable[_T]) -> Iterator[_T]:
+    for item in items:
+        collected.append(item)
+        yield item
+
+
+def _check_index(
+        index: Sequence[IndexedFile],
+        matchers: Sequence[Matcher],
+        options: Sequence[OptionsLink],
+        first_run_files: Sequence[str],
+        first_run_tags: Mapping[str, str]
+) -> Sequence[int]:
+    """
+    Print warnings about the matched files and exit if they are unusable.
+
+    :return: index numbers of the ``first_run_files``
+    """
     if not index:
         print(f'Error: nothing matched for: {[m.regex for m in matchers]}')
         sys.exit(1)
 
-    for file in index:
-        for warning_message in check_indexed_file_has_options(file, options):
-            print(warning_message)
+    for warning_message in check_index_has_options(index, options):
+        print(warning_message)
 
-    first_run_index_nums = find_first_run_files(input_dir, index, first_run_files)
+    first_run_index_nums = find_first_run_files(index, first_run_files)
     first_run_file_index = (index[i] for i in first_run_index_nums)
     first_run_known_tags = (file.tags for file in first_run_file_index)
     if not all(dict_is_subset(first_run_tags, tags) for tags in first_run_known_tags):
         print('Error: value for --first-run-tags is not a subset of every matched tag '
               'for the files of --first-run-files')
         sys.exit(1)
+    return first_run_index_nums
 
-    copy_colormaplabel_files(options, input_dir, output_dir)
 
-    with tqdm(index, desc='Writing outputs') as pbar:
-        for file in pbar:
-            output_path = output_dir / file.path
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            sidecar_path = output_path.with_suffix(output_path.suffix + '.chrisvisualdataset.volume.json')
-            create_sidecar(input_dir / file.path, sidecar_path)
+def _write_sidecars(mapper: Callable[..., list], tasks: Iterable[_SidecarTask], jobs: int
+                    ) -> list[_SidecarResult]:
+    try:
+        return mapper(_write_sidecar, tasks, jobs, desc='Writing outputs', name=_task_name)
+    except TaskError as e:
+        print(f'Error: failed to create sidecar for {e}')
+        sys.exit(1)
 
-    manifest = VisualDatasetManifest(
-        tags=aggregate_tags(index),
-        files=index,
-        options=options,
-        first_run_files=first_run_index_nums
-    )
 
-    manifest_path = output_dir / '.chrisvisualdataset.tagmanifest.json'
-    manifest_path.write_text(manifest.sort().model_dump_json())
+def _write_sidecar(task: _SidecarTask) -> _SidecarResult:
+    start = time.perf_counter()
+    task.output_path.parent.mkdir(parents=True, exist_ok=True)
+    sidecar_path = task.output_path.with_name(sidecar_name(task.output_path.name))
+    cache = None if task.stats_cache is None else open_cache(task.stats_cache)
+    colormap = None
+    if task.options.thumbnails and task.colormaplabel is not None:
+        colormap = load_colormap(task.colormaplabel)
+    decode_timer = DecodeTimer() if task.timing else None
+    sidecar = create_sidecar(task.input_path, sidecar_path, task.options, cache,
+                             is_label=task.colormaplabel is not None, colormap=colormap, timer=decode_timer)
+    compress_file(sidecar_path, task.precompress)
+    labels = None if task.colormaplabel is None else _LabelsFound(task.colormaplabel, _present_labels(sidecar))
+    timing = None
+    if decode_timer is not None:
+        timing = FileTiming(
+            path=str(task.input_path),
+            wall=time.perf_counter() - start,
+            decode=decode_timer.decode,
+            reduce=decode_timer.reduce,
+            bytes_read=task.input_path.stat().st_size if decode_timer.voxels else 0,
+            voxels=decode_timer.voxels
+        )
+    return _SidecarResult(labels, timing)
+
+
+def _present_labels(sidecar: Mapping) -> Optional[frozenset[int]]:
+    labels = sidecar.get('labels')
+    return None if labels is None else frozenset(map(int, labels))
+
+
+def _read_labels(sidecars: Iterable[tuple[Path, Path]]) -> Iterator[_LabelsFound]:
+    for colormap, sidecar in sidecars:
+        yield _LabelsFound(colormap, _present_labels(json.loads(read_file(sidecar))))
 
-    if readme is not None:
-        readme_path = output_dir / 'README.txt'
-        readme_path.write_text(readme)
+
+def _labels_by_colormap(found: Iterable[Optional[_LabelsFound]]) -> dict[Path, Optional[set[int]]]:
+    """
+    :return: labels present in the label volumes of each colormap, or None if unknown for some of its volumes
+    """
+    labels: dict[Path, Optional[set[int]]] = {}
+    for colormap, present in filter(None, found):
+        if present is None:
+            labels[colormap] = None
+        elif colormap not in labels:
+            labels[colormap] = set(present)
+        elif labels[colormap] is not None:
+            labels[colormap].update(present)
+    return labels
+
+
+def _task_name(task: _SidecarTask) -> str:
+    return str(task.input_path)
+
+
+def _task_memory(task: _SidecarTask) -> int:
+    return task.memory
+
+
+def _within_budget(task: _SidecarTask, budget: int) -> _SidecarTask:
+    try:
+        options, memory = fit_memory_budget(task.input_path, task.options, budget)
+    except Exception:
+        return task  # reported by _write_sidecars, when the task fails to read the volume
+    return task._replace(options=options, memory=memory)
 
 
-def aggregate_tags(index: Sequence[VisualDatasetFile]) -> Mapping[str, Set[str]]:
+def aggregate_tags(index: Sequence[IndexedFile | VisualDatasetFile]) -> Mapping[str, Set[str]]:
     """
     Get all tag and all of their possible values.
     """
-    tags = {}
-    for file in index:
-        for key, value in file.tags.items():
-            if key not in tags:
-                tags[key] = set()
+    tags = collections.defaultdict(set)
+    distinct_tags = {id(file.tags): file.tags for file in index}
+    for file_tags in distinct_tags.values():
+        for key, value in file_tags.items():
             tags[key].add(value)
-    return tags
+    return dict(tags)
 
 
 def find_first_run_files(
-        input_dir: Path,
-        index: Sequence[VisualDatasetFile],
+        index: Sequence[IndexedFile | VisualDatasetFile],
         first_run_files: Sequence[str]
 ) -> Sequence[int]:
     """
     Find all elements of ``first_run_files`` as paths in ``index``, then return a list of their array index numbers.
     """
     first_run_index_nums = []
-    indexed_paths = [str(file.path) for file in index]
+    indexed_paths = {}
+    for i, file in enumerate(index):
+        indexed_paths.setdefault(str(file.path), i)
     for file in first_run_files:
         try:
-            first_run_index_nums.append(indexed_paths.index(file))
-        except ValueError:
+            first_run_index_nums.append(indexed_paths[file])
+        except KeyError:
             print(f'File was not matched: {file}')
             sys.exit(1)
     return first_run_index_nums
 
 
-def copy_colormaplabel_files(options: Sequence[OptionsLink], input_dir: Path, output_dir: Path):
-    for file in colormaplabel_files_of(options):
-        shutil.copy(resolve_colormaplabel(file, input_dir), output_dir / file)
+def find_first_matching(snapshot: DirectorySnapshot, glob: str) -> list[str]:
+    if some := next(snapshot.glob(glob), None):
+        return [some]
+    return []
 
 
-def resolve_colormaplabel(file: str, input_dir: Path) -> Path:
+def check_colormaplabel_files(options: Sequence[OptionsLink], colormaps: ColormapRegistry):
     """
-    If ``file`` is found in ``input_dir``, return its path.
-    Else, look for the file in this package's files.
+    Check that every ``colormapLabelFile`` can be found and is a valid NiiVue label colormap.
     """
-    path = input_dir / file
-    if path.is_file():
-        return path
-    trav = importlib.resources.files(__package__).joinpath('colormaps', file)
-    if trav.is_file():
-        with importlib.resources.as_file(trav) as trav_path:
-            return trav_path
-    print(f'colormapLabel not found: "{file}"')
-    sys.exit(1)
+    for file in dict.fromkeys(colormaplabel_files_of(options)):
+        try:
+            colormaps.load(file)
+        except FileNotFoundError:
+            print(f'colormapLabel not found: "{file}"')
+            sys.exit(1)
+        except ValueError as e:
+            print(f'Invalid colormapLabel "{file}": {e}')
+            sys.exit(1)
 
 
 def colormaplabel_files_of(options: Sequence[OptionsLink]) -> Iterator[str]:
@@ -124,3 +385,18 @@ def colormaplabel_files_of(options: Sequence[OptionsLink]) -> Iterator[str]:
 
 def colormaplabel_of(option: OptionsLink) -> Optional[str]:
     return option.options.get('niivue_defaults', {}).get('colormapLabelFile', None)
+
+
+def colormaplabel_file_for(tags: Mapping[str, str], options: Sequence[OptionsLink],
+                           options_index: Optional[OptionsIndex] = None) -> Optional[str]:
+    """
+    Get the ``colormapLabelFile`` of the options which apply to a file with the given tags, meaning
+    that the file is a label volume (e.g. segmentation).
+
+    :param options_index: an index of ``options``, to look up the options faster for many files
+    """
+    if options_index is None:
+        matched = (colormaplabel_of(o) for o in options if dict_is_subset(o.match, tags))
+    else:
+        matched = (colormaplabel_of(options[i]) for i in options_index.matching(tags))
+    return next(filter(lambda x: x is not None, matched), None)
@@ -0,0 +1,134 @@
+"""
+Label colormaps (``colormapLabelFile``): finding them in the input directory or in this package,
+parsing and validating them once, and writing them to the output directory, optionally pruned to
+the labels which are present in the dataset's label volumes.
+"""
+
+import functools
+import importlib.resources
+import shutil
+from pathlib import Path
+from typing import TypedDict, NotRequired, Sequence, Optional, Iterable
+
+from pydantic import ConfigDict, TypeAdapter, ValidationError
+
+from visualdataset.snapshot import DirectorySnapshot
+
+
+class NiivueLabelColormap(TypedDict):
+    """
+    A NiiVue colormap for label volumes, i.e. the value of ``colormapLabel``.
+
+    https://github.com/niivue/niivue/blob/main/packages/niivue/src/colortables.ts
+    """
+    R: Sequence[int]
+    G: Sequence[int]
+    B: Sequence[int]
+    A: NotRequired[Sequence[int]]
+    I: NotRequired[Sequence[int]]
+    """
+    Label value of each color. If unset, the label values are 0, 1, 2, ...
+    """
+    labels: NotRequired[Sequence[str]]
+    min: NotRequired[float]
+    max: NotRequired[float]
+
+    __pydantic_config__ = ConfigDict(extra='forbid')
+
+
+_COLORMAP_ADAPTER = TypeAdapter(NiivueLabelColormap)
+
+_COLUMNS = ('R', 'G', 'B', 'A', 'I', 'labels')
+
+
+def parse_colormap(data: bytes) -> NiivueLabelColormap:
+    """
+    :raises ValueError: if ``data`` is not a valid NiiVue label colormap
+    """
+    try:
+        colormap = _COLORMAP_ADAPTER.validate_json(data)
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
+    lengths = {k: len(colormap[k]) for k in _COLUMNS if k in colormap}
+    if len(set(lengths.values())) != 1:
+        raise ValueError(f'Lists have different lengths: {lengths}')
+    for k in ('R', 'G', 'B', 'A'):
+        if not all(0 <= v <= 255 for v in colormap.get(k, ())):
+            raise ValueError(f'Values of "{k}" must be between 0 and 255')
+    if len(set(colormap.get('I', ()))) != len(colormap.get('I', ())):
+        raise ValueError('Values of "I" must be unique')
+    return colormap
+
+
+@functools.cache
+def load_colormap(path: Path) -> NiivueLabelColormap:
+    """
+    Parse a colormap file, once per process.
+
+    :raises ValueError: if the file is not a valid NiiVue label colormap
+    """
+    return parse_colormap(path.read_bytes())
+
+
+def prune_colormap(colormap: NiivueLabelColormap, labels: Iterable[int]) -> NiivueLabelColormap:
+    """
+    :return: a colormap with only the colors of ``labels``
+    """
+    indices = colormap.get('I', range(len(colormap['R'])))
+    wanted = set(labels)
+    keep = [i for i, label in enumerate(indices) if label in wanted]
+    pruned = {k: [colormap[k][i] for i in keep] for k in _COLUMNS if k in colormap}
+    pruned['I'] = [indices[i] for i in keep]
+    if 'min' in colormap:
+        pruned['min'] = colormap['min']
+    if 'max' in colormap:
+        pruned['max'] = colormap['max']
+    return NiivueLabelColormap(**pruned)
+
+
+class ColormapRegistry:
+    """
+    Finds the files of ``colormapLabelFile`` options, first in the input directory, then in this package.
+    """
+
+    def __init__(self, input_dir: DirectorySnapshot):
+        self.input_dir = input_dir
+        self._paths: dict[str, Path] = {}
+
+    def path(self, file: str) -> Path:
+        """
+        :raises FileNotFoundError: if the file is neither in the input directory nor in this package
+        """
+        if (path := self._paths.get(file)) is None:
+            path = self._paths[file] = self._resolve(file)
+        return path
+
+    def load(self, file: str) -> NiivueLabelColormap:
+        """
+        :raises FileNotFoundError: see :meth:`path`
+        :raises ValueError: if the file is not a valid NiiVue label colormap
+        """
+        return load_colormap(self.path(file))
+
+    def write(self, file: str, output_dir: Path, labels: Optional[Iterable[int]] = None):
+        """
+        Copy a colormap to ``output_dir``.
+
+        :param labels: if given, only write the colors of these labels
+        """
+        output = output_dir / file
+        output.parent.mkdir(parents=True, exist_ok=True)
+        if labels is None:
+            shutil.copy(self.path(file), output)
+        else:
+            pruned = prune_colormap(self.load(file), labels)
+            output.write_bytes(_COLORMAP_ADAPTER.dump_json(pruned))
+
+    def _resolve(self, file: str) -> Path:
+        if self.input_dir.is_file(file):
+            return self.input_dir.root / file
+        trav = importlib.resources.files(__package__).joinpath('colormaps', file)
+        if trav.is_file():
+            with importlib.resources.as_file(trav) as trav_path:
+                return trav_path
+        raise FileNotFoundError(file)
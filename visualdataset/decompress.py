@@ -0,0 +1,79 @@
+"""
+Pluggable gzip decompression for reading volume files.
+
+Reading ``.nii.gz`` and ``.mgz`` files is dominated by zlib inflation. Faster implementations
+of inflate are used when they are installed:
+
+- ISA-L via ``python-isal``: https://github.com/pycompression/python-isal
+- zlib-ng via ``zlib-ng``: https://github.com/pycompression/python-zlib-ng
+
+Both are optional dependencies (``pip install chrisvisualdataset[fast]``).
+"""
+
+import gzip
+import importlib
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+Backend = Literal['auto', 'isal', 'zlib-ng', 'gzip']
+
+BACKENDS: tuple[Backend, ...] = ('auto', 'isal', 'zlib-ng', 'gzip')
+
+_COMPRESSED_EXTENSIONS = ('.gz', '.mgz')
+
+_MODULES = {
+    'isal': ('isal.igzip', 'isal.igzip_threaded'),
+    'zlib-ng': ('zlib_ng.gzip_ng', 'zlib_ng.gzip_ng_threaded'),
+}
+"""
+Names of the single-threaded and threaded gzip modules of each backend.
+"""
+
+_AUTO_PREFERENCE: tuple[Backend, ...] = ('isal', 'zlib-ng', 'gzip')
+
+
+def available_backends() -> list[Backend]:
+    """
+    :return: names of the installed decompression backends, fastest first.
+    """
+    return [b for b in _AUTO_PREFERENCE if b == 'gzip' or _is_installed(b)]
+
+
+def resolve_backend(backend: Backend) -> Backend:
+    """
+    Replace ``auto`` with the fastest installed backend.
+
+    :raises ValueError: if the backend is not installed
+    """
+    if backend == 'auto':
+        return available_backends()[0]
+    if backend != 'gzip' and not _is_installed(backend):
+        raise ValueError(f'Decompression backend "{backend}" is not installed')
+    return backend
+
+
+def open_file(path: str | Path, backend: Backend = 'auto', threads: int = 0) -> BinaryIO:
+    """
+    Open a file for reading, decompressing it if it is gzip-compressed.
+
+    :param backend: gzip implementation to use
+    :param threads: if greater than zero, decompress in that many background threads so that inflation
+                    overlaps with the caller's processing of the data. Not supported by ``gzip``.
+    """
+    if not str(path).endswith(_COMPRESSED_EXTENSIONS):
+        return open(path, 'rb')
+    backend = resolve_backend(backend)
+    if backend == 'gzip':
+        return gzip.open(path, 'rb')
+    single, threaded = _MODULES[backend]
+    if threads > 0:
+        return importlib.import_module(threaded).open(path, 'rb', threads=threads)
+    return importlib.import_module(single).open(path, 'rb')
+
+
+def _is_installed(backend: Backend) -> bool:
+    try:
+        importlib.import_module(_MODULES[backend][0])
+    except ImportError:
+        return False
+    return True
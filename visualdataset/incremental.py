@@ -0,0 +1,128 @@
+"""
+Updating the outputs of a previous run in the same output directory, recomputing only what changed.
+
+The state of a run is saved in the output directory: for every volume with outputs, a key made of its size,
+modification time and ``colormapLabelFile``. On the next run, volumes with the same key are skipped, and the
+outputs of volumes which are no longer indexed are removed. If the options which affect every output
+(:func:`outputs_config`) changed, all keys are discarded and the previous outputs are removed, because
+some of them (e.g. thumbnails, after ``--thumbnails`` was dropped) would not be overwritten.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import TypedDict, Optional
+
+from pydantic import TypeAdapter, ValidationError
+
+from visualdataset.precompress import PrecompressOptions, EXTENSIONS, read_file
+from visualdataset.volume_sidecar import SidecarOptions, sidecar_name, thumbnail_name
+
+STATE_NAME = '.chrisvisualdataset.incremental.json'
+_STATE_VERSION = 1
+
+
+class IncrementalState(TypedDict):
+    version: int
+    config: str
+    """
+    See :func:`outputs_config`.
+    """
+    files: dict[str, str]
+    """
+    Key of every volume which has outputs, by its path relative to the input and output directories.
+    """
+
+
+_STATE_ADAPTER = TypeAdapter(IncrementalState)
+
+
+def outputs_config(options: SidecarOptions, precompress: PrecompressOptions = PrecompressOptions()) -> str:
+    """
+    Identifies the options which the outputs of every volume depend on.
+    """
+    factors = ','.join(map(str, options.preview_factors))
+    encodings = ','.join(precompress.encodings)
+    return (f'{options.cache_variant()}:previews={factors}:thumbnails={options.thumbnails}'
+            f':precompress={encodings}:{precompress.level}:{precompress.only}')
+
+
+class IncrementalUpdate:
+    """
+    Decides which volumes need their outputs to be written, and cleans up after volumes which were removed.
+    """
+
+    def __init__(self, output_dir: Path, options: SidecarOptions,
+                 precompress: PrecompressOptions = PrecompressOptions()):
+        self.output_dir = output_dir
+        self.precompress = precompress
+        self.config = outputs_config(options, precompress)
+        previous = load_state(output_dir)
+        self.previous = {} if previous is None else previous['files']
+        if previous is not None and previous['config'] != self.config:
+            for path in self.previous:
+                remove_outputs(output_dir, path)
+            self.previous = dict.fromkeys(self.previous, '')  # still counted as removed if their volume is gone
+        self.current: dict[str, str] = {}
+        self.unchanged = 0
+
+    def is_unchanged(self, path: str, input_path: Path, colormaplabel: Optional[str]) -> bool:
+        """
+        Record the key of a volume, and check whether its outputs from the previous run are still valid.
+
+        :param path: path of the volume relative to the input and output directories
+        """
+        st = os.stat(input_path)
+        key = f'{st.st_size}:{st.st_mtime_ns}:{colormaplabel or ""}'
+        self.current[path] = key
+        sidecar = self.precompress.output_path(self.output_dir / sidecar_name(path))
+        if self.previous.get(path) != key or not sidecar.is_file():
+            return False
+        self.unchanged += 1
+        return True
+
+    def remove_deleted(self) -> int:
+        """
+        Remove the outputs of volumes which had outputs in the previous run, but are not in this run.
+
+        :return: number of volumes of which outputs were removed
+        """
+        deleted = [path for path in self.previous if path not in self.current]
+        for path in deleted:
+            remove_outputs(self.output_dir, path)
+        return len(deleted)
+
+    def save(self):
+        state = IncrementalState(version=_STATE_VERSION, config=self.config, files=self.current)
+        (self.output_dir / STATE_NAME).write_bytes(_STATE_ADAPTER.dump_json(state))
+
+
+def load_state(output_dir: Path) -> Optional[IncrementalState]:
+    """
+    :return: the state saved in ``output_dir``, or None if there is none or it is from another version
+    """
+    try:
+        state = _STATE_ADAPTER.validate_json((output_dir / STATE_NAME).read_bytes())
+    except (FileNotFoundError, ValidationError):
+        return None
+    return state if state['version'] == _STATE_VERSION else None
+
+
+def remove_outputs(output_dir: Path, path: str):
+    """
+    Remove the sidecar (and its compressed copies), previews and thumbnail of a volume, then its output
+    directories which became empty.
+    """
+    sidecar = output_dir / sidecar_name(path)
+    names = [sidecar.name, *(sidecar.name + ext for ext in EXTENSIONS.values()),
+             thumbnail_name(sidecar.name.removesuffix(sidecar_name('')))]
+    try:
+        names.extend(json.loads(read_file(sidecar)).get('previews', {}).values())
+    except (OSError, ValueError, AttributeError):
+        pass
+    for name in names:
+        sidecar.with_name(name).unlink(missing_ok=True)
+    directory = sidecar.parent
+    while directory != output_dir and directory.is_dir() and not any(directory.iterdir()):
+        directory.rmdir()
+        directory = directory.parent
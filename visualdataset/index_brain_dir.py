@@ -1,9 +1,11 @@
-import os.path
 from pathlib import Path, PurePath
-from typing import Iterator, Sequence
+from typing import Iterator, Sequence, Optional
 
 from visualdataset.args_types import Matcher
-from visualdataset.manifest import VisualDatasetFile
+from visualdataset.manifest import VisualDatasetFile, IndexedFile
+from visualdataset.matcher_engine import CompiledMatchers
+from visualdataset.snapshot import DirectorySnapshot
+from visualdataset.traversal import TraversalFilter
 
 _SUPPORTED_VOLUME_FILE_EXTENSIONS = ('.nii.gz', '.nii', '.mgz')
 """
@@ -13,14 +15,46 @@ https://github.com/niivue/niivue?tab=readme-ov-file#supported-formats
 """
 
 
-def index_brain_dir(input_dir: Path, matchers: Sequence[Matcher]) -> Iterator[VisualDatasetFile]:
+def index_brain_dir(
+        input_dir: Path,
+        matchers: Sequence[Matcher],
+        threads: int = 1,
+        snapshot: Optional[DirectorySnapshot] = None
+) -> Iterator[VisualDatasetFile]:
     """
     Scan a directory for files matching the matchers.
+
+    :param threads: number of directories to list concurrently, see :class:`DirectorySnapshot`
+    :param snapshot: snapshot of ``input_dir`` made by :func:`volume_snapshot`, to reuse instead of a new one
+    """
+    return (file.to_model() for file in index_files(input_dir, matchers, threads, snapshot))
+
+
+def index_files(
+        input_dir: Path,
+        matchers: Sequence[Matcher],
+        threads: int = 1,
+        snapshot: Optional[DirectorySnapshot] = None,
+        has_sidecar: bool = False
+) -> Iterator[IndexedFile]:
     """
-    brain_files = filter(is_volume_file, input_dir.rglob('*'))
-    rel_paths = (p.relative_to(input_dir) for p in brain_files)
-    matches = (match_file(p, matchers) for p in rel_paths)
-    return filter(_has_tags, matches)
+    Same as :func:`index_brain_dir`, producing :class:`IndexedFile` instead.
+    """
+    compiled = CompiledMatchers(matchers)
+    if snapshot is None:
+        snapshot = volume_snapshot(input_dir, threads)
+    for path in snapshot.matching_files():
+        path = path.as_posix()
+        if tags := compiled.match(path):
+            yield IndexedFile(path, tags, has_sidecar)
+
+
+def volume_snapshot(input_dir: Path, threads: int = 1, traversal: Optional[TraversalFilter] = None
+                    ) -> DirectorySnapshot:
+    """
+    Create a snapshot of a directory which finds volume files.
+    """
+    return DirectorySnapshot(input_dir, _SUPPORTED_VOLUME_FILE_EXTENSIONS, threads, traversal)
 
 
 def is_volume_file(p: Path) -> bool:
@@ -29,6 +63,17 @@ def is_volume_file(p: Path) -> bool:
     return any(map(p.name.endswith, _SUPPORTED_VOLUME_FILE_EXTENSIONS))
 
 
+def walk_volume_files(input_dir: Path, threads: int = 1) -> Iterator[PurePath]:
+    """
+    Find all volume files under a directory, yielding their paths relative to ``input_dir``.
+
+    Equivalent to ``filter(is_volume_file, input_dir.rglob('*'))``, but uses the file type information
+    which ``os.scandir`` gets for free when listing a directory, and compares file names against
+    the supported extensions before anything else, so usually no ``stat`` call is made at all.
+    """
+    return volume_snapshot(input_dir, threads).matching_files()
+
+
 def match_file(path: PurePath, matchers: Sequence[Matcher]) -> VisualDatasetFile:
     tags = {
         matcher.key: matcher.value
@@ -37,6 +82,3 @@ def match_file(path: PurePath, matchers: Sequence[Matcher]) -> VisualDatasetFile
     }
     return VisualDatasetFile(path=PurePath(path), tags=tags)
 
-
-def _has_tags(match: VisualDatasetFile) -> bool:
-    return len(match.tags) > 0
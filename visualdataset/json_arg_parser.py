@@ -1,13 +1,12 @@
 import json
 import sys
-from pathlib import Path
 from typing import Sequence, TypeVar, Type
 
 from pydantic import BaseModel, ValidationError
 
 from visualdataset.args_types import Matcher
 from visualdataset.manifest import OptionsLink
-from visualdataset.wellknown import FREESURFER_MATCHERS, FREESURFER_OPTIONS, MALPEM_MATCHERS, MALPEM_OPTIONS
+from visualdataset.snapshot import DirectorySnapshot
 
 
 EVERYTHING_MATCHER: Sequence[Matcher] = [Matcher(key='type', value='file', regex=r'\.(nii(\.gz)?)|(mgz)$')]
@@ -16,16 +15,18 @@ a Matcher matching all supported file formats.
 """
 
 
-def parse_args(input_dir: Path, mode: str, matchers: str | None, options: str | None
+def parse_args(input_dir: DirectorySnapshot, mode: str, matchers: str | None, options: str | None
                ) -> tuple[Sequence[Matcher], Sequence[OptionsLink]]:
     mode = mode.lower()
     matchers_list = None
     options_list = []
 
     if 'freesurfer' in mode:
+        from visualdataset.wellknown.freesurfer import FREESURFER_MATCHERS, FREESURFER_OPTIONS
         matchers_list = FREESURFER_MATCHERS
         options_list = FREESURFER_OPTIONS
     if 'malpem' in mode:
+        from visualdataset.wellknown.malpem import MALPEM_MATCHERS, MALPEM_OPTIONS
         matchers_list = MALPEM_MATCHERS
         options_list = MALPEM_OPTIONS
 
@@ -43,14 +44,9 @@ def parse_args(input_dir: Path, mode: str, matchers: str | None, options: str |
 _M = TypeVar('_M', bound=BaseModel)
 
 
-def file_or_string(dir: Path, arg: str) -> str:
-    path = dir / arg
-    try:
-        is_file = path.is_file()
-    except OSError:  # in case file name is too long (it's probably the value!)
-        is_file = False
-    if is_file:
-        return path.read_text()
+def file_or_string(dir: DirectorySnapshot, arg: str) -> str:
+    if dir.is_file(arg):  # (if the file name is too long, it's probably the value!)
+        return (dir.root / arg).read_text()
     return arg
 
 
@@ -1,7 +1,9 @@
+import json
+import os.path
 from pathlib import PurePath
-from typing import Sequence, Mapping, Set, Self
+from typing import Sequence, Mapping, Set, Self, Literal, TextIO
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 from visualdataset.options import ChrisViewerFileOptions
 
@@ -26,6 +28,26 @@ class VisualDatasetFile(BaseModel):
     __pydantic_config__ = ConfigDict(extra='forbid')
 
 
+class IndexedFile:
+    """
+    The same data as :class:`VisualDatasetFile`, without validation and with less memory per file,
+    for keeping the index of a large dataset in memory. ``path`` is a string, and ``tags`` may be the same
+    mapping object for many files (see :meth:`visualdataset.matcher_engine.CompiledMatchers.match`).
+    """
+    __slots__ = ('path', 'tags', 'has_sidecar')
+
+    def __init__(self, path: str, tags: Mapping[str, str], has_sidecar: bool = False):
+        self.path = path
+        self.tags = tags
+        self.has_sidecar = has_sidecar
+
+    def __repr__(self):
+        return f'IndexedFile(path={self.path!r}, tags={self.tags!r}, has_sidecar={self.has_sidecar!r})'
+
+    def to_model(self) -> VisualDatasetFile:
+        return VisualDatasetFile(path=PurePath(self.path), tags=self.tags, has_sidecar=self.has_sidecar)
+
+
 class OptionsLink(BaseModel):
     """
     An association between some options and a set of tags.
@@ -62,18 +84,173 @@ class VisualDatasetManifest(BaseModel):
             k: sorted(v)
             for k, v in sorted(self.tags.items())
         }
-        sorted_files = sorted(self.files, key=_get_path)
-        sorted_file_paths = [f.path for f in sorted_files]
-        sorted_first_run_files = [
-            sorted_file_paths.index(self.files[i].path)
-            for i in self.first_run_files
-        ]
+        order, new_positions = _sort_by_path(self.files)
         return self.model_copy(update={
             'tags': sorted_tags,
-            'files': sorted_files,
-            'first_run_files': sorted_first_run_files
+            'files': [self.files[i] for i in order],
+            'first_run_files': [new_positions[i] for i in self.first_run_files]
         })
 
+    def compact(self) -> 'CompactManifest':
+        """
+        Convert to the compact format. Tag values which are sets are sorted, and the tags of each file
+        are ordered like ``tags``.
+
+        :raises ValueError: if a file has a tag value which is not in ``tags``
+        """
+        tags = {k: v if isinstance(v, Sequence) else sorted(v) for k, v in self.tags.items()}
+        codes = {k: {value: code for code, value in enumerate(values)} for k, values in tags.items()}
+        columns = {k: [] for k in tags}
+        prefix_lengths = []
+        suffixes = []
+        previous = ''
+        for file in self.files:
+            path = str(file.path)
+            common = len(os.path.commonprefix((previous, path)))
+            prefix_lengths.append(common)
+            suffixes.append(path[common:])
+            previous = path
+            if not file.tags.keys() <= codes.keys():
+                raise ValueError(f'Tags of "{path}" are not in the manifest\'s tags: {file.tags}')
+            for key, column in columns.items():
+                value = file.tags.get(key)
+                if value is None:
+                    column.append(-1)
+                elif (code := codes[key].get(value)) is not None:
+                    column.append(code)
+                else:
+                    raise ValueError(f'Tag {key}={value} of "{path}" is not in the manifest\'s tags')
+        return CompactManifest(
+            version=COMPACT_MANIFEST_VERSION,
+            tags=tags,
+            files=CompactFiles(
+                path_prefix_lengths=prefix_lengths,
+                path_suffixes=suffixes,
+                tags=columns,
+                has_sidecar=[int(file.has_sidecar) for file in self.files]
+            ),
+            options=self.options,
+            first_run_files=self.first_run_files
+        )
+
+
+COMPACT_MANIFEST_VERSION = 1
+
+
+class CompactFiles(BaseModel):
+    """
+    The files of a :class:`CompactManifest`, as columns: the i-th element of each list is about the i-th file.
+    """
+    path_prefix_lengths: Sequence[int]
+    """
+    Number of characters (Unicode code points) at the start of each path which are the same as the previous path's.
+    """
+    path_suffixes: Sequence[str]
+    """
+    The rest of each path, after the characters it has in common with the previous path.
+    """
+    tags: Mapping[str, Sequence[int]]
+    """
+    For each tag key, the index number of each file's value in ``CompactManifest.tags[key]``, or -1 if unset.
+    """
+    has_sidecar: Sequence[Literal[0, 1]]
+
+    __pydantic_config__ = ConfigDict(extra='forbid')
+
 
-def _get_path(x: VisualDatasetFile) -> str:
-    return str(x.path)
+class CompactManifest(BaseModel):
+    """
+    The same data as :class:`VisualDatasetManifest`, encoded to be smaller and faster to parse for datasets
+    with many files: tag keys and values are stored once in ``tags`` and referred to by number, and paths
+    are front-coded (which works best when they are sorted).
+    """
+    version: Literal[1]
+    """
+    Version of this format, see ``COMPACT_MANIFEST_VERSION``.
+    """
+    tags: Mapping[str, Sequence[str]]
+    files: CompactFiles
+    options: Sequence[OptionsLink]
+    first_run_files: Sequence[int]
+
+    __pydantic_config__ = ConfigDict(extra='forbid')
+
+    def expand(self) -> VisualDatasetManifest:
+        """
+        Convert to the usual format.
+
+        :raises ValueError: if the columns of ``files`` have different lengths
+        """
+        columns = self.files
+        n = len(columns.path_suffixes)
+        if len(columns.path_prefix_lengths) != n or len(columns.has_sidecar) != n \
+                or any(len(codes) != n for codes in columns.tags.values()):
+            raise ValueError('Columns of files have different lengths')
+        tag_columns = [(k, self.tags[k], codes) for k, codes in columns.tags.items()]
+        files = []
+        path = ''
+        for i, (common, suffix) in enumerate(zip(columns.path_prefix_lengths, columns.path_suffixes)):
+            path = path[:common] + suffix
+            tags = {k: values[codes[i]] for k, values, codes in tag_columns if codes[i] != -1}
+            files.append(VisualDatasetFile(path=PurePath(path), tags=tags, has_sidecar=bool(columns.has_sidecar[i])))
+        return VisualDatasetManifest(
+            tags=self.tags,
+            files=files,
+            options=self.options,
+            first_run_files=self.first_run_files
+        )
+
+
+def write_manifest(
+        fp: TextIO,
+        tags: Mapping[str, Set[str] | Sequence[str]],
+        files: Sequence[IndexedFile | VisualDatasetFile],
+        options: Sequence[OptionsLink],
+        first_run_files: Sequence[int]
+):
+    """
+    Write the same JSON as ``VisualDatasetManifest(...).sort().model_dump_json()``, one file at a time,
+    without creating a ``VisualDatasetFile`` for every file nor holding the whole document in memory.
+    """
+    order, new_positions = _sort_by_path(files)
+    sorted_tags = {k: sorted(v) for k, v in sorted(tags.items())}
+    fp.write('{"tags":')
+    fp.write(_dumps(sorted_tags))
+    fp.write(',"files":[')
+    encoded_tags: dict[int, tuple[Mapping[str, str], str]] = {}
+    for n, i in enumerate(order):
+        file = files[i]
+        if (encoded := encoded_tags.get(id(file.tags))) is None:
+            encoded = encoded_tags[id(file.tags)] = (file.tags, _dumps(file.tags))
+        fp.write(',{"path":' if n else '{"path":')
+        fp.write(_dumps(str(file.path)))
+        fp.write(',"tags":')
+        fp.write(encoded[1])
+        fp.write(',"has_sidecar":true}' if file.has_sidecar else ',"has_sidecar":false}')
+    fp.write('],"options":')
+    fp.write(_OPTIONS_ADAPTER.dump_json(options).decode())
+    fp.write(',"first_run_files":')
+    fp.write(_dumps([new_positions[i] for i in first_run_files]))
+    fp.write('}')
+
+
+_OPTIONS_ADAPTER = TypeAdapter(Sequence[OptionsLink])
+
+
+def _dumps(obj) -> str:
+    """
+    Encode strings, lists and dicts of them, and integers like pydantic does.
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _sort_by_path(files: Sequence[IndexedFile | VisualDatasetFile]) -> tuple[list[int], list[int]]:
+    """
+    :return: index numbers of ``files`` sorted by path, and the position of each file after sorting
+    """
+    paths = [str(f.path) for f in files]
+    order = sorted(range(len(paths)), key=paths.__getitem__)
+    new_positions = [0] * len(order)
+    for new_position, i in enumerate(order):
+        new_positions[i] = new_position
+    return order, new_positions
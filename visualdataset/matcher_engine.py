@@ -0,0 +1,153 @@
+"""
+Matching many paths against many matchers.
+
+Equivalent to calling ``matcher.re.search`` for every matcher and every path (see
+:func:`visualdataset.index_brain_dir.match_file`), but avoids most of the regular expression searches:
+
+1. Matchers with identical regular expressions share one search, which produces all of their tags.
+2. Every regular expression is guarded by the longest literal substring it requires
+   (see :mod:`visualdataset.regex_literals`), so it is only searched for in paths which contain that literal.
+3. Which literals a path contains is mostly answered from memos of its directory and of its file name,
+   since paths of a dataset share few distinct directories and file names.
+"""
+
+from typing import Sequence, Mapping, Iterator
+
+from visualdataset.args_types import Matcher
+from visualdataset.regex_literals import longest_required_literal
+
+_SEP = '/'
+
+_MAX_MEMO = 1 << 16
+"""
+Maximum number of directories or file names to remember the literals of, before forgetting all of them.
+"""
+
+
+class _Pattern:
+    __slots__ = ('search', 'matcher_indices')
+
+    def __init__(self, matcher: Matcher, matcher_indices: list[int]):
+        self.search = matcher.re.search
+        self.matcher_indices = matcher_indices
+
+
+class _DirectoryLiterals:
+    __slots__ = ('found', 'straddling', 'prefix_lengths')
+
+    def __init__(self, found: frozenset[str], straddling: Mapping[str, Sequence[str]]):
+        self.found = found
+        """
+        Literals contained in the directory (including its trailing separator).
+        """
+        self.straddling = straddling
+        """
+        Literals which are contained in a path of this directory if and only if its file name starts
+        with a given prefix, by that prefix.
+        """
+        self.prefix_lengths = sorted({len(prefix) for prefix in straddling})
+
+    def in_name(self, name: str) -> Iterator[str]:
+        """
+        :return: literals which are contained in the path of a file of this directory, in addition to ``found``
+        """
+        for length in self.prefix_lengths:
+            if length > len(name):
+                break
+            yield from self.straddling.get(name[:length], ())
+
+
+class CompiledMatchers:
+    """
+    A list of matchers prepared for matching many paths.
+    """
+
+    def __init__(self, matchers: Sequence[Matcher]):
+        self._tags = [(m.key, m.value) for m in matchers]
+
+        indices_by_regex: dict[str, list[int]] = {}
+        first_by_regex: dict[str, Matcher] = {}
+        for i, matcher in enumerate(matchers):
+            indices_by_regex.setdefault(matcher.regex, []).append(i)
+            first_by_regex.setdefault(matcher.regex, matcher)
+
+        self._unguarded: list[_Pattern] = []
+        self._guarded: dict[str, list[_Pattern]] = {}
+        for regex, indices in indices_by_regex.items():
+            pattern = _Pattern(first_by_regex[regex], indices)
+            if literal := longest_required_literal(regex):
+                self._guarded.setdefault(literal, []).append(pattern)
+            else:
+                self._unguarded.append(pattern)
+
+        self._name_literals = tuple(literal for literal in self._guarded if _SEP not in literal)
+        self._path_literals = tuple(literal for literal in self._guarded if _SEP in literal)
+        self._directory_memo: dict[str, _DirectoryLiterals] = {}
+        self._name_memo: dict[str, frozenset[str]] = {}
+        self._tag_sets: dict[tuple[int, ...], Mapping[str, str]] = {}
+        """
+        Tags by the indices of the matchers which matched, so that there is one mapping per distinct set of tags.
+        """
+
+    def match(self, path: str) -> Mapping[str, str]:
+        """
+        Get the tags of a path, which must be relative and use ``/`` as its separator.
+
+        :return: the same tags, in the same order, as :func:`visualdataset.index_brain_dir.match_file`.
+                 Paths with the same tags get the same mapping, which must not be modified.
+        """
+        literals = self._literals_in(path)
+        indices = []
+        for pattern in self._unguarded:
+            if pattern.search(path) is not None:
+                indices.extend(pattern.matcher_indices)
+        for literal in literals:
+            for pattern in self._guarded[literal]:
+                if pattern.search(path) is not None:
+                    indices.extend(pattern.matcher_indices)
+        indices = tuple(sorted(indices))
+        if (tags := self._tag_sets.get(indices)) is None:
+            tags = {}
+            for i in indices:
+                key, value = self._tags[i]
+                tags[key] = value
+            self._tag_sets[indices] = tags
+        return tags
+
+    def _literals_in(self, path: str) -> frozenset[str]:
+        directory, sep, name = path.rpartition(_SEP)
+        found = self._literals_in_name(name)
+        if sep:
+            directory_literals = self._literals_in_directory(directory + sep)
+            found = found.union(directory_literals.found, directory_literals.in_name(name))
+        return found
+
+    def _literals_in_name(self, name: str) -> frozenset[str]:
+        if (found := self._name_memo.get(name)) is None:
+            if len(self._name_memo) >= _MAX_MEMO:
+                self._name_memo.clear()
+            found = frozenset(literal for literal in self._name_literals if literal in name)
+            self._name_memo[name] = found
+        return found
+
+    def _literals_in_directory(self, directory: str) -> _DirectoryLiterals:
+        """
+        :param directory: directory part of a path, ending with a separator
+        """
+        if (memo := self._directory_memo.get(directory)) is None:
+            if len(self._directory_memo) >= _MAX_MEMO:
+                self._directory_memo.clear()
+            found = []
+            straddling: dict[str, list[str]] = {}
+            for literal in self._path_literals:
+                if literal in directory:
+                    found.append(literal)
+                    continue
+                # a literal which is not in the directory has to end in the file name, after the last separator
+                head, _, tail = literal.rpartition(_SEP)
+                if directory.endswith(head + _SEP):
+                    straddling.setdefault(tail, []).append(literal)
+            found.extend(literal for literal in self._name_literals if literal in directory)
+            memo = _DirectoryLiterals(frozenset(found), straddling)
+            self._directory_memo[directory] = memo
+        return memo
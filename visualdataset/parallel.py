@@ -0,0 +1,244 @@
+"""
+Helpers for running per-file work in a process pool.
+"""
+
+import bisect
+import collections
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Callable, Sequence, TypeVar, Iterable, Optional
+
+from tqdm import tqdm
+
+_T = TypeVar('_T')
+_R = TypeVar('_R')
+
+
+class TaskError(Exception):
+    """
+    An error which happened while processing a named item.
+    """
+
+    def __init__(self, name: str, cause: BaseException):
+        super().__init__(name, cause)
+        self.name = name
+        self.cause = cause
+
+    def __str__(self):
+        return f'"{self.name}": {type(self.cause).__name__}: {self.cause}'
+
+
+def cpu_limit() -> int:
+    """
+    Get the number of CPUs this process may use, taking into account the CPU quota
+    of its cgroup (i.e. the CPU limit of its container).
+    """
+    available = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = _cgroup_cpu_quota()
+    if quota is None:
+        return available
+    return max(1, min(available, math.ceil(quota)))
+
+
+def _cgroup_cpu_quota() -> float | None:
+    """
+    :return: the CPU quota of the cgroup as a number of CPUs, or None if unlimited or unknown.
+    """
+    v2 = Path('/sys/fs/cgroup/cpu.max')
+    v1_quota = Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    v1_period = Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    try:
+        if v2.is_file():
+            quota, period = v2.read_text().split()
+        elif v1_quota.is_file() and v1_period.is_file():
+            quota, period = v1_quota.read_text().strip(), v1_period.read_text().strip()
+        else:
+            return None
+        if quota == 'max' or int(quota) <= 0:
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def map_ordered(
+        fn: Callable[[_T], _R],
+        items: Sequence[_T],
+        jobs: int,
+        desc: str,
+        name: Callable[[_T], str] = str
+) -> list[_R]:
+    """
+    Call ``fn`` on every item using a pool of ``jobs`` processes, showing one progress bar for all of them.
+
+    Results are returned in the same order as ``items``, regardless of the order in which they finish.
+    ``fn`` must be picklable (i.e. defined at the top level of a module).
+
+    :raises TaskError: if ``fn`` raised an exception, naming the item it failed on.
+    """
+    if jobs <= 1:
+        results = []
+        for item in tqdm(items, desc=desc):
+            try:
+                results.append(fn(item))
+            except Exception as e:
+                raise TaskError(name(item), e) from e
+        return results
+
+    results: list = [None] * len(items)
+    with ProcessPoolExecutor(max_workers=jobs) as pool, tqdm(total=len(items), desc=desc) as pbar:
+        futures = {pool.submit(fn, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise TaskError(name(items[i]), e) from e
+            pbar.update()
+    return results
+
+
+def map_streaming(
+        fn: Callable[[_T], _R],
+        items: Iterable[_T],
+        jobs: int,
+        desc: str,
+        name: Callable[[_T], str] = str,
+        max_pending: Optional[int] = None,
+        cost: Optional[Callable[[_T], int]] = None,
+        budget: Optional[int] = None
+) -> list[_R]:
+    """
+    Like :func:`map_ordered`, but ``items`` is consumed lazily: each item is given to the pool as soon as it
+    is produced, so the work of producing items (e.g. scanning a directory) overlaps with the work of ``fn``.
+
+    :param max_pending: maximum number of items which are submitted but not finished (default: ``2 * jobs``).
+                        Producing items pauses when it is reached.
+    :param cost: cost of an item (e.g. its memory usage), see ``budget``
+    :param budget: maximum total ``cost`` of the items which are submitted but not finished. Producing items
+                   pauses until the next item fits. An item which costs more than ``budget`` is submitted
+                   when no other item is pending.
+    """
+    if jobs <= 1:
+        return map_ordered(fn, items, jobs, desc, name)
+
+    max_pending = max_pending or 2 * jobs
+    results: list = []
+    pending: dict[Future, int] = {}
+    pending_costs: dict[int, int] = {}
+    item_names: list[str] = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool, tqdm(desc=desc) as pbar:
+        def collect(futures: Iterable[Future]):
+            for future in futures:
+                i = pending.pop(future)
+                pending_costs.pop(i, None)
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise TaskError(item_names[i], e) from e
+                pbar.update()
+
+        def is_full(item_cost: int) -> bool:
+            if len(pending) >= max_pending:
+                return True
+            return budget is not None and sum(pending_costs.values()) + item_cost > budget
+
+        for item in items:
+            item_cost = 0 if cost is None or budget is None else cost(item)
+            while pending and is_full(item_cost):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            if item_cost:
+                pending_costs[len(results)] = item_cost
+            pending[pool.submit(fn, item)] = len(results)
+            results.append(None)
+            item_names.append(name(item))
+            pbar.total = len(results)
+        collect(as_completed(list(pending)))
+    return results
+
+
+def map_scheduled(
+        fn: Callable[[_T], _R],
+        items: Sequence[_T],
+        jobs: int,
+        desc: str,
+        name: Callable[[_T], str] = str,
+        cost: Callable[[_T], int] = lambda _: 0,
+        budget: int = 0
+) -> list[_R]:
+    """
+    Like :func:`map_ordered`, but items are started largest ``cost`` first, and only while the total cost
+    of the running items is at most ``budget``. When the largest item which is left does not fit, the largest
+    one which does fit is started instead. An item which costs more than ``budget`` is started when no other
+    item is running.
+
+    Starting the largest items first keeps the long items from being the last ones running while the other
+    processes are idle.
+    """
+    if jobs <= 1:
+        return map_ordered(fn, items, jobs, desc, name)
+
+    costs = [cost(item) for item in items]
+    queue = _CostQueue(costs)
+    results: list = [None] * len(items)
+    running: dict[Future, int] = {}
+    used = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool, tqdm(total=len(items), desc=desc) as pbar:
+        while queue or running:
+            while queue and len(running) < jobs:
+                i = queue.pop_fitting(budget - used) if running else queue.pop_largest()
+                if i is None:
+                    break
+                running[pool.submit(fn, items[i])] = i
+                used += costs[i]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                used -= costs[i]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise TaskError(name(items[i]), e) from e
+                pbar.update()
+    return results
+
+
+class _CostQueue:
+    """
+    Indices of items grouped by their cost, so that the largest item which fits can be found quickly
+    when many items have the same cost (e.g. volumes of the same shape).
+    """
+
+    def __init__(self, costs: Sequence[int]):
+        self._items: dict[int, collections.deque[int]] = collections.defaultdict(collections.deque)
+        for i, c in enumerate(costs):
+            self._items[c].append(i)
+        self._costs = sorted(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._costs)
+
+    def pop_largest(self) -> int:
+        return self._pop(len(self._costs) - 1)
+
+    def pop_fitting(self, available: int) -> Optional[int]:
+        """
+        :return: index of the largest item which costs at most ``available``, or None if there is none
+        """
+        k = bisect.bisect_right(self._costs, available)
+        return None if k == 0 else self._pop(k - 1)
+
+    def _pop(self, k: int) -> int:
+        c = self._costs[k]
+        items = self._items[c]
+        i = items.popleft()
+        if not items:
+            del self._costs[k]
+            del self._items[c]
+        return i
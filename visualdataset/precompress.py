@@ -0,0 +1,97 @@
+"""
+Compressed copies of output files, which a web server can send as they are with a ``Content-Encoding``
+header instead of compressing them for every request (e.g. nginx's ``gzip_static``).
+
+Only JSON outputs (manifest, sidecars, colormaps) are compressed: volumes and thumbnails are already compressed.
+zstd needs the optional dependency ``zstandard`` (``pip install chrisvisualdataset[zstd]``).
+"""
+
+import gzip
+import importlib.util
+from pathlib import Path
+from typing import Literal, NamedTuple, Optional, Sequence
+
+Encoding = Literal['gzip', 'zstd']
+
+ENCODINGS: tuple[Encoding, ...] = ('gzip', 'zstd')
+
+EXTENSIONS: dict[Encoding, str] = {'gzip': '.gz', 'zstd': '.zst'}
+
+_DEFAULT_LEVELS: dict[Encoding, int] = {'gzip': 9, 'zstd': 19}
+"""
+Files are compressed once and downloaded many times, so the default levels favor size over speed.
+"""
+
+
+class PrecompressOptions(NamedTuple):
+    encodings: tuple[Encoding, ...] = ()
+    level: Optional[int] = None
+    """
+    Compression level for every encoding, or None for the default of each encoding.
+    """
+    only: bool = False
+    """
+    Whether to remove the uncompressed files, keeping only their compressed copies.
+    """
+
+    def output_path(self, path: Path) -> Path:
+        """
+        :return: the path of a file of which compressed copies were made, which is kept after compression
+        """
+        return path.with_name(path.name + EXTENSIONS[self.encodings[0]]) if self.only and self.encodings else path
+
+
+def check_encodings(encodings: Sequence[str]):
+    """
+    :raises ValueError: if an encoding is unknown or its optional dependency is not installed
+    """
+    for encoding in encodings:
+        if encoding not in ENCODINGS:
+            raise ValueError(f'Unknown encoding "{encoding}", must be one of: {", ".join(ENCODINGS)}')
+        if encoding == 'zstd' and importlib.util.find_spec('zstandard') is None:
+            raise ValueError('Encoding "zstd" needs the Python package "zstandard" to be installed')
+
+
+def compress_file(path: Path, options: PrecompressOptions):
+    """
+    Write the compressed copies of a file next to it, e.g. ``file.json.gz``.
+    """
+    if not options.encodings:
+        return
+    data = path.read_bytes()
+    for encoding in options.encodings:
+        compressed = _compress(data, encoding, options.level)
+        path.with_name(path.name + EXTENSIONS[encoding]).write_bytes(compressed)
+    if options.only:
+        path.unlink()
+
+
+def read_file(path: Path) -> bytes:
+    """
+    Read a file, or if it was removed after compression, one of its compressed copies.
+    """
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    for encoding, extension in EXTENSIONS.items():
+        copy = path.with_name(path.name + extension)
+        if copy.is_file():
+            return _decompress(copy.read_bytes(), encoding)
+    raise FileNotFoundError(path)
+
+
+def _compress(data: bytes, encoding: Encoding, level: Optional[int]) -> bytes:
+    if level is None:
+        level = _DEFAULT_LEVELS[encoding]
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    import zstandard
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _decompress(data: bytes, encoding: Encoding) -> bytes:
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
@@ -0,0 +1,93 @@
+"""
+Downsampled preview volumes, computed from the same slabs as the statistics of a volume.
+
+Intensity volumes are downsampled by averaging blocks of ``f×f×f`` voxels. Label volumes
+are downsampled by taking the most common label of each block.
+"""
+
+from typing import Optional
+
+import numpy as np
+import nibabel as nib
+from nibabel.spatialimages import SpatialImage
+
+from visualdataset.volume_reader import scaling
+
+
+class PreviewBuilder:
+    """
+    Reducer which downsamples the first 3D frame of a volume by an integer factor.
+    """
+
+    def __init__(self, vol: SpatialImage, factor: int, is_label: bool):
+        self.factor = factor
+        self.is_label = is_label
+        self._affine = vol.affine
+        self._slope, self._inter = scaling(vol)
+        shape = tuple(vol.shape) + (1,) * (3 - len(vol.shape))
+        self._depth = shape[2]
+        self._planes_seen = 0
+        self._pending: Optional[np.ndarray] = None
+        self._blocks: list[np.ndarray] = []
+
+    def update(self, slab: np.ndarray):
+        remaining = self._depth - self._planes_seen
+        self._planes_seen += slab.shape[2]
+        if remaining <= 0:
+            return
+        slab = slab[..., :remaining]
+        if self._pending is not None:
+            slab = np.concatenate([self._pending, slab], axis=2)
+        usable = slab.shape[2] - slab.shape[2] % self.factor
+        self._pending = slab[..., usable:].copy() if usable < slab.shape[2] else None
+        if usable > 0:
+            self._blocks.append(self._downsample(slab[..., :usable]))
+
+    def result(self) -> SpatialImage:
+        """
+        :return: the downsampled volume, with an affine which maps it onto the same space as the original
+        """
+        if self._pending is not None:
+            pad = self.factor - self._pending.shape[2]
+            self._blocks.append(self._downsample(np.pad(self._pending, ((0, 0), (0, 0), (0, pad)), mode='edge')))
+            self._pending = None
+        data = np.concatenate(self._blocks, axis=2)
+        if (self._slope, self._inter) != (1.0, 0.0):
+            data = (data * self._slope + self._inter).astype(np.float32)
+        f = self.factor
+        offset = (f - 1) / 2
+        scale = np.array([
+            [f, 0, 0, offset],
+            [0, f, 0, offset],
+            [0, 0, f, offset],
+            [0, 0, 0, 1]
+        ])
+        return nib.Nifti1Image(data, self._affine @ scale)
+
+    def _downsample(self, slab: np.ndarray) -> np.ndarray:
+        f = self.factor
+        x, y, _ = slab.shape
+        pad_x, pad_y = -x % f, -y % f
+        if pad_x or pad_y:
+            slab = np.pad(slab, ((0, pad_x), (0, pad_y), (0, 0)), mode='edge')
+        bx, by, bz = slab.shape[0] // f, slab.shape[1] // f, slab.shape[2] // f
+        blocks = slab.reshape(bx, f, by, f, bz, f).transpose(0, 2, 4, 1, 3, 5).reshape(bx, by, bz, f ** 3)
+        if self.is_label:
+            return block_mode(blocks.reshape(-1, f ** 3)).reshape(bx, by, bz)
+        return blocks.mean(axis=3, dtype=np.float32)
+
+
+def block_mode(blocks: np.ndarray) -> np.ndarray:
+    """
+    Find the most common value in each row of ``blocks``. Ties are broken by the smallest value.
+    """
+    n, k = blocks.shape
+    s = np.sort(blocks, axis=1)
+    starts = np.ones((n, k), dtype=bool)
+    starts[:, 1:] = s[:, 1:] != s[:, :-1]
+    run_ids = np.cumsum(starts, axis=1) - 1
+    rows = np.arange(n)[:, None]
+    run_lengths = np.bincount((rows * k + run_ids).ravel(), minlength=n * k).reshape(n, k)
+    longest = run_lengths.argmax(axis=1)
+    first_of_longest = (run_ids == longest[:, None]).argmax(axis=1)
+    return s[np.arange(n), first_of_longest]
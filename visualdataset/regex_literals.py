@@ -0,0 +1,163 @@
+"""
+Static analysis of the regular expressions of matchers.
+
+Finds literal text which every match of a regular expression must contain, so that paths can be
+ruled out with plain substring tests instead of running the regular expression.
+
+The expressions are analyzed with the private parser of CPython's :mod:`re` (3.11+). If its internals
+are not as expected, nothing is found: matching stays correct, only without the speedups.
+"""
+
+import functools
+import re
+from typing import Optional, Callable, TypeVar
+
+try:
+    from re import _parser
+    from re._constants import (
+        LITERAL, NOT_LITERAL, SUBPATTERN, AT, AT_BEGINNING, AT_BEGINNING_STRING, AT_END, AT_END_STRING, IN, RANGE,
+        NEGATE, CATEGORY, MAX_REPEAT, MIN_REPEAT, POSSESSIVE_REPEAT, ATOMIC_GROUP, BRANCH
+    )
+except ImportError:
+    _parser = None
+
+_SLASH = ord('/')
+
+_T = TypeVar('_T')
+
+
+def _or_else(default: Callable[[], _T]) -> Callable[[Callable[[str], _T]], Callable[[str], _T]]:
+    """
+    Return ``default()`` instead of analyzing an expression if the parser of :mod:`re` is unavailable,
+    or fails on the internals of :mod:`re` having changed.
+    """
+    def decorator(analyze: Callable[[str], _T]) -> Callable[[str], _T]:
+        @functools.wraps(analyze)
+        def wrapper(regex: str) -> _T:
+            if _parser is None:
+                return default()
+            try:
+                return analyze(regex)
+            except (AttributeError, TypeError, ValueError):
+                return default()
+        return wrapper
+    return decorator
+
+
+@_or_else(list)
+def required_literals(regex: str) -> list[str]:
+    """
+    Find substrings which every string matched by ``regex`` contains.
+
+    Only literal text which is not inside of a repetition, alternation or character class is found, e.g.
+    ``mri/aparc\\.(mgz|nii)$`` requires ``"mri/aparc."``. Case-insensitive expressions require nothing.
+    """
+    compiled = re.compile(regex)
+    if compiled.flags & re.IGNORECASE:
+        return []
+    literals = []
+    _collect(_parser.parse(compiled.pattern, compiled.flags), literals)
+    return [literal for literal in literals if literal]
+
+
+def longest_required_literal(regex: str) -> str:
+    """
+    :return: the longest of :func:`required_literals`, or the empty string if there are none
+    """
+    return max(required_literals(regex), key=len, default='')
+
+
+def _collect(subpattern: '_parser.SubPattern', literals: list[str]):
+    """
+    Append the runs of consecutive literal characters of a parsed regular expression to ``literals``.
+    """
+    run = []
+    for op, av in subpattern:
+        if op is LITERAL:
+            run.append(chr(av))
+            continue
+        literals.append(''.join(run))
+        run = []
+        if op is SUBPATTERN:
+            _group, add_flags, _del_flags, p = av
+            if not add_flags & re.IGNORECASE:
+                _collect(p, literals)
+    literals.append(''.join(run))
+
+
+@_or_else(lambda: None)
+def parent_directory_suffix(regex: str) -> Optional[str]:
+    """
+    Find text which the parent directory of every matched path must end with, if the expression can only match
+    a path whose file name is after a literal ``/`` and which cannot contain ``/`` itself. For example,
+    ``mri/T1\\.(mgz|nii)$`` only matches files which are in a directory with a name ending with ``mri``.
+
+    :return: the text, or None if there is no such text
+    """
+    compiled = re.compile(regex)
+    if compiled.flags & re.IGNORECASE:
+        return None
+    items = list(_parser.parse(compiled.pattern, compiled.flags))
+    if not items or items[-1] not in ((AT, AT_END), (AT, AT_END_STRING)):
+        return None
+    slash = next((i for i in range(len(items) - 2, -1, -1) if items[i] == (LITERAL, _SLASH)), None)
+    if slash is None or any(_can_match_slash(op, av) for op, av in items[slash + 1:-1]):
+        return None
+    start = slash
+    while start > 0 and items[start - 1][0] is LITERAL:
+        start -= 1
+    return ''.join(chr(av) for _op, av in items[start:slash]) or None
+
+
+@_or_else(lambda: None)
+def path_depth(regex: str) -> Optional[int]:
+    """
+    Find the number of directories which every matched path has, if the expression is anchored at both ends
+    and can only match ``/`` with literal ``/`` outside of groups and repetitions. For example,
+    ``^sub-[0-9]+/mri/T1\\.mgz$`` only matches files which are two directories deep.
+
+    :return: the number of directories, or None if it is not fixed
+    """
+    compiled = re.compile(regex)
+    items = list(_parser.parse(compiled.pattern, compiled.flags))
+    if len(items) < 2 or items[0] not in ((AT, AT_BEGINNING), (AT, AT_BEGINNING_STRING)):
+        return None
+    if items[-1] not in ((AT, AT_END), (AT, AT_END_STRING)):
+        return None
+    depth = 0
+    for op, av in items[1:-1]:
+        if op is LITERAL and av == _SLASH:
+            depth += 1
+        elif _can_match_slash(op, av):
+            return None
+    return depth
+
+
+def _can_match_slash(op, av) -> bool:
+    """
+    Whether an item of a parsed regular expression can match a ``/``. Errs on the side of True.
+    """
+    if op is LITERAL:
+        return av == _SLASH
+    if op is NOT_LITERAL:
+        return av != _SLASH
+    if op is AT:
+        return False
+    if op is IN:
+        negated = bool(av) and av[0][0] is NEGATE
+        contains_slash = any(
+            (item_op is LITERAL and item_av == _SLASH) or (item_op is RANGE and item_av[0] <= _SLASH <= item_av[1])
+            for item_op, item_av in av
+        )
+        if negated:
+            return not contains_slash
+        return contains_slash or any(item_op is CATEGORY for item_op, _item_av in av)
+    if op in (MAX_REPEAT, MIN_REPEAT, POSSESSIVE_REPEAT):
+        return any(_can_match_slash(*item) for item in av[2])
+    if op is SUBPATTERN:
+        return any(_can_match_slash(*item) for item in av[3])
+    if op is ATOMIC_GROUP:
+        return any(_can_match_slash(*item) for item in av)
+    if op is BRANCH:
+        return any(_can_match_slash(*item) for branch in av[1] for item in branch)
+    return True
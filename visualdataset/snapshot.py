@@ -0,0 +1,224 @@
+"""
+A listing of an input directory which is made by walking it once, and then shared by everything
+which looks for files in it (indexing, first run files, files given as arguments, colormaps).
+"""
+
+import fnmatch
+import os
+import stat
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path, PurePath
+from typing import Iterator, NamedTuple, Optional, Callable
+
+from visualdataset.traversal import TraversalFilter
+
+
+class _Listing(NamedTuple):
+    matching: tuple[str, ...]
+    """
+    Names of the regular files which have one of the snapshot's suffixes.
+    """
+    others: tuple[str, ...]
+    """
+    Names of the other entries which are not directories. Their type was not checked, so they may be
+    e.g. symbolic links to directories.
+    """
+    subdirs: tuple[str, ...]
+
+
+class DirectorySnapshot:
+    """
+    The files under a directory, listed with ``os.scandir``.
+
+    The directory is walked lazily: :meth:`matching_files` yields files while the walk is still going,
+    and the other queries finish the walk first. Queries about a single path which has not been listed
+    (yet) fall back to a ``stat`` call. Results of ``stat`` calls are kept.
+
+    Like ``Path.rglob``, symbolic links to directories are not followed and unreadable directories are skipped.
+    """
+
+    def __init__(self, root: Path, suffixes: tuple[str, ...], threads: int = 1,
+                 traversal: Optional[TraversalFilter] = None):
+        """
+        :param suffixes: files with names ending with one of these are checked to be regular files while listing,
+                         which is usually free because ``os.scandir`` knows the types of entries.
+        :param threads: if greater than 1, list this many directories concurrently. Helps on high-latency
+                        filesystems (e.g. NFS), where the time of a scan is spent waiting on the server.
+        :param traversal: which subdirectories to walk into and which matching files to keep
+        """
+        self.root = root
+        self.suffixes = suffixes
+        self.threads = threads
+        self._traversal = traversal
+        self._listings: dict[str, _Listing] = {}
+        """
+        Listings of directories by their path relative to ``root``, ending with a separator (or empty for ``root``).
+        """
+        self._walk: Optional[Iterator[str]] = None
+        self._complete = False
+        self._stats: dict[str, Optional[os.stat_result]] = {}
+
+    def matching_files(self) -> Iterator[PurePath]:
+        """
+        Paths, relative to ``root``, of all the regular files which have one of the suffixes.
+
+        The first call walks the directory. Other queries must not be made while it is being iterated.
+        """
+        for prefix in self._prefixes():
+            for name in self._listings[prefix].matching:
+                yield PurePath(prefix + name)
+
+    def glob(self, pattern: str) -> Iterator[str]:
+        """
+        Paths, relative to ``root``, of the regular files with names matching ``pattern`` in any directory,
+        like ``filter(Path.is_file, root.rglob(pattern))``. Directories are visited in the order ``rglob`` does.
+        """
+        self._finish()
+        for prefix in self._in_order():
+            listing = self._listings[prefix]
+            for name in fnmatch.filter(listing.matching, pattern):
+                yield prefix + name
+            for name in fnmatch.filter(listing.others, pattern):
+                if self.is_file(prefix + name):
+                    yield prefix + name
+
+    def set_traversal(self, traversal: Optional[TraversalFilter]):
+        """
+        Change which subdirectories are walked into. Must be called before the walk starts.
+        """
+        if self._walk is not None:
+            raise RuntimeError('Directory is already being walked')
+        self._traversal = traversal
+
+    @property
+    def directories_listed(self) -> int:
+        return len(self._listings)
+
+    def is_file(self, path: str) -> bool:
+        """
+        Whether ``path``, relative to ``root``, is a regular file (or a symbolic link to one).
+        """
+        directory, sep, name = path.rpartition(os.sep)
+        listing = self._listings.get(directory + sep)
+        if listing is not None and name in listing.matching:
+            return True
+        if listing is not None and name not in listing.others:
+            return False
+        st = self.stat(path)
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    def stat(self, path: str) -> Optional[os.stat_result]:
+        """
+        :return: the result of ``stat`` on ``path`` relative to ``root``, or None if it does not exist
+        """
+        if path not in self._stats:
+            try:
+                self._stats[path] = os.stat(self.root / path)
+            except (OSError, ValueError):  # e.g. not found, or too long or with a NUL because it is not a path
+                self._stats[path] = None
+        return self._stats[path]
+
+    def _prefixes(self) -> Iterator[str]:
+        if self._walk is None and not self._complete:
+            self._walk = self._walk_tree()
+            yield from self._walk
+        else:
+            self._finish()
+            yield from self._in_order()
+
+    def _finish(self):
+        if self._complete:
+            return
+        if self._walk is None:
+            self._walk = self._walk_tree()
+        for _ in self._walk:
+            pass
+
+    def _in_order(self) -> Iterator[str]:
+        stack = ['']
+        while stack:
+            prefix = stack.pop()
+            yield prefix
+            stack.extend(prefix + name + os.sep for name in reversed(self._listings[prefix].subdirs))
+
+    def _walk_tree(self) -> Iterator[str]:
+        """
+        List every directory, yielding their prefixes as soon as they are recorded in ``_listings``.
+        """
+        if self.threads <= 1:
+            stack = ['']
+            while stack:
+                prefix, listing = self._list_dir(stack.pop())
+                yield self._record(prefix, listing)
+                stack.extend(prefix + name + os.sep for name in reversed(listing.subdirs))
+        else:
+            pool = ThreadPoolExecutor(self.threads, thread_name_prefix='scandir')
+            try:
+                pending = {pool.submit(self._list_dir, '')}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        prefix, listing = future.result()
+                        pending.update(
+                            pool.submit(self._list_dir, prefix + name + os.sep) for name in listing.subdirs
+                        )
+                        yield self._record(prefix, listing)
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+        self._complete = True
+
+    def _record(self, prefix: str, listing: _Listing) -> str:
+        self._listings[prefix] = listing
+        return prefix
+
+    def _list_dir(self, prefix: str) -> tuple[str, _Listing]:
+        matching = []
+        others = []
+        subdirs = []
+        try:
+            with os.scandir(os.path.join(self.root, prefix)) as entries:
+                for entry in entries:
+                    name = sys.intern(entry.name)  # the same names are in many directories
+                    if name.endswith(self.suffixes):
+                        if entry.is_file():
+                            matching.append(name)
+                        elif entry.is_dir(follow_symlinks=False):
+                            subdirs.append(name)
+                    elif entry.is_dir(follow_symlinks=False):
+                        subdirs.append(name)
+                    else:
+                        others.append(name)
+        except PermissionError:
+            pass
+        if self._traversal is not None:
+            directory = os.path.join(self.root, prefix)
+            subdirs = self._traversal.subdirs(prefix, subdirs, _leaf_test(directory, len(subdirs)))
+            matching = [name for name in matching if self._traversal.accepts_file(prefix, name)]
+        return prefix, _Listing(tuple(matching), tuple(others), tuple(subdirs))
+
+
+def _leaf_test(directory: str, subdirs: int) -> Callable[[str], bool]:
+    """
+    Tell whether subdirectories of ``directory`` have no subdirectories themselves, without listing them,
+    from their link counts: on most POSIX filesystems, a directory has a link from its parent, one from
+    itself (``.``) and one from each of its subdirectories (``..``). Link counts are only trusted if
+    ``directory`` itself has the expected count, ``subdirs`` + 2, since e.g. btrfs always counts 1.
+
+    :param subdirs: number of subdirectories of ``directory``
+    """
+    parent: Optional[os.stat_result] = None
+
+    def is_leaf(name: str) -> bool:
+        nonlocal parent
+        try:
+            if parent is None:
+                parent = os.lstat(directory)
+            if parent.st_nlink != subdirs + 2:
+                return False
+            st = os.lstat(os.path.join(directory, name))
+        except OSError:
+            return False
+        return st.st_dev == parent.st_dev and st.st_nlink == 2
+
+    return is_leaf
@@ -0,0 +1,232 @@
+"""
+Mergeable statistics of voxel values, computed in one streaming pass over the slabs of a volume.
+
+All values are unscaled, i.e. in the units of the file's own dtype.
+"""
+
+import math
+from typing import Optional, Self
+
+import numpy as np
+
+_EXACT_MAX_BITS = 16
+"""
+Integer dtypes up to this size are counted exactly, with one histogram bin per possible value.
+"""
+
+_SKETCH_RELATIVE_ACCURACY = 0.01
+"""
+Relative accuracy of the quantiles of values which are not counted exactly.
+"""
+
+
+class VolumeStatistics:
+    """
+    Minimum, maximum, and (optionally) the distribution of voxel values.
+
+    The distribution of integer dtypes of up to 16 bits is counted exactly. Other dtypes
+    are summarized by a logarithmically-bucketed quantile sketch ("DDSketch") which has a
+    relative error of at most 1%. Both kinds of summaries can be merged, so statistics of
+    different slabs (or of different parts of a volume computed by different workers)
+    can be combined.
+    """
+
+    def __init__(self, dtype: np.dtype, distribution: bool = True):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._exact: Optional[np.ndarray] = None
+        self._exact_offset = 0
+        self._sketch: Optional[_LogSketch] = None
+        if distribution:
+            if np.issubdtype(self.dtype, np.integer) and self.dtype.itemsize * 8 <= _EXACT_MAX_BITS:
+                info = np.iinfo(self.dtype)
+                self._exact = np.zeros(int(info.max) - int(info.min) + 1, dtype=np.int64)
+                self._exact_offset = int(info.min)
+            else:
+                self._sketch = _LogSketch(_SKETCH_RELATIVE_ACCURACY)
+
+    def update(self, slab: np.ndarray):
+        """
+        Add the values of ``slab`` (which must have this object's dtype). Non-finite values are ignored.
+        """
+        values = slab.ravel()
+        if np.issubdtype(values.dtype, np.floating):
+            values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        lo, hi = values.min(), values.max()
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+        self.count += values.size
+        if self._exact is not None:
+            if self._exact_offset != 0:
+                values = values.astype(np.int32) - self._exact_offset
+            self._exact += np.bincount(values, minlength=self._exact.size)
+        elif self._sketch is not None:
+            self._sketch.update(values)
+
+    def merge(self, other: Self):
+        """
+        Add the values summarized by ``other``, which must have been created with the same arguments.
+        """
+        if other.count == 0:
+            return
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.count += other.count
+        if self._exact is not None:
+            self._exact += other._exact
+        elif self._sketch is not None:
+            self._sketch.merge(other._sketch)
+
+    def quantile(self, q: float) -> float:
+        """
+        Get the value at quantile ``q``, where ``0 <= q <= 1``. The quantiles 0 and 1 are exact.
+        """
+        if self.count == 0:
+            raise ValueError('No values')
+        if q <= 0:
+            return float(self.min)
+        if q >= 1:
+            return float(self.max)
+        values, counts = self._weighted_values()
+        rank = q * (self.count - 1)
+        i = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        return float(np.clip(values[min(i, len(values) - 1)], self.min, self.max))
+
+    def histogram(self, bins: int) -> tuple[float, float, list[int]]:
+        """
+        Count values in ``bins`` equally sized bins from the minimum to the maximum value.
+
+        :return: lower edge of the first bin, upper edge of the last bin, and the counts
+        """
+        if self.count == 0:
+            raise ValueError('No values')
+        values, counts = self._weighted_values()
+        lo, hi = float(self.min), float(self.max)
+        if lo == hi:
+            hi = lo + 1
+        hist, _edges = np.histogram(np.clip(values, lo, hi), bins=bins, range=(lo, hi), weights=counts)
+        return lo, hi, hist.astype(np.int64).tolist()
+
+    def _weighted_values(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: distinct (representative) values in ascending order, and how many voxels have each of them
+        """
+        if self._exact is not None:
+            nonzero = np.flatnonzero(self._exact)
+            return nonzero + self._exact_offset, self._exact[nonzero]
+        if self._sketch is not None:
+            return self._sketch.weighted_values()
+        raise ValueError('Distribution of values was not computed')
+
+
+class _LogSketch:
+    """
+    Quantile sketch where a value ``x`` is counted in the bucket ``ceil(log(|x|, gamma))``,
+    separately for positive and negative values.
+
+    Charles Masson, Jee E. Rim, and Homin K. Lee. 2019. DDSketch: a fast and fully-mergeable quantile
+    sketch with relative-error guarantees. https://doi.org/10.14778/3352063.3352135
+    """
+
+    def __init__(self, relative_accuracy: float):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: dict[int, int] = {}
+        self.negative: dict[int, int] = {}
+        self.zeros = 0
+
+    def update(self, values: np.ndarray):
+        values = values.astype(np.float64, copy=False)
+        positive = values[values > 0]
+        negative = -values[values < 0]
+        self.zeros += values.size - positive.size - negative.size
+        self._add(self.positive, positive)
+        self._add(self.negative, negative)
+
+    def _add(self, buckets: dict[int, int], magnitudes: np.ndarray):
+        if magnitudes.size == 0:
+            return
+        keys = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        unique, counts = np.unique(keys, return_counts=True)
+        for k, c in zip(unique.tolist(), counts.tolist()):
+            buckets[k] = buckets.get(k, 0) + c
+
+    def merge(self, other: Self):
+        self.zeros += other.zeros
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for k, c in theirs.items():
+                mine[k] = mine.get(k, 0) + c
+
+    def weighted_values(self) -> tuple[np.ndarray, np.ndarray]:
+        neg_keys = sorted(self.negative, reverse=True)
+        pos_keys = sorted(self.positive)
+        values = np.concatenate([
+            -self._representative(np.array(neg_keys, dtype=np.float64)),
+            np.zeros(1 if self.zeros else 0),
+            self._representative(np.array(pos_keys, dtype=np.float64))
+        ])
+        counts = np.array(
+            [self.negative[k] for k in neg_keys]
+            + ([self.zeros] if self.zeros else [])
+            + [self.positive[k] for k in pos_keys],
+            dtype=np.int64
+        )
+        return values, counts
+
+    def _representative(self, keys: np.ndarray) -> np.ndarray:
+        return 2 * np.power(self.gamma, keys) / (self.gamma + 1)
+
+
+_MAX_BINCOUNT_SPAN = 1 << 20
+"""
+Label values are counted with ``np.bincount`` when the difference between the smallest and
+largest label of a slab is at most this, otherwise with ``np.unique``.
+"""
+
+
+class LabelCounts:
+    """
+    Number of voxels having each value of an integer-valued label volume.
+
+    If any value is not an integer, the volume is not a label volume and ``integral`` becomes False.
+    """
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.integral = True
+
+    def update(self, slab: np.ndarray):
+        if not self.integral:
+            return
+        values = slab.ravel()
+        if not np.issubdtype(values.dtype, np.integer):
+            if not np.all(np.isfinite(values)) or not np.all(values == np.trunc(values)):
+                self.integral = False
+                self.counts.clear()
+                return
+            values = values.astype(np.int64)
+        if values.size == 0:
+            return
+        lo, hi = int(values.min()), int(values.max())
+        if hi - lo <= _MAX_BINCOUNT_SPAN:
+            counts = np.bincount(values.astype(np.int64, copy=False) - lo, minlength=hi - lo + 1)
+            labels = np.flatnonzero(counts)
+            pairs = zip((labels + lo).tolist(), counts[labels].tolist())
+        else:
+            labels, counts = np.unique(values, return_counts=True)
+            pairs = zip(labels.tolist(), counts.tolist())
+        for label, count in pairs:
+            self.counts[label] = self.counts.get(label, 0) + count
+
+    def merge(self, other: Self):
+        if not other.integral:
+            self.integral = False
+            self.counts.clear()
+        if not self.integral:
+            return
+        for label, count in other.counts.items():
+            self.counts[label] = self.counts.get(label, 0) + count
@@ -0,0 +1,180 @@
+"""
+A persistent cache of volume statistics, shared across plugin runs.
+
+Entries are keyed by a cheap fingerprint of the volume file (its size, modification
+time, and a hash of its first and last bytes) so that an unchanged file does not need
+to be decompressed again. The cache is a SQLite database in write-ahead-logging mode,
+so it is safe for many processes to read and write it concurrently (on a local
+filesystem: SQLite locking is unreliable over NFS). The space of evicted entries is
+returned to the filesystem, so the database stays about as large as its entries.
+"""
+
+import contextlib
+import hashlib
+import json
+import multiprocessing.util
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+_EDGE_SIZE = 64 * 1024
+"""
+Number of bytes from the start and from the end of a file which are hashed by :func:`fingerprint`.
+"""
+
+_SCHEMA_VERSION = 1
+_DB_NAME = f'volume_stats.v{_SCHEMA_VERSION}.sqlite3'
+_TOUCH_INTERVAL = 3600
+"""
+Minimum number of seconds between updates to an entry's last access time.
+"""
+
+
+def fingerprint(path: Path, stat: Optional[os.stat_result] = None) -> str:
+    """
+    Identify the content of a file without reading all of it.
+    """
+    if stat is None:
+        stat = path.stat()
+    h = hashlib.blake2b(digest_size=16)
+    with path.open('rb') as f:
+        h.update(f.read(_EDGE_SIZE))
+        if stat.st_size > 2 * _EDGE_SIZE:
+            f.seek(-_EDGE_SIZE, os.SEEK_END)
+        h.update(f.read(_EDGE_SIZE))
+    return f'{stat.st_size}:{stat.st_mtime_ns}:{h.hexdigest()}'
+
+
+class StatsCache:
+    """
+    Key-value store for JSON-serializable volume statistics.
+
+    Each value is stored under the fingerprint of the file it was computed from and a
+    ``variant`` string, which should identify the settings used to compute the value.
+    """
+
+    def __init__(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / _DB_NAME
+        self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')  # only has an effect on a new database
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS stats ('
+            ' fingerprint TEXT NOT NULL,'
+            ' variant TEXT NOT NULL,'
+            ' value TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' accessed REAL NOT NULL,'
+            ' PRIMARY KEY (fingerprint, variant))'
+        )
+
+    def get(self, fingerprint: str, variant: str = '') -> Optional[Any]:
+        row = self._conn.execute(
+            'SELECT value, accessed FROM stats WHERE fingerprint = ? AND variant = ?',
+            (fingerprint, variant)
+        ).fetchone()
+        if row is None:
+            return None
+        value, accessed = row
+        now = time.time()
+        if now - accessed > _TOUCH_INTERVAL:
+            self._conn.execute(
+                'UPDATE stats SET accessed = ? WHERE fingerprint = ? AND variant = ?',
+                (now, fingerprint, variant)
+            )
+        return json.loads(value)
+
+    def put(self, fingerprint: str, variant: str, value: Any):
+        now = time.time()
+        self._conn.execute(
+            'INSERT OR REPLACE INTO stats (fingerprint, variant, value, created, accessed) VALUES (?, ?, ?, ?, ?)',
+            (fingerprint, variant, json.dumps(value), now, now)
+        )
+
+    def evict(self, max_size: Optional[int] = None, max_age: Optional[float] = None) -> int:
+        """
+        Delete entries which were created more than ``max_age`` seconds ago, then delete the
+        least recently used entries until the total size of the stored values is at most
+        ``max_size`` bytes. The space of the deleted entries is returned to the filesystem.
+
+        :return: number of entries deleted
+        """
+        deleted = 0
+        with self._transaction():
+            if max_age is not None:
+                deleted += self._conn.execute(
+                    'DELETE FROM stats WHERE created < ?', (time.time() - max_age,)
+                ).rowcount
+            if max_size is not None:
+                deleted += self._evict_lru(max_size)
+        if deleted:
+            self._shrink()
+        return deleted
+
+    def _shrink(self):
+        (auto_vacuum,) = self._conn.execute('PRAGMA auto_vacuum').fetchone()
+        if auto_vacuum == 2:  # INCREMENTAL
+            self._conn.executescript('PRAGMA incremental_vacuum')  # execute() would only free one page
+        else:  # created before auto_vacuum was set, VACUUM also applies it
+            self._conn.execute('VACUUM')
+        self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _evict_lru(self, max_size: int) -> int:
+        (total,) = self._conn.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM stats').fetchone()
+        if total <= max_size:
+            return 0
+        doomed = []
+        rows = self._conn.execute('SELECT fingerprint, variant, LENGTH(value) FROM stats ORDER BY accessed').fetchall()
+        for fp, variant, size in rows:
+            if total <= max_size:
+                break
+            doomed.append((fp, variant))
+            total -= size
+        self._conn.executemany('DELETE FROM stats WHERE fingerprint = ? AND variant = ?', doomed)
+        return len(doomed)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        ``BEGIN IMMEDIATE`` takes the write lock up front, so concurrent writers wait instead of deadlocking.
+        """
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def close(self):
+        self._conn.close()
+
+
+_OPEN_CACHES: dict[tuple[int, Path], StatsCache] = {}
+
+
+def open_cache(directory: Path) -> StatsCache:
+    """
+    Get the :class:`StatsCache` in ``directory``, opening it at most once per process.
+
+    SQLite connections must not be shared with forked child processes, so each process gets its own,
+    which is closed by :func:`close_caches` or when the process exits (including worker processes).
+    """
+    key = (os.getpid(), directory)
+    if key not in _OPEN_CACHES:
+        cache = _OPEN_CACHES[key] = StatsCache(directory)
+        multiprocessing.util.Finalize(None, cache.close, exitpriority=0)
+    return _OPEN_CACHES[key]
+
+
+def close_caches():
+    """
+    Close the caches which were opened by :func:`open_cache` in this process.
+    """
+    pid = os.getpid()
+    for key in [key for key in _OPEN_CACHES if key[0] == pid]:
+        _OPEN_CACHES.pop(key).close()
@@ -0,0 +1,150 @@
+"""
+Thumbnails of volumes: the axial, coronal and sagittal mid-slices side by side, as a PNG image.
+
+The mid-slices are collected from the same slabs as the statistics of a volume.
+"""
+
+import struct
+import zlib
+from pathlib import Path
+from typing import Optional, Mapping, Sequence
+
+import numpy as np
+from nibabel.orientations import io_orientation
+from nibabel.spatialimages import SpatialImage
+
+from visualdataset.volume_reader import scaling
+
+_VIEWS = (
+    (2, 0, 1),  # axial: normal to S, left-to-right is R, bottom-to-top is A
+    (1, 0, 2),  # coronal: normal to A, left-to-right is R, bottom-to-top is S
+    (0, 1, 2),  # sagittal: normal to R, left-to-right is A, bottom-to-top is S
+)
+"""
+For each view: the world axis normal to the slice, and the world axes which are shown horizontally and vertically.
+"""
+
+_GAP = 2
+"""
+Number of pixels between the views.
+"""
+
+
+class ThumbnailBuilder:
+    """
+    Reducer which collects the mid-slices of the first 3D frame of a volume.
+    """
+
+    def __init__(self, vol: SpatialImage):
+        shape = tuple(vol.shape) + (1,) * (3 - len(vol.shape))
+        self._shape = shape[:3]
+        self._ornt = io_orientation(vol.affine)
+        self._slope, self._inter = scaling(vol)
+        # the same voxel is chosen whichever direction an axis is stored in
+        self._mid = tuple(n // 2 if flip > 0 else (n - 1) // 2 for n, (_, flip) in zip(self._shape, self._ornt))
+        self._planes_seen = 0
+        self._slices: list[list[np.ndarray]] = [[], [], []]
+        """
+        Parts of the mid-slice normal to each voxel axis.
+        """
+
+    def update(self, slab: np.ndarray):
+        depth = self._shape[2]
+        start = self._planes_seen
+        self._planes_seen += slab.shape[2]
+        if start >= depth:
+            return
+        slab = slab[..., :depth - start]
+        self._slices[0].append(np.array(slab[self._mid[0], :, :]))
+        self._slices[1].append(np.array(slab[:, self._mid[1], :]))
+        if start <= self._mid[2] < start + slab.shape[2]:
+            self._slices[2].append(np.array(slab[:, :, self._mid[2] - start]))
+
+    def result(self, window: Optional[tuple[float, float]], colormap: Optional[Mapping] = None) -> np.ndarray:
+        """
+        Render the thumbnail.
+
+        :param window: range of (scaled) values which is mapped from black to white
+        :param colormap: NiiVue label colormap, for label volumes
+        :return: RGB image as an array of shape ``(height, width, 3)``
+        """
+        slices = [np.concatenate(parts, axis=-1) for parts in self._slices]
+        views = [self._orient(slices, *view) for view in _VIEWS]
+        views = [v * self._slope + self._inter if (self._slope, self._inter) != (1.0, 0.0) else v for v in views]
+        if colormap is not None:
+            rgb = [colorize_labels(v, colormap) for v in views]
+        else:
+            if window is None:
+                window = float(min(v.min() for v in views)), float(max(v.max() for v in views))
+            rgb = [grayscale(v, window) for v in views]
+        return _montage(rgb)
+
+    def _orient(self, slices: list[np.ndarray], normal: int, horizontal: int, vertical: int) -> np.ndarray:
+        """
+        Get the mid-slice normal to a world axis, as an image where rows go from top to bottom
+        (decreasing along the ``vertical`` world axis) and columns go from left to right
+        (increasing along the ``horizontal`` world axis).
+        """
+        world_to_voxel = {int(world): voxel for voxel, (world, _flip) in enumerate(self._ornt)}
+        voxel_axis = world_to_voxel[normal]
+        image = slices[voxel_axis]
+        remaining = [a for a in range(3) if a != voxel_axis]
+        h, v = remaining.index(world_to_voxel[horizontal]), remaining.index(world_to_voxel[vertical])
+        image = image.transpose(h, v)
+        if self._ornt[world_to_voxel[horizontal], 1] < 0:
+            image = image[::-1, :]
+        if self._ornt[world_to_voxel[vertical], 1] < 0:
+            image = image[:, ::-1]
+        return image.T[::-1, :]
+
+
+def grayscale(image: np.ndarray, window: tuple[float, float]) -> np.ndarray:
+    lo, hi = window
+    scale = 255 / (hi - lo) if hi > lo else 0
+    scaled = np.nan_to_num((image.astype(np.float64) - lo) * scale, nan=0.0)  # non-finite values are black
+    gray = np.rint(np.clip(scaled, 0, 255)).astype(np.uint8)
+    return np.repeat(gray[..., None], 3, axis=2)
+
+
+def colorize_labels(image: np.ndarray, colormap: Mapping[str, Sequence]) -> np.ndarray:
+    """
+    Color a label image using a NiiVue label colormap. Labels which are not in the colormap are black.
+    """
+    indices = np.asarray(colormap.get('I', range(len(colormap['R']))), dtype=np.int64)
+    colors = np.stack([colormap['R'], colormap['G'], colormap['B']], axis=1).astype(np.uint8)
+    order = np.argsort(indices)
+    indices, colors = indices[order], colors[order]
+    labels = np.rint(image).astype(np.int64)
+    pos = np.clip(np.searchsorted(indices, labels), 0, len(indices) - 1)
+    found = indices[pos] == labels
+    rgb = np.zeros(labels.shape + (3,), dtype=np.uint8)
+    rgb[found] = colors[pos[found]]
+    return rgb
+
+
+def _montage(images: list[np.ndarray]) -> np.ndarray:
+    height = max(i.shape[0] for i in images)
+    width = sum(i.shape[1] for i in images) + _GAP * (len(images) - 1)
+    montage = np.zeros((height, width, 3), dtype=np.uint8)
+    x = 0
+    for image in images:
+        y = (height - image.shape[0]) // 2
+        montage[y:y + image.shape[0], x:x + image.shape[1]] = image
+        x += image.shape[1] + _GAP
+    return montage
+
+
+def write_png(path: Path, rgb: np.ndarray):
+    """
+    Write an RGB image of shape ``(height, width, 3)`` and dtype uint8 as a PNG file.
+    """
+    height, width, _ = rgb.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)  # filter type 0 (none) for every row
+    raw[:, 1:] = rgb.reshape(height, width * 3)
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    with path.open('wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        for chunk_type, data in ((b'IHDR', header), (b'IDAT', zlib.compress(raw.tobytes(), 6)), (b'IEND', b'')):
+            f.write(struct.pack('>I', len(data)))
+            f.write(chunk_type + data)
+            f.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
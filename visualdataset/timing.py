@@ -0,0 +1,164 @@
+"""
+Measuring where the time of a run goes: wall and CPU time of every stage, and for every volume,
+the time spent decoding its voxels and reducing them (statistics, previews, thumbnail).
+
+The measurements are written to the output directory as a :class:`TimingReport`. Stages may overlap:
+with ``--pipeline``, the input directory is indexed while ``sidecars`` are written.
+"""
+
+import contextlib
+import resource
+import time
+from pathlib import Path
+from typing import TypedDict, NotRequired, Iterator, Iterable, TypeVar, Optional
+
+from pydantic import TypeAdapter
+
+TIMING_NAME = '.chrisvisualdataset.timing.json'
+PROFILE_NAME = '.chrisvisualdataset.profile.pstats'
+_REPORT_VERSION = 1
+
+_T = TypeVar('_T')
+
+
+class StageTiming(TypedDict):
+    wall: float
+    """
+    Wall time in seconds.
+    """
+    cpu: NotRequired[float]
+    """
+    CPU time of this process in seconds. Unset for stages which are interleaved with others.
+    """
+    children_cpu: NotRequired[float]
+    """
+    CPU time of finished worker processes in seconds, see ``--jobs``.
+    """
+
+
+class FileTiming(TypedDict):
+    path: str
+    wall: float
+    """
+    Time to write all the outputs of the volume, in seconds.
+    """
+    decode: float
+    """
+    Time spent reading and decoding voxels, in seconds.
+    """
+    reduce: float
+    """
+    Time spent computing statistics, previews and thumbnail from the decoded voxels, in seconds.
+    """
+    bytes_read: int
+    """
+    Size of the volume file, or 0 if its voxels were not read (i.e. its statistics were cached).
+    """
+    voxels: int
+
+
+class TimingReport(TypedDict):
+    version: int
+    stages: dict[str, StageTiming]
+    """
+    Timing of every stage, in the order they ran.
+    """
+    files: list[FileTiming]
+    """
+    Timing of every volume of which outputs were written.
+    """
+
+
+_REPORT_ADAPTER = TypeAdapter(TimingReport)
+
+
+class StageTimer:
+    """
+    Accumulates the timing of the stages of a run.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, StageTiming] = {}
+        self.files: list[FileTiming] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Measure the wall and CPU time of the ``with`` block. The times of blocks with the same name are summed.
+        """
+        wall, cpu, children_cpu = time.perf_counter(), time.process_time(), _children_cpu()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, StageTiming(wall=0.0, cpu=0.0, children_cpu=0.0))
+            timing['wall'] += time.perf_counter() - wall
+            timing['cpu'] = timing.get('cpu', 0.0) + time.process_time() - cpu
+            timing['children_cpu'] = timing.get('children_cpu', 0.0) + _children_cpu() - children_cpu
+
+    def add(self, name: str, wall: float):
+        """
+        Add to the wall time of a stage which is not measured as a block, e.g. because it is interleaved
+        with other stages.
+        """
+        timing = self.stages.setdefault(name, StageTiming(wall=0.0))
+        timing['wall'] += wall
+
+    def report(self) -> TimingReport:
+        return TimingReport(version=_REPORT_VERSION, stages=self.stages, files=self.files)
+
+    def write(self, output_dir: Path):
+        (output_dir / TIMING_NAME).write_bytes(_REPORT_ADAPTER.dump_json(self.report(), indent=2))
+
+
+class DecodeTimer:
+    """
+    Timing of the single pass over the voxels of a volume, see ``_reduce`` in :mod:`visualdataset.volume_sidecar`.
+    """
+    __slots__ = ('decode', 'reduce', 'voxels')
+
+    def __init__(self):
+        self.decode = 0.0
+        self.reduce = 0.0
+        self.voxels = 0
+
+
+@contextlib.contextmanager
+def profiled(output: Optional[Path]) -> Iterator[None]:
+    """
+    Profile the ``with`` block with :mod:`cProfile`, saving the statistics to ``output`` (for :mod:`pstats`,
+    snakeviz, etc.). Only this process is profiled, not the worker processes of ``--jobs``.
+
+    :param output: where to save the statistics, or None to not profile
+    """
+    if output is None:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output)
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def timed(items: Iterable[_T], timer: StageTimer, name: str) -> Iterator[_T]:
+    """
+    Add the time spent producing each item of ``items`` to the stage ``name``.
+    """
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timer.add(name, time.perf_counter() - start)
+            return
+        timer.add(name, time.perf_counter() - start)
+        yield item
@@ -0,0 +1,160 @@
+"""
+Pruning of the directories which are walked when scanning an input directory.
+"""
+
+import fnmatch
+import os
+from typing import Sequence, Optional, NamedTuple, Callable
+
+from visualdataset.args_types import Matcher
+from visualdataset.regex_literals import parent_directory_suffix, path_depth
+
+
+class DirectoryHint(NamedTuple):
+    """
+    Where the files matched by a matcher can be, see :func:`directory_hints`.
+    """
+    depth: Optional[int]
+    """
+    Number of directories between the input directory and a matched file, or None if it can be any.
+    """
+    parent: str = ''
+    """
+    Text which the name of the directory of a matched file ends with (empty if unknown).
+    """
+
+
+def _unknown_leaf(_name: str) -> bool:
+    return False
+
+
+class TraversalFilter:
+    """
+    Decides which subdirectories to walk into and which files to index.
+
+    - ``exclude``: glob patterns of directories and files to skip. A pattern containing ``/`` is matched
+      against paths relative to the input directory, otherwise against the name of every directory and file.
+    - ``include``: if any, glob patterns of directories and files to index. Everything under an included
+      directory is included. Directories which cannot lead to an included path are not walked into.
+    - ``hints``: see :func:`directory_hints`.
+
+    Like with ``pathlib``, ``*`` does not match ``/``, and a ``**`` component matches any number of directories.
+    """
+
+    def __init__(self, include: Sequence[str] = (), exclude: Sequence[str] = (),
+                 hints: Sequence[DirectoryHint] = ()):
+        self._include = [_split(p) for p in include]
+        self._exclude = [_split(p) for p in exclude]
+        self._hints = tuple(hints)
+        self._any_depth = any(hint.depth is None for hint in self._hints)
+        self._included_dirs: dict[str, bool] = {'': False}
+        """
+        Whether each walked directory is (inside) an included directory, by its prefix.
+        """
+
+    def subdirs(self, prefix: str, names: Sequence[str],
+                is_leaf: Callable[[str], bool] = _unknown_leaf) -> tuple[str, ...]:
+        """
+        :param prefix: path of a directory relative to the input directory, ending with a separator or empty
+        :param names: names of its subdirectories
+        :param is_leaf: whether a subdirectory is known to have no subdirectories itself
+        :return: names of the subdirectories to walk into
+        """
+        parts = _components(prefix)
+        if self._hints:
+            depth = len(parts) + 1
+            names = [name for name in names if self._could_contain_match(depth, name, is_leaf)]
+        kept = []
+        for name in names:
+            path = parts + [name]
+            if any(_match(pattern, path) for pattern in self._exclude):
+                continue
+            if self._include:
+                included = self._included_dirs[prefix] or any(_match(pattern, path) for pattern in self._include)
+                if not included and not any(_could_contain(pattern, path) for pattern in self._include):
+                    continue
+                self._included_dirs[prefix + name + os.sep] = included
+            kept.append(name)
+        return tuple(kept)
+
+    def _could_contain_match(self, depth: int, name: str, is_leaf: Callable[[str], bool]) -> bool:
+        for hint in self._hints:
+            if hint.depth is None:
+                if name.endswith(hint.parent):
+                    return True
+            elif hint.depth > depth or (hint.depth == depth and name.endswith(hint.parent)):
+                return True
+        return self._any_depth and not is_leaf(name)
+
+    def accepts_file(self, prefix: str, name: str) -> bool:
+        """
+        Whether to index the file ``name`` in the directory ``prefix`` (which was accepted by :meth:`subdirs`).
+        """
+        if not self._exclude and not self._include:
+            return True
+        path = _components(prefix) + [name]
+        if any(_match(pattern, path) for pattern in self._exclude):
+            return False
+        if self._include:
+            return self._included_dirs.get(prefix, False) or any(_match(pattern, path) for pattern in self._include)
+        return True
+
+
+def directory_hints(matchers: Sequence[Matcher]) -> Optional[tuple[DirectoryHint, ...]]:
+    """
+    Find how deep the files matched by each matcher are, and what the name of their directory ends with.
+    Every matcher must either be anchored with a fixed number of directories, e.g. ``^sub-[0-9]+/mri/T1\\.mgz$``
+    (see :func:`visualdataset.regex_literals.path_depth`), or match files in a directory with a known name
+    at any depth, e.g. ``mri/T1\\.mgz$`` (see :func:`visualdataset.regex_literals.parent_directory_suffix`).
+
+    When walking with these hints, only directories which could contain a matched file are walked into:
+    directories which are not as deep as some matched file, directories as deep as the directory of
+    a matched file whose name ends with its parent directory name, and for matchers of any depth,
+    directories with a matching name or with subdirectories. For example, with only the first matcher above,
+    ``sub-01/surf`` and ``sub-01/mri/orig`` are skipped, and with the second, ``sub-01/surf`` is skipped
+    if it has no subdirectories. Nothing is skipped which a matcher could match.
+
+    :return: the hints, or None if some matcher could match files in any directory
+    """
+    hints = set()
+    for matcher in matchers:
+        depth = path_depth(matcher.regex)
+        suffix = parent_directory_suffix(matcher.regex) if depth != 0 else None
+        parent = '' if suffix is None else suffix.rpartition('/')[2]
+        if depth is None and not parent:
+            return None
+        hints.add(DirectoryHint(depth, parent))
+    return tuple(sorted(hints, key=lambda hint: (hint.depth is None, hint.depth or 0, hint.parent)))
+
+
+def _split(pattern: str) -> list[str]:
+    parts = [p for p in pattern.split('/') if p]
+    return parts if '/' in pattern else ['**', *parts]
+
+
+def _components(prefix: str) -> list[str]:
+    return prefix.split(os.sep)[:-1] if prefix else []
+
+
+def _match(pattern: Sequence[str], path: Sequence[str]) -> bool:
+    """
+    Whether the components of ``path`` match the components of ``pattern``.
+    """
+    if not pattern:
+        return not path
+    if pattern[0] == '**':
+        return any(_match(pattern[1:], path[i:]) for i in range(len(path) + 1))
+    return bool(path) and fnmatch.fnmatchcase(path[0], pattern[0]) and _match(pattern[1:], path[1:])
+
+
+def _could_contain(pattern: Sequence[str], path: Sequence[str]) -> bool:
+    """
+    Whether a path inside of the directory ``path`` could match ``pattern``.
+    """
+    if not path:
+        return True
+    if not pattern:
+        return False
+    if pattern[0] == '**':
+        return True
+    return fnmatch.fnmatchcase(path[0], pattern[0]) and _could_contain(pattern[1:], path[1:])
@@ -1,7 +1,8 @@
+import functools
 from collections import Counter
-from typing import Sequence, Mapping
+from typing import Sequence, Mapping, Iterable
 
-from visualdataset.manifest import VisualDatasetFile, OptionsLink
+from visualdataset.manifest import VisualDatasetFile, OptionsLink, IndexedFile
 from visualdataset.options import ChrisViewerFileOptions, NiivueVolumeSettings
 
 IMPORTANT_KEYS = ('name',)
@@ -19,11 +20,68 @@ def check_indexed_file_has_options(file: VisualDatasetFile, options: Sequence[Op
     2. Some important options are defined once
     """
     matched_options = [o.options for o in options if dict_is_subset(o.match, file.tags)]
-    counts = _count_option_keys(matched_options)
-    multiple = {k: v for k, v in counts.items() if v > 1}
-    left_out = [k for k, v in counts.items() if v == 0 and k in IMPORTANT_KEYS]
-    return ([f'`{k}` was defined {v} times for "{file.path}"' for k, v in multiple.items()]
-            + [f'`{k}` is unset for "{file.path}"' for k in left_out])
+    return [f'{problem} for "{file.path}"' for problem in _option_problems(matched_options)]
+
+
+def check_index_has_options(
+        index: Iterable[IndexedFile | VisualDatasetFile],
+        options: Sequence[OptionsLink],
+        max_examples: int = 3
+) -> Sequence[str]:
+    """
+    Same as :func:`check_indexed_file_has_options` for every file, but files with the same tags are only checked
+    once, and each problem is reported once with the number of files it affects and some of their paths.
+    """
+    options_index = OptionsIndex(options)
+    groups: dict[frozenset, list[str]] = {}
+    for file in index:
+        groups.setdefault(frozenset(file.tags.items()), []).append(str(file.path))
+
+    affected: dict[str, list[str]] = {}
+    counts: Counter[str] = Counter()
+    for tags, paths in groups.items():
+        matched_options = [options[i].options for i in options_index.matching(dict(tags))]
+        for problem in _option_problems(matched_options):
+            examples = affected.setdefault(problem, [])
+            examples.extend(paths[:max_examples - len(examples)])
+            counts[problem] += len(paths)
+
+    return [
+        f'{problem} for "{examples[0]}"' if counts[problem] == 1
+        else f'{problem} for {counts[problem]} files, e.g. ' + ', '.join(f'"{p}"' for p in examples)
+        for problem, examples in affected.items()
+    ]
+
+
+class OptionsIndex:
+    """
+    Finds the options which apply to a set of tags, using an index from each (key, value) pair
+    to the options which match it.
+    """
+
+    def __init__(self, options: Sequence[OptionsLink]):
+        self._always: list[int] = []
+        self._by_tag: dict[tuple[str, str], list[int]] = {}
+        self._sizes = [len(o.match) for o in options]
+        for i, option in enumerate(options):
+            if not option.match:
+                self._always.append(i)
+            for tag in option.match.items():
+                self._by_tag.setdefault(tag, []).append(i)
+        self._memo: dict[frozenset, tuple[int, ...]] = {}
+
+    def matching(self, tags: Mapping[str, str]) -> tuple[int, ...]:
+        """
+        :return: positions of the options which apply to ``tags``, in order
+        """
+        key = frozenset(tags.items())
+        if (found := self._memo.get(key)) is None:
+            hits: Counter[int] = Counter()
+            for tag in key:
+                hits.update(self._by_tag.get(tag, ()))
+            found = tuple(sorted(self._always + [i for i, n in hits.items() if n == self._sizes[i]]))
+            self._memo[key] = found
+        return found
 
 
 def dict_is_subset(a: Mapping[str, str], b: Mapping[str, str]) -> bool:
@@ -33,11 +91,18 @@ def dict_is_subset(a: Mapping[str, str], b: Mapping[str, str]) -> bool:
     return all(k in b and b[k] == v for k, v in a.items())
 
 
+def _option_problems(matched_options: Sequence[ChrisViewerFileOptions]) -> list[str]:
+    counts = _count_option_keys(matched_options)
+    multiple = {k: v for k, v in counts.items() if v > 1}
+    left_out = [k for k, v in counts.items() if v == 0 and k in IMPORTANT_KEYS]
+    return [f'`{k}` was defined {v} times' for k, v in multiple.items()] + [f'`{k}` is unset' for k in left_out]
+
+
 def _count_option_keys(matched_options: Sequence[ChrisViewerFileOptions]):
     """
     Count the number of times each option key and each niivue_defaults setting is defined.
     """
-    counter = _create_counter()
+    counter = _create_counter().copy()
     for options in matched_options:
         for k in options.keys():
             if k == 'niivue_defaults':
@@ -49,6 +114,7 @@ def _count_option_keys(matched_options: Sequence[ChrisViewerFileOptions]):
     return counter
 
 
+@functools.cache
 def _create_counter():
     options_keys = {k: 0 for k in ChrisViewerFileOptions.__annotations__.keys()}
     del options_keys['niivue_defaults']
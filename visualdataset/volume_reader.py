@@ -0,0 +1,134 @@
+"""
+Streaming access to the voxel data of volume files.
+
+Volumes are read as a sequence of "slabs": runs of whole planes along the first two
+axes of the volume, in the native dtype of the file. Peak memory is bounded by the
+chunk size instead of by the size of the volume.
+"""
+
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import nibabel as nib
+from nibabel.arrayproxy import ArrayProxy
+from nibabel.freesurfer.mghformat import MGHHeader, MGHImage
+from nibabel.spatialimages import SpatialImage
+
+from visualdataset.decompress import Backend, open_file
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+"""
+Default maximum number of bytes of voxel data to hold in memory at once.
+"""
+
+
+def load(img: Path, backend: Backend = 'auto') -> SpatialImage:
+    """
+    Load the header of a volume file without reading its voxel data.
+
+    ``nib.load`` reads the footer of MGZ files, which comes after the voxel data and so
+    requires decompressing the entire file. Here, only the fixed-size MGH header at the
+    start of the file is read, and the footer (scan parameters, which are not needed for
+    visualization) is left blank.
+    """
+    if not str(img).endswith('.mgz'):
+        return nib.load(img)
+    with open_file(img, backend) as f:
+        hdr_str = f.read(MGHHeader._hdrdtype.itemsize)
+    header = MGHHeader(hdr_str + bytes(MGHHeader._ftrdtype.itemsize))
+    return MGHImage(ArrayProxy(str(img), header), header.get_affine(), header)
+
+
+def plane_shape(shape: tuple[int, ...]) -> tuple[int, int, int]:
+    """
+    View an N-dimensional volume shape as ``(X, Y, planes)``, where ``planes`` is the
+    product of all the other dimensions.
+    """
+    padded = tuple(shape) + (1,) * (3 - len(shape))
+    return padded[0], padded[1], int(np.prod(padded[2:], dtype=np.int64))
+
+
+def scaling(vol: SpatialImage) -> tuple[float, float]:
+    """
+    :return: the ``(slope, intercept)`` which must be applied to the values produced by :func:`iter_slabs`.
+    """
+    dataobj = vol.dataobj
+    if not isinstance(dataobj, ArrayProxy):
+        return 1.0, 0.0
+    return float(dataobj.slope), float(dataobj.inter)
+
+
+def native_dtype(vol: SpatialImage) -> np.dtype:
+    """
+    :return: the dtype of the arrays produced by :func:`iter_slabs`.
+    """
+    return np.dtype(vol.dataobj.dtype).newbyteorder('=')
+
+
+def iter_slabs(
+        vol: SpatialImage,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        backend: Backend = 'auto',
+        threads: int = 0
+) -> Iterator[np.ndarray]:
+    """
+    Read the unscaled voxel data of ``vol`` as arrays of shape ``(X, Y, n)``,
+    where each array holds the next ``n`` planes of the volume and at most
+    ``chunk_size`` bytes (or exactly one plane, if a plane is bigger than that).
+
+    ``backend`` and ``threads`` are passed to :func:`visualdataset.decompress.open_file`.
+    """
+    x, y, planes = plane_shape(vol.dataobj.shape)
+    dtype = np.dtype(vol.dataobj.dtype)
+    plane_bytes = max(x * y * dtype.itemsize, 1)
+    per_slab = max(chunk_size // plane_bytes, 1)
+
+    if not _is_fortran_proxy(vol.dataobj):
+        yield from _iter_in_memory_slabs(vol, (x, y, planes), per_slab)
+        return
+
+    with open_file(vol.dataobj.file_like, backend, threads) as f:
+        _skip(f, vol.dataobj.offset)
+        for start in range(0, planes, per_slab):
+            n = min(per_slab, planes - start)
+            buf = f.read(n * plane_bytes)
+            if len(buf) != n * plane_bytes:
+                raise ValueError(f'Voxel data is truncated: expected {planes * plane_bytes} bytes')
+            slab = np.frombuffer(buf, dtype=dtype).reshape((x, y, n), order='F')
+            if not dtype.isnative:
+                slab = slab.astype(dtype.newbyteorder('='))
+            yield slab
+
+
+def is_streamable(vol: SpatialImage) -> bool:
+    """
+    :return: whether :func:`iter_slabs` reads ``vol`` slab by slab, instead of reading it whole into memory
+    """
+    return _is_fortran_proxy(vol.dataobj)
+
+
+def _skip(f, n: int):
+    """
+    Skip the first ``n`` bytes of ``f`` without seeking, since not every decompressor supports seeking.
+    """
+    while n > 0:
+        skipped = len(f.read(min(n, DEFAULT_CHUNK_SIZE)))
+        if skipped == 0:
+            raise ValueError('Unexpected end of file')
+        n -= skipped
+
+
+def _is_fortran_proxy(dataobj) -> bool:
+    return isinstance(dataobj, ArrayProxy) and dataobj.order == 'F' and isinstance(dataobj.file_like, str)
+
+
+def _iter_in_memory_slabs(vol: SpatialImage, shape: tuple[int, int, int], per_slab: int) -> Iterator[np.ndarray]:
+    """
+    Fallback for volumes which are not stored as a contiguous Fortran-ordered array in a file.
+    """
+    dataobj = vol.dataobj
+    data = dataobj.get_unscaled() if isinstance(dataobj, ArrayProxy) else dataobj
+    data = np.asanyarray(data).reshape(shape, order='F')
+    for start in range(0, shape[2], per_slab):
+        yield data[..., start:start + per_slab]
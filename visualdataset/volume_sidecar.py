@@ -1,23 +1,433 @@
+import math
+import time
 from pathlib import Path
+from typing import Optional, NamedTuple, Literal, TypedDict, NotRequired, Sequence, Mapping, Iterable, Iterator
 
 import numpy as np
 import nibabel as nib
-from pydantic import TypeAdapter
+from nibabel.freesurfer.mghformat import MGHHeader
+from nibabel.nifti1 import Nifti1Header
+from nibabel.spatialimages import SpatialImage
+from pydantic import TypeAdapter, ConfigDict
 
+from visualdataset import volume_reader
+from visualdataset.decompress import Backend
 from visualdataset.options import NiivueVolumeSettings
+from visualdataset.preview import PreviewBuilder
+from visualdataset.statistics import VolumeStatistics, LabelCounts
+from visualdataset.stats_cache import StatsCache, fingerprint
+from visualdataset.thumbnail import ThumbnailBuilder, write_png
+from visualdataset.timing import DecodeTimer
+from visualdataset.volume_reader import DEFAULT_CHUNK_SIZE, iter_slabs, scaling, native_dtype
 
-_SETTINGS_ADAPTER = TypeAdapter(NiivueVolumeSettings)
+RangeSource = Literal['header', 'data', 'auto']
+"""
+Where to get ``cal_min`` and ``cal_max`` from:
 
+- ``header``: only from the header of the volume file, if it specifies a valid range
+- ``data``: from the minimum and maximum values of the voxel data
+- ``auto``: from the header if it is valid, otherwise from the voxel data
+"""
 
-def create_sidecar(img: Path, output: Path):
-    cal_min, cal_max = get_range(img)
-    settings = NiivueVolumeSettings(cal_min=cal_min, cal_max=cal_max)
-    output.write_bytes(_SETTINGS_ADAPTER.dump_json(settings))
+_CONFORMED_UINT8_MGZ = ('T1.mgz', 'brainmask.mgz', 'brain.mgz', 'norm.mgz', 'orig.mgz', 'nu.mgz')
+"""
+FreeSurfer outputs which are "conformed" to 8-bit intensities in the range [0, 255].
+"""
 
 
-def get_range(img: Path):
-    vol = nib.load(img)
-    data = vol.get_fdata()
-    cal_min = np.min(data)
-    cal_max = np.max(data)
-    return cal_min, cal_max
+class VolumeHistogram(TypedDict):
+    """
+    Counts of voxel values in equally sized bins.
+    """
+    min: float
+    """
+    Lower edge of the first bin.
+    """
+    max: float
+    """
+    Upper edge of the last bin.
+    """
+    counts: Sequence[int]
+
+
+class LabelStatistics(TypedDict):
+    """
+    Size of a label of a label volume (e.g. segmentation).
+    """
+    voxels: int
+    volume: float
+    """
+    Volume in mm³.
+    """
+
+
+class VolumeSidecar(NiivueVolumeSettings):
+    """
+    Contents of a ``.chrisvisualdataset.volume.json`` file: Niivue settings and statistics about a volume.
+    """
+    histogram: NotRequired[VolumeHistogram]
+    labels: NotRequired[Mapping[str, LabelStatistics]]
+    """
+    Statistics of every label value which is present in a label volume.
+    """
+    previews: NotRequired[Mapping[str, str]]
+    """
+    File names of downsampled copies of the volume (in the same directory as the sidecar), by downsampling factor.
+    """
+    thumbnail: NotRequired[str]
+    """
+    File name of a PNG image of the axial, coronal and sagittal mid-slices of the volume.
+    """
+
+    __pydantic_config__ = ConfigDict(extra='forbid')
+
+
+_SIDECAR_ADAPTER = TypeAdapter(VolumeSidecar)
+
+_Reducer = VolumeStatistics | LabelCounts | PreviewBuilder | ThumbnailBuilder
+
+
+class SidecarOptions(NamedTuple):
+    """
+    Settings for how sidecar files are computed.
+    """
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    range_source: RangeSource = 'data'
+    cal_percentiles: tuple[float, float] = (0.0, 100.0)
+    """
+    Percentiles of voxel values to use for ``cal_min`` and ``cal_max`` when the range comes from the data.
+    """
+    histogram_bins: int = 0
+    """
+    Number of bins of the histogram to include in the sidecar, or 0 for no histogram.
+    """
+    decompression: Backend = 'auto'
+    decompression_threads: int = 0
+    preview_factors: tuple[int, ...] = ()
+    """
+    Downsampling factors of preview volumes to write next to each sidecar.
+    """
+    thumbnails: bool = False
+    """
+    Whether to write a thumbnail image next to each sidecar.
+    """
+
+    def cache_variant(self) -> str:
+        """
+        Identifies how the statistics of a sidecar were computed. Must be changed whenever the
+        output of :func:`compute_settings` changes.
+        """
+        lo, hi = self.cal_percentiles
+        return f'stats.v1:{self.range_source}:{lo:g},{hi:g}:{self.histogram_bins}'
+
+    def needs_distribution(self) -> bool:
+        return self.cal_percentiles != (0.0, 100.0) or self.histogram_bins > 0
+
+    def needs_voxels(self) -> bool:
+        """
+        Whether outputs other than the sidecar's statistics are wanted, so the volume must be read
+        even if its statistics are cached.
+        """
+        return bool(self.preview_factors) or self.thumbnails
+
+
+def create_sidecar(img: Path, output: Path, options: SidecarOptions = SidecarOptions(),
+                   cache: Optional[StatsCache] = None, is_label: bool = False, colormap: Optional[Mapping] = None,
+                   timer: Optional[DecodeTimer] = None) -> VolumeSidecar:
+    """
+    Write the sidecar file ``output`` for the volume ``img``, along with any preview volumes
+    and thumbnail in the same directory.
+
+    :param is_label: whether the volume is a label volume (e.g. segmentation) for which label statistics are wanted
+    :param colormap: NiiVue label colormap used to color the thumbnail of a label volume
+    :param timer: if given, the time spent decoding and reducing the volume's voxels is added to it
+    :return: the contents of the sidecar
+    """
+    settings = None
+    if cache is not None:
+        key = fingerprint(img)
+        variant = _cache_variant(img, options, is_label)
+        settings = cache.get(key, variant)
+    if settings is None or options.needs_voxels():
+        analysis = analyze(img, options, is_label, colormap, timer)
+        if cache is not None and settings is None:
+            cache.put(key, variant, analysis.sidecar)
+        settings = analysis.sidecar
+        if analysis.previews:
+            settings = VolumeSidecar(**settings, previews=_write_previews(output, analysis.previews))
+        if analysis.thumbnail is not None:
+            name = thumbnail_name(output.name.removesuffix(sidecar_name('')))
+            write_png(output.with_name(name), analysis.thumbnail)
+            settings = VolumeSidecar(**settings, thumbnail=name)
+    output.write_bytes(_SIDECAR_ADAPTER.dump_json(settings))
+    return settings
+
+
+def _cache_variant(img: Path, options: SidecarOptions, is_label: bool) -> str:
+    """
+    Variant of the cached statistics of a volume. Besides the options, the statistics depend on the file name,
+    which is not part of the cache key (the file's contents): see :func:`header_range`.
+    """
+    variant = options.cache_variant()
+    if options.range_source != 'data' and img.name in _CONFORMED_UINT8_MGZ:
+        variant += ':conformed'
+    if is_label:
+        variant += ':labels'
+    return variant
+
+
+def sidecar_name(volume_name: str) -> str:
+    return volume_name + '.chrisvisualdataset.volume.json'
+
+
+def preview_name(volume_name: str, factor: int) -> str:
+    return f'{volume_name}.chrisvisualdataset.preview-{factor}x.nii.gz'
+
+
+def thumbnail_name(volume_name: str) -> str:
+    return volume_name + '.chrisvisualdataset.thumbnail.png'
+
+
+def _write_previews(sidecar: Path, previews: Mapping[int, SpatialImage]) -> dict[str, str]:
+    volume_name = sidecar.name.removesuffix(sidecar_name(''))
+    names = {}
+    for factor, preview in previews.items():
+        name = preview_name(volume_name, factor)
+        nib.save(preview, sidecar.with_name(name))
+        names[str(factor)] = name
+    return names
+
+
+class VolumeAnalysis(NamedTuple):
+    sidecar: VolumeSidecar
+    previews: Mapping[int, SpatialImage]
+    """
+    Downsampled volumes by their downsampling factor.
+    """
+    thumbnail: Optional[np.ndarray] = None
+    """
+    RGB image of the mid-slices of the volume.
+    """
+
+
+def compute_settings(img: Path, options: SidecarOptions = SidecarOptions(), is_label: bool = False) -> VolumeSidecar:
+    """
+    Compute the contents of a sidecar.
+    """
+    return analyze(img, options, is_label).sidecar
+
+
+def analyze(img: Path, options: SidecarOptions = SidecarOptions(), is_label: bool = False,
+            colormap: Optional[Mapping] = None, timer: Optional[DecodeTimer] = None) -> VolumeAnalysis:
+    """
+    Compute the statistics, previews and thumbnail of a volume. Everything is computed from a single pass
+    over the volume.
+    """
+    vol = volume_reader.load(img, options.decompression)
+    sidecar = VolumeSidecar()
+    cal_range = None
+    if options.range_source != 'data':
+        cal_range = header_range(vol, img)
+    range_from_data = cal_range is None and options.range_source != 'header'
+
+    stats = None
+    if range_from_data or options.histogram_bins > 0:
+        stats = VolumeStatistics(native_dtype(vol), options.needs_distribution())
+    labels = LabelCounts() if is_label else None
+    previews = [PreviewBuilder(vol, factor, is_label) for factor in options.preview_factors]
+    thumbnail = ThumbnailBuilder(vol) if options.thumbnails else None
+    _reduce(vol, options, (stats, labels, thumbnail, *previews), timer)
+
+    if range_from_data and stats.count > 0:
+        cal_range = _scaled_quantiles(vol, stats, options.cal_percentiles)
+    if cal_range is not None:
+        sidecar['cal_min'], sidecar['cal_max'] = cal_range
+    if options.histogram_bins > 0 and stats.count > 0:
+        sidecar['histogram'] = _scaled_histogram(vol, stats, options.histogram_bins)
+    if labels is not None and (label_stats := _label_statistics(vol, labels)) is not None:
+        sidecar['labels'] = label_stats
+    return VolumeAnalysis(
+        sidecar,
+        {p.factor: p.result() for p in previews},
+        None if thumbnail is None else thumbnail.result(cal_range, colormap if is_label else None)
+    )
+
+
+_TEMPORARY_BYTES_PER_VOXEL = 24
+"""
+Memory used by the reducers for temporary arrays (masks, float64 copies, ...) per voxel of a slab.
+"""
+
+_FIXED_BYTES = 1024 * 1024
+"""
+Memory used by the reducers regardless of the size of the volume, e.g. exact counts of 16-bit values.
+"""
+
+
+def memory_footprint(vol: SpatialImage, options: SidecarOptions = SidecarOptions()) -> int:
+    """
+    Estimate, from its header, the peak memory used by :func:`analyze` for a volume: the slab being decoded
+    and reduced, the whole voxel data if it is not streamable, previews and thumbnail.
+    The estimate errs on the side of overestimating.
+    """
+    x, y, planes = volume_reader.plane_shape(vol.shape)
+    itemsize = native_dtype(vol).itemsize
+    plane_bytes = max(x * y * itemsize, 1)
+    slab_voxels = x * y * min(max(options.chunk_size // plane_bytes, 1), planes)
+    footprint = _FIXED_BYTES + slab_voxels * (itemsize + _TEMPORARY_BYTES_PER_VOXEL)
+    if not volume_reader.is_streamable(vol):
+        footprint += x * y * planes * itemsize
+    depth = volume_reader.plane_shape(tuple(vol.shape)[:3])[2]
+    footprint += sum(x * y * depth // f ** 3 * 4 for f in options.preview_factors)
+    if options.thumbnails:
+        footprint += (x * y + x * depth + y * depth) * 8
+    return footprint
+
+
+def chunk_size_within(vol: SpatialImage, options: SidecarOptions, budget: int) -> int:
+    """
+    :return: the largest chunk size, at most ``options.chunk_size``, with which the :func:`memory_footprint`
+             of a volume is within ``budget``, or the size of one plane if there is none
+    """
+    x, y, _ = volume_reader.plane_shape(vol.shape)
+    plane_bytes = x * y * native_dtype(vol).itemsize
+    chunk_size = options.chunk_size
+    while chunk_size > plane_bytes and memory_footprint(vol, options._replace(chunk_size=chunk_size)) > budget:
+        chunk_size //= 2
+    return max(chunk_size, plane_bytes)
+
+
+def fit_memory_budget(img: Path, options: SidecarOptions, budget: int) -> tuple[SidecarOptions, int]:
+    """
+    Estimate the peak memory needed to create the sidecar of a volume, from its header.
+
+    :return: ``options``, with a smaller ``chunk_size`` if the volume would not fit in ``budget``
+             otherwise, and the :func:`memory_footprint` of the volume with those options
+    """
+    vol = volume_reader.load(img, options.decompression)
+    memory = memory_footprint(vol, options)
+    if memory > budget:
+        options = options._replace(chunk_size=chunk_size_within(vol, options, budget))
+        memory = memory_footprint(vol, options)
+    return options, memory
+
+
+def header_range(vol: SpatialImage, img: Path) -> Optional[tuple[float, float]]:
+    """
+    Get the display range of a volume from its header, without reading its voxel data.
+
+    - NIfTI: ``cal_min`` and ``cal_max``, else ``glmin`` and ``glmax``
+    - MGZ: the range of uint8 for FreeSurfer's conformed volumes, e.g. ``T1.mgz``
+
+    :return: the range, or None if the header does not specify a valid range
+    """
+    header = vol.header
+    if isinstance(header, Nifti1Header):
+        cal_range = float(header['cal_min']), float(header['cal_max'])
+        if _is_valid_range(cal_range):
+            return cal_range
+        slope, inter = scaling(vol)
+        gl_range = sorted((float(header['glmin']) * slope + inter, float(header['glmax']) * slope + inter))
+        if _is_valid_range(gl_range):
+            return gl_range[0], gl_range[1]
+    if isinstance(header, MGHHeader) and img.name in _CONFORMED_UINT8_MGZ and header.get_data_dtype() == np.uint8:
+        return 0.0, 255.0
+    return None
+
+
+def _is_valid_range(r: tuple[float, float] | list[float]) -> bool:
+    lo, hi = r
+    return bool(np.isfinite(lo) and np.isfinite(hi) and lo < hi)
+
+
+def get_range(img: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[float, float]:
+    """
+    Compute the minimum and maximum (scaled) value of a volume.
+
+    The volume is reduced slab-by-slab in the file's own dtype, so memory use is bounded
+    by ``chunk_size`` instead of by the size of the volume. Non-finite values are ignored.
+
+    :return: the range, or ``(nan, nan)`` if the volume has no finite values
+    """
+    vol = volume_reader.load(img)
+    stats = compute_statistics(vol, SidecarOptions(chunk_size=chunk_size), distribution=False)
+    if stats.count == 0:
+        return math.nan, math.nan
+    return _scaled_quantiles(vol, stats, (0.0, 100.0))
+
+
+def compute_statistics(vol: SpatialImage, options: SidecarOptions, distribution: bool) -> VolumeStatistics:
+    """
+    Compute the (unscaled) statistics of a volume's voxel values in one pass.
+    """
+    stats = VolumeStatistics(native_dtype(vol), distribution)
+    _reduce(vol, options, (stats,))
+    return stats
+
+
+def _reduce(vol: SpatialImage, options: SidecarOptions, reducers: Iterable[Optional[_Reducer]],
+            timer: Optional[DecodeTimer] = None):
+    """
+    Feed every slab of the volume to every reducer, decoding the volume only once (or not at all, if there
+    are no reducers).
+    """
+    reducers = [r for r in reducers if r is not None]
+    if not reducers:
+        return
+    slabs = iter_slabs(vol, options.chunk_size, options.decompression, options.decompression_threads)
+    if timer is not None:
+        slabs = _timed_slabs(slabs, timer)
+    for slab in slabs:
+        for reducer in reducers:
+            reducer.update(slab)
+
+
+def _timed_slabs(slabs: Iterator[np.ndarray], timer: DecodeTimer) -> Iterator[np.ndarray]:
+    """
+    Wrap :func:`iter_slabs` to measure the time spent decoding each slab, and the time spent by the reducers
+    on it (i.e. until the next slab is asked for).
+    """
+    start = time.perf_counter()
+    for slab in slabs:
+        decoded = time.perf_counter()
+        timer.decode += decoded - start
+        timer.voxels += slab.size
+        yield slab
+        start = time.perf_counter()
+        timer.reduce += start - decoded
+    timer.decode += time.perf_counter() - start
+
+
+def _scaled_quantiles(vol: SpatialImage, stats: VolumeStatistics, percentiles: tuple[float, float]
+                      ) -> tuple[float, float]:
+    slope, inter = scaling(vol)
+    lo, hi = percentiles[0] / 100, percentiles[1] / 100
+    if slope < 0:
+        lo, hi = 1 - hi, 1 - lo
+    scaled = (stats.quantile(lo) * slope + inter, stats.quantile(hi) * slope + inter)
+    return min(scaled), max(scaled)
+
+
+def _scaled_histogram(vol: SpatialImage, stats: VolumeStatistics, bins: int) -> VolumeHistogram:
+    slope, inter = scaling(vol)
+    lo, hi, counts = stats.histogram(bins)
+    if slope < 0:
+        lo, hi, counts = hi, lo, counts[::-1]
+    return VolumeHistogram(min=lo * slope + inter, max=hi * slope + inter, counts=counts)
+
+
+def _label_statistics(vol: SpatialImage, labels: LabelCounts) -> Optional[dict[str, LabelStatistics]]:
+    """
+    :return: statistics of each (scaled) label value, or None if the volume's values are not integers.
+    """
+    if not labels.integral:
+        return None
+    slope, inter = scaling(vol)
+    voxel_volume = float(np.prod(vol.header.get_zooms()[:3]))
+    stats = {}
+    for label, count in sorted(labels.counts.items()):
+        value = label * slope + inter
+        if value != int(value):
+            return None
+        stats[str(int(value))] = LabelStatistics(voxels=count, volume=count * voxel_volume)
+    return stats
@@ -1,2 +1,21 @@
-from visualdataset.wellknown.freesurfer import FREESURFER_MATCHERS, FREESURFER_OPTIONS
-from visualdataset.wellknown.malpem import MALPEM_MATCHERS, MALPEM_OPTIONS
+"""
+Matchers and options for the outputs of well known programs.
+
+The presets are only built when one of them is used, because building them imports pydantic.
+"""
+
+_PRESETS = {
+    'FREESURFER_MATCHERS': 'freesurfer',
+    'FREESURFER_OPTIONS': 'freesurfer',
+    'MALPEM_MATCHERS': 'malpem',
+    'MALPEM_OPTIONS': 'malpem',
+}
+
+__all__ = list(_PRESETS)
+
+
+def __getattr__(name: str):
+    if name not in _PRESETS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    return getattr(importlib.import_module(f'{__name__}.{_PRESETS[name]}'), name)